@@ -11,13 +11,12 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, ConfigDict
 from sqlalchemy import func, and_, or_, cast
 from sqlalchemy.types import Date
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from starlette.concurrency import run_in_threadpool
-from tinkoff.invest import Client
 
-from app.backend.core.auth import get_staff_user, create_access_token, create_impersonation_token
+from app.backend.core.auth import get_staff_user, create_access_token, create_impersonation_token, invalidate_principal_sync
 from app.backend.core.config import get_settings
-from app.backend.core.security import decrypt_token, decrypt_amount
+from app.backend.core.security import decrypt_token
 from app.backend.core.constants import (
     TRANSACTION_TYPE_INCOME,
     TRANSACTION_TYPE_EXPENSE,
@@ -28,7 +27,9 @@ from app.backend.core.constants import (
     HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
 )
-from app.backend.db.session import get_db
+from app.backend.db.async_session import async_engine, get_async_db
+from app.backend.db.pool_stats import pool_status
+from app.backend.db.session import engine, get_db
 from app.backend.models.user import User
 from app.backend.models.portfolio import Portfolio, Position
 from app.backend.models.instrument import Instrument
@@ -41,8 +42,12 @@ from app.backend.models.budget import (
 )
 from app.backend.models.whiteboard import Whiteboard
 from app.backend.models.admin import AdminAuditLog, AdminCategoryTemplate, AdminObligationTemplate
-from app.backend.services.admin_audit import log_admin_action
+from app.backend.services.admin_audit import log_admin_action, log_admin_action_async
+from app.backend.services.budget_aggregator import BudgetAggregator
+from app.backend.services.budget_amounts import tx_amount_map
+from app.backend.services.budget_cache import bump_budget_version_sync
 from app.backend.services.budget_excel import build_budget_excel_bytes
+from app.backend.services.tinkoff_scheduler import tinkoff_scheduler
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 settings = get_settings()
@@ -50,10 +55,9 @@ settings = get_settings()
 
 # ===== Helpers =====
 
-def _tx_amount(tx: BudgetTransaction) -> float:
-    if tx.amount_encrypted:
-        return float(decrypt_amount(tx.amount_encrypted))
-    return float(tx.amount or 0)
+def _tx_amounts(txs: list[BudgetTransaction]) -> dict[int, float]:
+    """Суммы транзакций (id -> float), расшифрованные одной пачкой."""
+    return {tx_id: float(amount) for tx_id, amount in tx_amount_map(txs).items()}
 
 
 def _month_range(year: int, month: int) -> tuple[date, date]:
@@ -420,20 +424,18 @@ def tinkoff_status(
 async def tinkoff_check_user(
     user_id: int,
     admin: User = Depends(get_staff_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    u = _user_or_404(db, user_id)
+    u = await db.get(User, user_id)
+    if not u:
+        raise HTTPException(HTTP_404_NOT_FOUND, ERROR_USER_NOT_FOUND)
     if not u.has_tinkoff_token:
         return TinkoffStatusItem(user_id=u.id, email=u.email, has_token=False, status="no_token")
 
     token = decrypt_token(u.tinkoff_token_enc or "")
     try:
-        def _check():
-            with Client(token) as client:
-                client.users.get_accounts()
-
-        await run_in_threadpool(_check)
-        log_admin_action(db, admin, "tinkoff_check", u.id, {"status": "ok"})
+        await tinkoff_scheduler.call(token, "users", lambda c: c.users.get_accounts())
+        await log_admin_action_async(db, admin, "tinkoff_check", u.id, {"status": "ok"})
         return TinkoffStatusItem(
             user_id=u.id,
             email=u.email,
@@ -443,7 +445,7 @@ async def tinkoff_check_user(
             checked_at=datetime.now(timezone.utc),
         )
     except Exception as e:
-        log_admin_action(db, admin, "tinkoff_check", u.id, {"status": "error", "error": str(e)})
+        await log_admin_action_async(db, admin, "tinkoff_check", u.id, {"status": "error", "error": str(e)})
         return TinkoffStatusItem(
             user_id=u.id,
             email=u.email,
@@ -577,38 +579,28 @@ def budget_dashboard(
     total_income = 0.0
     total_expense = 0.0
 
+    # Все пользователи — одним проходом: справочники и транзакции грузятся по разу
+    user_ids = [u.id for u in users]
+    aggregator = BudgetAggregator.for_users(db, user_ids)
+    aggregates = aggregator.load_users(db, user_ids, d1, d2)
+    limited_by_user: dict[int, list[BudgetCategory]] = {}
+    for cat in aggregator.categories.values():
+        if cat.kind == "expense" and cat.monthly_limit is not None:
+            limited_by_user.setdefault(cat.user_id, []).append(cat)
+
     for u in users:
-        txs = (
-            db.query(BudgetTransaction, BudgetCategory)
-            .outerjoin(BudgetCategory, BudgetCategory.id == BudgetTransaction.category_id)
-            .filter(
-                BudgetTransaction.user_id == u.id,
-                cast(BudgetTransaction.occurred_at, Date) >= d1,
-                cast(BudgetTransaction.occurred_at, Date) <= d2,
-            )
-            .all()
-        )
-        income = 0.0
-        expense = 0.0
+        agg = aggregates[u.id]
+        income = float(agg.income)
+        expense = float(agg.expense)
         cat_expense: dict[str, float] = {}
-        for tx, cat in txs:
-            amt = _tx_amount(tx)
-            if tx.type == TRANSACTION_TYPE_INCOME:
-                income += amt
-            elif tx.type == TRANSACTION_TYPE_EXPENSE:
-                expense += amt
-                cname = cat.name if cat else "Без категории"
-                cat_expense[cname] = cat_expense.get(cname, 0) + amt
+        for category_id, amount in agg.expense_by_category.items():
+            cname = aggregator.category_name(category_id, "Без категории")
+            cat_expense[cname] = cat_expense.get(cname, 0) + float(amount)
 
         top_cat = max(cat_expense, key=cat_expense.get) if cat_expense else None
 
         over_limit = 0
-        categories = db.query(BudgetCategory).filter(
-            BudgetCategory.user_id == u.id,
-            BudgetCategory.kind == "expense",
-            BudgetCategory.monthly_limit.isnot(None),
-        ).all()
-        for cat in categories:
+        for cat in limited_by_user.get(u.id, []):
             spent = cat_expense.get(cat.name, 0)
             if cat.monthly_limit and spent > float(cat.monthly_limit):
                 over_limit += 1
@@ -661,8 +653,9 @@ def budget_anomalies(
             if has_cats:
                 anomalies.append(BudgetAnomaly(user_id=u.id, email=u.email, kind="no_activity", message="Нет транзакций в текущем месяце"))
 
+        amounts = _tx_amounts(txs)
         for tx in txs:
-            amt = _tx_amount(tx)
+            amt = amounts[tx.id]
             if tx.type == TRANSACTION_TYPE_EXPENSE and amt >= threshold:
                 anomalies.append(
                     BudgetAnomaly(
@@ -672,14 +665,14 @@ def budget_anomalies(
                     )
                 )
 
-        cur_exp = sum(_tx_amount(t) for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
+        cur_exp = sum(amounts[t.id] for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
         prev_txs = db.query(BudgetTransaction).filter(
             BudgetTransaction.user_id == u.id,
             cast(BudgetTransaction.occurred_at, Date) >= pd1,
             cast(BudgetTransaction.occurred_at, Date) <= pd2,
             BudgetTransaction.type == TRANSACTION_TYPE_EXPENSE,
         ).all()
-        prev_exp = sum(_tx_amount(t) for t in prev_txs)
+        prev_exp = sum(_tx_amounts(prev_txs).values())
         if prev_exp > 0 and cur_exp > prev_exp * 1.5:
             anomalies.append(
                 BudgetAnomaly(
@@ -771,6 +764,7 @@ def apply_category_templates_to_user(
         ))
         created += 1
     db.commit()
+    bump_budget_version_sync(u.id)
     log_admin_action(db, admin, "apply_category_templates", u.id, {"created": created})
     return {"created": created}
 
@@ -808,13 +802,14 @@ def admin_list_transactions(
         query = query.filter(cast(BudgetTransaction.occurred_at, Date) <= date.fromisoformat(to_date))
 
     rows = query.order_by(BudgetTransaction.occurred_at.desc()).limit(limit).all()
+    amounts = _tx_amounts([tx for tx, _, _ in rows])
     return [
         AdminTransactionOut(
             id=tx.id,
             user_id=user.id,
             email=user.email,
             type=tx.type,
-            amount=_tx_amount(tx),
+            amount=amounts[tx.id],
             currency=tx.currency,
             occurred_at=tx.occurred_at,
             category_name=cat.name if cat else None,
@@ -845,8 +840,9 @@ def budget_compare(
             cast(BudgetTransaction.occurred_at, Date) >= d1,
             cast(BudgetTransaction.occurred_at, Date) <= d2,
         ).all()
-        income = sum(_tx_amount(t) for t in txs if t.type == TRANSACTION_TYPE_INCOME)
-        expense = sum(_tx_amount(t) for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
+        amounts = _tx_amounts(txs)
+        income = sum(amounts[t.id] for t in txs if t.type == TRANSACTION_TYPE_INCOME)
+        expense = sum(amounts[t.id] for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
         return {
             "user_id": uid,
             "email": u.email,
@@ -890,8 +886,9 @@ def month_status(
             cast(BudgetTransaction.occurred_at, Date) >= d1,
             cast(BudgetTransaction.occurred_at, Date) <= d2,
         ).all()
-        income = sum(_tx_amount(t) for t in txs if t.type == TRANSACTION_TYPE_INCOME)
-        expense = sum(_tx_amount(t) for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
+        amounts = _tx_amounts(txs)
+        income = sum(amounts[t.id] for t in txs if t.type == TRANSACTION_TYPE_INCOME)
+        expense = sum(amounts[t.id] for t in txs if t.type == TRANSACTION_TYPE_EXPENSE)
         out.append(
             MonthStatusItem(
                 user_id=u.id,
@@ -1118,6 +1115,7 @@ def admin_delete_obligation_block(
     title = block.title or ""
     db.delete(block)
     db.commit()
+    bump_budget_version_sync(user_id)
     log_admin_action(db, admin, "delete_obligation_block", user_id, {"block_id": block_id, "title": title})
     return {"status": "ok"}
 
@@ -1135,6 +1133,7 @@ def admin_delete_simple_obligation(
     title = row.title or ""
     db.delete(row)
     db.commit()
+    bump_budget_version_sync(user_id)
     log_admin_action(db, admin, "delete_simple_obligation", user_id, {"obligation_id": obligation_id, "title": title})
     return {"status": "ok"}
 
@@ -1152,6 +1151,7 @@ def apply_obligation_template(
     u = _user_or_404(db, user_id)
     block_id, created = _apply_obligation_template_to_user(db, t, u.id)
     db.commit()
+    bump_budget_version_sync(u.id)
     if created:
         log_admin_action(db, admin, "apply_obligation_template", u.id, {"template_id": template_id, "block_id": block_id})
     return {"block_id": block_id, "created": created}
@@ -1174,6 +1174,7 @@ def apply_all_obligation_templates_to_user(
         else:
             reused += 1
     db.commit()
+    bump_budget_version_sync(u.id)
     log_admin_action(db, admin, "apply_all_obligation_templates", u.id, {"created": created, "reused": reused})
     return {"created": created, "reused": reused}
 
@@ -1264,6 +1265,7 @@ def delete_user(
 
     db.delete(target)
     db.commit()
+    invalidate_principal_sync(deleted_id)
 
     return DeleteUserOut(
         success=True,
@@ -1301,6 +1303,18 @@ def audit_log(
     ]
 
 
+@router.get("/system/db-pool")
+def db_pool_status(admin: User = Depends(get_staff_user)) -> dict[str, Any]:
+    """Состояние пулов соединений этого воркера (sync и async) и счётчики ожидания checkout."""
+    return {"sync": pool_status(engine.pool), "async": pool_status(async_engine.sync_engine.pool)}
+
+
+@router.get("/system/tinkoff-scheduler")
+def tinkoff_scheduler_status(admin: User = Depends(get_staff_user)) -> dict[str, Any]:
+    """Очереди квот Tinkoff этого воркера, длительность вызовов, склейка цен, предохранители."""
+    return tinkoff_scheduler.snapshot()
+
+
 @router.post("/users/bulk-export")
 def bulk_export_users(
     payload: BulkExportIn,
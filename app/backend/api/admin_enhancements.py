@@ -8,10 +8,10 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy import cast, func, or_
+from sqlalchemy import cast, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.types import Date
 from sqlalchemy.orm import Session
-from starlette.concurrency import run_in_threadpool
 
 from app.backend.core.auth import get_staff_user
 from app.backend.core.config import get_settings
@@ -22,6 +22,7 @@ from app.backend.core.constants import (
     TRANSACTION_TYPE_INCOME,
 )
 from app.backend.core.security import decrypt_token
+from app.backend.db.async_session import get_async_db
 from app.backend.db.session import get_db
 from app.backend.models.user import User
 from app.backend.models.portfolio import Portfolio, Position
@@ -29,18 +30,15 @@ from app.backend.models.instrument import Instrument
 from app.backend.models.budget import BudgetTransaction, BudgetCategory, BudgetObligation, ObligationBlock, ObligationPayment
 from app.backend.models.admin import AdminObligationRiskDismissal
 from app.backend.models.whiteboard import Whiteboard
-from app.backend.routes.market import _get_last_prices_blocking, settings as market_settings
+from app.backend.routes.market import _get_last_prices, settings as market_settings
 from app.backend.services.admin_audit import log_admin_action
+from app.backend.services.budget_amounts import tx_amount_map
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
-def _tx_amount(tx: BudgetTransaction) -> float:
-    from app.backend.core.security import decrypt_amount
-
-    if tx.amount_encrypted:
-        return float(decrypt_amount(tx.amount_encrypted))
-    return float(tx.amount or 0)
+def _tx_amounts(txs: list[BudgetTransaction]) -> dict[int, float]:
+    return {tx_id: float(amount) for tx_id, amount in tx_amount_map(txs).items()}
 
 
 def _month_range(year: int, month: int) -> tuple[date, date]:
@@ -59,16 +57,14 @@ def _user_or_404(db: Session, user_id: int) -> User:
     return u
 
 
-def _resolve_tinkoff_token(db: Session) -> str | None:
+async def _resolve_tinkoff_token(db: AsyncSession) -> str | None:
     token = market_settings.TINKOFF_TOKEN
     if token:
         return token
-    admin_user = db.query(User).filter(User.tinkoff_token_enc.isnot(None)).first()
-    if admin_user:
-        token = decrypt_token(admin_user.tinkoff_token_enc or "")
-        if token:
-            return token
-    return None
+    token_enc = (
+        await db.scalars(select(User.tinkoff_token_enc).where(User.tinkoff_token_enc.isnot(None)).limit(1))
+    ).first()
+    return decrypt_token(token_enc or "") or None
 
 
 # ── Users ──
@@ -157,12 +153,13 @@ def budget_over_limits(
             .all()
         )
         spent_by_cat: dict[int, tuple[str, float]] = {}
+        amounts = _tx_amounts([tx for tx, _ in txs])
         for tx, cat in txs:
             if not cat:
                 continue
             cid = cat.id
             name = cat.name
-            spent_by_cat[cid] = (name, spent_by_cat.get(cid, (name, 0))[1] + _tx_amount(tx))
+            spent_by_cat[cid] = (name, spent_by_cat.get(cid, (name, 0))[1] + amounts[tx.id])
 
         categories = db.query(BudgetCategory).filter(
             BudgetCategory.user_id == u.id,
@@ -472,44 +469,41 @@ class InvestmentAlert(BaseModel):
 @router.get("/investments/market-overview", response_model=PortfolioMarketOut)
 async def investments_market_overview(
     admin: User = Depends(get_staff_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    token = _resolve_tinkoff_token(db)
+    token = await _resolve_tinkoff_token(db)
     figi_prices: dict[str, float] = {}
 
+    positions_by_user: dict[int, list[Position]] = {}
+    for user_id, pos in (
+        await db.execute(select(Portfolio.user_id, Position).join(Portfolio, Portfolio.id == Position.portfolio_id))
+    ).all():
+        positions_by_user.setdefault(user_id, []).append(pos)
+
     if token:
-        figis = [r[0] for r in db.query(Position.figi).distinct().all() if r[0]]
-        batch_size = 50
-        for i in range(0, len(figis), batch_size):
-            batch = figis[i : i + batch_size]
-            try:
-                prices = await run_in_threadpool(_get_last_prices_blocking, batch, token)
-                figi_prices.update(prices)
-            except Exception:
-                pass
+        figis = sorted({p.figi for ps in positions_by_user.values() for p in ps if p.figi})
+        # разбиение на вызовы и квоты токена — на стороне планировщика
+        try:
+            figi_prices.update(await _get_last_prices(figis, token))
+        except Exception:
+            pass
 
     rows: List[PortfolioMarketRow] = []
-    users = db.query(User).all()
+    users = (await db.scalars(select(User))).all()
     for u in users:
-        pf_ids = [p.id for p in db.query(Portfolio).filter(Portfolio.user_id == u.id).all()]
+        positions = positions_by_user.get(u.id, [])
         avg_value = 0.0
         market_value = 0.0
-        pos_count = 0
         has_prices = False
-        if pf_ids:
-            positions = db.query(Position).filter(Position.portfolio_id.in_(pf_ids)).all()
-            pos_count = len(positions)
-            for pos in positions:
-                qty = float(pos.quantity or 0)
-                avg = float(pos.avg_price or 0)
-                avg_value += qty * avg
-                if pos.figi and pos.figi in figi_prices:
-                    market_value += qty * figi_prices[pos.figi]
-                    has_prices = True
-                elif token and pos.figi:
-                    market_value += qty * avg
-                else:
-                    market_value += qty * avg
+        for pos in positions:
+            qty = float(pos.quantity or 0)
+            avg = float(pos.avg_price or 0)
+            avg_value += qty * avg
+            if pos.figi and pos.figi in figi_prices:
+                market_value += qty * figi_prices[pos.figi]
+                has_prices = True
+            else:
+                market_value += qty * avg
 
         delta_pct = None
         mkt = None
@@ -524,7 +518,7 @@ async def investments_market_overview(
                 avg_value=round(avg_value, 2),
                 market_value=mkt,
                 delta_pct=delta_pct,
-                positions_count=pos_count,
+                positions_count=len(positions),
             )
         )
 
@@ -4,6 +4,7 @@ from typing import List, Optional, Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, StringConstraints
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -13,9 +14,11 @@ from app.backend.core.constants import (
     ERROR_ACCOUNT_NOT_FOUND,
     HTTP_404_NOT_FOUND,
 )
-from app.backend.db.session import get_db
+from app.backend.db.session import get_db, with_session
 from app.backend.models.user import User
 from app.backend.models.budget import BudgetAccount
+from app.backend.services.budget_cache import cached_budget_json, invalidate_budget_cache
+from app.backend.services.budget_rollup import detach_contra_account
 
 router = APIRouter(prefix="/budget/accounts", tags=["budget: accounts"])
 
@@ -40,11 +43,8 @@ class AccountPatch(BaseModel):
     is_savings: Optional[bool] = None
 
 
-@router.get("", response_model=List[AccountOut])
-def list_accounts(
-    db: Session = Depends(get_db), user: User = Depends(get_current_user)
-):
-    q = select(BudgetAccount).where(BudgetAccount.user_id == user.id)
+def _list_accounts(db: Session, user_id: int) -> list[dict]:
+    q = select(BudgetAccount).where(BudgetAccount.user_id == user_id)
     rows = db.execute(q.order_by(BudgetAccount.id.asc())).scalars().all()
     return [
         AccountOut(
@@ -53,12 +53,20 @@ def list_accounts(
             currency=r.currency,
             is_savings=r.is_savings,
             created_at=r.created_at.isoformat() if r.created_at else None,
-        )
+        ).model_dump()
         for r in rows
     ]
 
 
-@router.post("", response_model=AccountOut, status_code=201)
+@router.get("", response_model=List[AccountOut])
+async def list_accounts(user: User = Depends(get_current_user)):
+    async def _load():
+        return await run_in_threadpool(with_session, _list_accounts, user.id)
+    data = await cached_budget_json(user.id, "accounts", _load)
+    return [AccountOut(**row) for row in data]
+
+
+@router.post("", response_model=AccountOut, status_code=201, dependencies=[Depends(invalidate_budget_cache)])
 def create_account(
     payload: AccountCreate,
     db: Session = Depends(get_db),
@@ -82,7 +90,7 @@ def create_account(
     )
 
 
-@router.patch("/{account_id}", response_model=AccountOut)
+@router.patch("/{account_id}", response_model=AccountOut, dependencies=[Depends(invalidate_budget_cache)])
 def patch_account(
     account_id: int,
     payload: AccountPatch,
@@ -112,7 +120,7 @@ def patch_account(
     )
 
 
-@router.delete("/{account_id}", status_code=204)
+@router.delete("/{account_id}", status_code=204, dependencies=[Depends(invalidate_budget_cache)])
 def delete_account(
     account_id: int,
     db: Session = Depends(get_db),
@@ -122,6 +130,8 @@ def delete_account(
     if not acc or acc.user_id != user.id:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=ERROR_ACCOUNT_NOT_FOUND)
 
+    # в той же транзакции, что и SET NULL у переводов на этот счёт
+    detach_contra_account(db, user.id, account_id)
     db.delete(acc)
     db.commit()
     return None
@@ -4,6 +4,7 @@ from typing import List, Optional, Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, StringConstraints
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -18,9 +19,10 @@ from app.backend.core.constants import (
     HTTP_404_NOT_FOUND,
     HTTP_409_CONFLICT,
 )
-from app.backend.db.session import get_db
+from app.backend.db.session import get_db, with_session
 from app.backend.models.user import User
 from app.backend.models.budget import BudgetCategory
+from app.backend.services.budget_cache import cached_budget_json, invalidate_budget_cache
 
 router = APIRouter(prefix="/budget/categories", tags=["budget: categories"])
 
@@ -45,13 +47,8 @@ class CategoryUpdate(BaseModel):
     name: Optional[NameStr] = None
     monthly_limit: Optional[float] = None
 
-@router.get("", response_model=List[CategoryOut])
-def list_categories(
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-    only_active: bool = Query(True),
-):
-    q = select(BudgetCategory).where(BudgetCategory.user_id == user.id)
+def _list_categories(db: Session, user_id: int, only_active: bool) -> list[dict]:
+    q = select(BudgetCategory).where(BudgetCategory.user_id == user_id)
     if only_active:
         q = q.where(BudgetCategory.is_active.is_(True))
     rows = db.execute(q.order_by(BudgetCategory.kind, BudgetCategory.name)).scalars().all()
@@ -59,11 +56,22 @@ def list_categories(
         CategoryOut(
             id=r.id, kind=r.kind, name=r.name, parent_id=r.parent_id, is_active=r.is_active,
             monthly_limit=float(r.monthly_limit) if r.monthly_limit is not None else None
-        ) for r in rows
+        ).model_dump() for r in rows
     ]
 
 
-@router.post("", response_model=CategoryOut, status_code=201)
+@router.get("", response_model=List[CategoryOut])
+async def list_categories(
+    user: User = Depends(get_current_user),
+    only_active: bool = Query(True),
+):
+    async def _load():
+        return await run_in_threadpool(with_session, _list_categories, user.id, only_active)
+    data = await cached_budget_json(user.id, f"categories:{int(only_active)}", _load)
+    return [CategoryOut(**row) for row in data]
+
+
+@router.post("", response_model=CategoryOut, status_code=201, dependencies=[Depends(invalidate_budget_cache)])
 def create_category(
     payload: CategoryCreate,
     db: Session = Depends(get_db),
@@ -99,7 +107,7 @@ def create_category(
     )
 
 
-@router.put("/{category_id}", response_model=CategoryOut)
+@router.put("/{category_id}", response_model=CategoryOut, dependencies=[Depends(invalidate_budget_cache)])
 def update_category(
     category_id: int,
     payload: CategoryUpdate,
@@ -123,7 +131,7 @@ def update_category(
     )
 
 
-@router.delete("/{category_id}", status_code=204)
+@router.delete("/{category_id}", status_code=204, dependencies=[Depends(invalidate_budget_cache)])
 def delete_category(
     category_id: int,
     db: Session = Depends(get_db),
@@ -27,6 +27,7 @@ from app.backend.core.constants import (
 )
 from app.backend.models.user import User
 from app.backend.models.budget import ObligationBlock, ObligationPayment
+from app.backend.services.budget_cache import invalidate_budget_cache
 
 router = APIRouter(prefix="/budget/obligation-blocks", tags=["budget:obligation-blocks"])
 
@@ -258,7 +259,7 @@ def list_blocks(db: Session = Depends(get_db), user: User = Depends(get_current_
     )
     return [_block_to_dto(r) for r in rows]
 
-@router.post("", response_model=BlockDTO, status_code=201)
+@router.post("", response_model=BlockDTO, status_code=201, dependencies=[Depends(invalidate_budget_cache)])
 def create_block(payload: BlockDTO, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
     title = (payload.title or "").strip() or DEFAULT_OBLIGATION_TITLE
     block = ObligationBlock(
@@ -335,7 +336,7 @@ def preview_block(payload: BlockDTO, user: User = Depends(get_current_user)):
     data.update(_calc_metrics_exact(fake))
     return BlockDTO(**data)
 
-@router.put("/{block_id}", response_model=BlockDTO)
+@router.put("/{block_id}", response_model=BlockDTO, dependencies=[Depends(invalidate_budget_cache)])
 def save_block(
     block_id: int,
     payload: BlockDTO,
@@ -418,7 +419,7 @@ def save_block(
         error_detail = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=f"Ошибка при сохранении блока: {error_detail}")
 
-@router.delete("/{block_id}")
+@router.delete("/{block_id}", dependencies=[Depends(invalidate_budget_cache)])
 def delete_block(block_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
     block = db.get(ObligationBlock, block_id)
     _ensure_owner(block, user.id)
@@ -18,6 +18,7 @@ from app.backend.core.constants import (
 )
 from app.backend.models.user import User
 from app.backend.models.budget import BudgetObligation
+from app.backend.services.budget_cache import invalidate_budget_cache
 
 router = APIRouter(prefix="/budget/obligations", tags=["budget: obligations"])
 
@@ -75,7 +76,7 @@ def list_obligations(
     return rows
 
 
-@router.post("", response_model=ObligationOut)
+@router.post("", response_model=ObligationOut, dependencies=[Depends(invalidate_budget_cache)])
 def create_obligation(
     payload: ObligationCreateIn,
     db: Session = Depends(get_db),
@@ -94,7 +95,7 @@ def create_obligation(
     return row
 
 
-@router.patch("/{oid}", response_model=ObligationOut)
+@router.patch("/{oid}", response_model=ObligationOut, dependencies=[Depends(invalidate_budget_cache)])
 def update_obligation(
     oid: int,
     payload: ObligationUpdateIn,
@@ -122,7 +123,7 @@ def update_obligation(
     return row
 
 
-@router.delete("/{oid}")
+@router.delete("/{oid}", dependencies=[Depends(invalidate_budget_cache)])
 def delete_obligation(
     oid: int,
     db: Session = Depends(get_db),
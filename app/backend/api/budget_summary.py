@@ -8,26 +8,16 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from sqlalchemy import select, func, case
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm import Session
 
 from app.backend.core.auth import get_current_user
-from app.backend.core.security import decrypt_amount
-from app.backend.core.constants import (
-    MONTH_END_CALC_DAY,
-    MONTH_END_CALC_OFFSET,
-    TRANSACTION_TYPE_INCOME,
-    TRANSACTION_TYPE_EXPENSE,
-    TRANSACTION_TYPE_TRANSFER,
-)
-from app.backend.db.session import get_db
+from app.backend.core.constants import MONTH_END_CALC_DAY, MONTH_END_CALC_OFFSET
+from app.backend.db.session import get_db, with_session
 from app.backend.models.user import User
-from app.backend.models.budget import (
-    BudgetTransaction,
-    BudgetAccount,
-    BudgetCategory,
-)
+from app.backend.services.budget_aggregator import BudgetAggregator, MonthTotals
+from app.backend.services.budget_cache import cached_budget_json
 from app.backend.services.budget_excel import build_budget_excel_bytes
 
 router = APIRouter(prefix="/budget/summary", tags=["budget: summary"])
@@ -88,275 +78,117 @@ def _dates(from_: Optional[str], to: Optional[str]):
     return d1, d2
 
 
-# ===== Routes =====
-
-def _get_decrypted_amount(tx: BudgetTransaction) -> Decimal:
-    """Получить расшифрованную сумму транзакции."""
-    if tx.amount_encrypted:
-        return decrypt_amount(tx.amount_encrypted)
-    else:
-        # Обратная совместимость со старыми записями
-        return tx.amount
-
-
-@router.get("/month", response_model=MonthSummaryOut)
-def month_summary(
-    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    d1, d2 = _dates(date_from, date_to)
+def _slices(by_category: dict[Optional[int], Decimal], aggregator: BudgetAggregator) -> List[tuple[str, Decimal]]:
+    """Суммы по категориям -> [(название, сумма)]; операции без категории не попадают."""
+    out: dict[str, Decimal] = {}
+    for category_id, amount in by_category.items():
+        name = aggregator.category_name(category_id)
+        if name:
+            out[name] = out.get(name, Decimal(0)) + amount
+    return list(out.items())
 
-    # Загружаем транзакции и расшифровываем суммы на уровне приложения
-    income_txs = db.scalars(
-        select(BudgetTransaction)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_INCOME,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    income = sum(_get_decrypted_amount(tx) for tx in income_txs)
-
-    expense_txs = db.scalars(
-        select(BudgetTransaction)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_EXPENSE,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    expense = sum(_get_decrypted_amount(tx) for tx in expense_txs)
-
-    # Переводы на сберегательные счета
-    savings_txs = db.scalars(
-        select(BudgetTransaction)
-        .join(BudgetAccount, BudgetAccount.id == BudgetTransaction.contra_account_id)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_TRANSFER,
-            BudgetAccount.is_savings.is_(True),
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    savings_in = sum(_get_decrypted_amount(tx) for tx in savings_txs)
-
-    # Чистые сбережения (входящие - исходящие)
-    AccFrom = aliased(BudgetAccount)
-    AccTo = aliased(BudgetAccount)
-    all_transfer_txs = db.scalars(
-        select(BudgetTransaction)
-        .join(AccFrom, AccFrom.id == BudgetTransaction.account_id)
-        .join(AccTo, AccTo.id == BudgetTransaction.contra_account_id)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_TRANSFER,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    
-    savings_net = Decimal(0)
-    for tx in all_transfer_txs:
-        amount = _get_decrypted_amount(tx)
-        acc_from = db.get(BudgetAccount, tx.account_id)
-        acc_to = db.get(BudgetAccount, tx.contra_account_id)
-        if acc_to and acc_to.is_savings:
-            savings_net += amount
-        elif acc_from and acc_from.is_savings:
-            savings_net -= amount
-
-    # Доход на накопительный счёт = пополнение, расход с накопительного = снятие
-    for tx in income_txs:
-        acc = db.get(BudgetAccount, tx.account_id)
-        if acc and acc.is_savings:
-            savings_net += _get_decrypted_amount(tx)
-    for tx in expense_txs:
-        acc = db.get(BudgetAccount, tx.account_id)
-        if acc and acc.is_savings:
-            savings_net -= _get_decrypted_amount(tx)
 
+def _month_summary(db: Session, user_id: int, d1: date, d2: date) -> MonthSummaryOut:
+    agg = BudgetAggregator.for_user(db, user_id).load(db, user_id, d1, d2)
     return MonthSummaryOut(
-        income_total=float(income),
-        expense_total=float(expense),
-        net_total=float(income - expense),
-        savings_transferred=float(savings_in),
-        savings=float(savings_net),
+        income_total=float(agg.income),
+        expense_total=float(agg.expense),
+        net_total=float(agg.net),
+        savings_transferred=float(agg.savings_transferred),
+        savings=float(agg.savings_net),
     )
 
 
-@router.get("/charts", response_model=ChartsOut)
-def charts(
-    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    d1, d2 = _dates(date_from, date_to)
-
-    # Загружаем транзакции с категориями и расшифровываем суммы
-    income_txs = db.scalars(
-        select(BudgetTransaction)
-        .join(BudgetCategory, BudgetCategory.id == BudgetTransaction.category_id)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_INCOME,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    
-    income_by_cat: dict[str, Decimal] = {}
-    for tx in income_txs:
-        cat = db.get(BudgetCategory, tx.category_id)
-        if cat:
-            amount = _get_decrypted_amount(tx)
-            income_by_cat[cat.name] = income_by_cat.get(cat.name, Decimal(0)) + amount
-
-    expense_txs = db.scalars(
-        select(BudgetTransaction)
-        .join(BudgetCategory, BudgetCategory.id == BudgetTransaction.category_id)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_EXPENSE,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    
-    expense_by_cat: dict[str, Decimal] = {}
-    for tx in expense_txs:
-        cat = db.get(BudgetCategory, tx.category_id)
-        if cat:
-            amount = _get_decrypted_amount(tx)
-            expense_by_cat[cat.name] = expense_by_cat.get(cat.name, Decimal(0)) + amount
-
-    # Расходы по дням
-    expense_day_txs = db.scalars(
-        select(BudgetTransaction)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.type == TRANSACTION_TYPE_EXPENSE,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-    
-    expense_by_day: dict[date, Decimal] = {}
-    for tx in expense_day_txs:
-        day = tx.occurred_at.date() if hasattr(tx.occurred_at, "date") else tx.occurred_at
-        amount = _get_decrypted_amount(tx)
-        expense_by_day[day] = expense_by_day.get(day, Decimal(0)) + amount
+def _charts(db: Session, user_id: int, d1: date, d2: date) -> ChartsOut:
+    aggregator = BudgetAggregator.for_user(db, user_id)
+    agg = aggregator.load(db, user_id, d1, d2, per_day=True)
 
     return ChartsOut(
-        income_by_category=[{"name": n, "amount": float(v)} for n, v in sorted(income_by_cat.items())],
-        expense_by_category=[{"name": n, "amount": float(v)} for n, v in sorted(expense_by_cat.items())],
-        expense_by_day=[{"name": d.isoformat(), "amount": float(v)} for d, v in sorted(expense_by_day.items())],
+        income_by_category=[{"name": n, "amount": float(v)} for n, v in sorted(_slices(agg.income_by_category, aggregator))],
+        expense_by_category=[{"name": n, "amount": float(v)} for n, v in sorted(_slices(agg.expense_by_category, aggregator))],
+        expense_by_day=[{"name": d.isoformat(), "amount": float(v)} for d, v in sorted(agg.expense_by_day.items())],
     )
 
 
-@router.get("/year", response_model=YearSummaryOut)
-def year_summary(
-    year: int = Query(..., description="Год (например, 2024)"),
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
-    """Годовая статистика: доходы, расходы, категории, данные по месяцам."""
+def _year_summary(db: Session, user_id: int, year: int) -> YearSummaryOut:
     d1 = date(year, 1, 1)
     d2 = date(year, 12, 31)
 
-    # Загружаем все транзакции за год и расшифровываем суммы
-    all_txs = db.scalars(
-        select(BudgetTransaction)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.occurred_at >= d1,
-            BudgetTransaction.occurred_at <= d2,
-        )
-    ).all()
-
-    income = Decimal(0)
-    expense = Decimal(0)
-    savings_in = Decimal(0)
-    savings_net = Decimal(0)
-    income_by_cat: dict[str, Decimal] = {}
-    expense_by_cat: dict[str, Decimal] = {}
-    monthly_data_dict: dict[int, dict[str, Decimal]] = {m: {"income": Decimal(0), "expense": Decimal(0), "savings": Decimal(0)} for m in range(1, 13)}
-
-    for tx in all_txs:
-        amount = _get_decrypted_amount(tx)
-        tx_month = tx.occurred_at.month if hasattr(tx.occurred_at, "month") else (tx.occurred_at.date().month if hasattr(tx.occurred_at, "date") else 1)
-
-        if tx.type == TRANSACTION_TYPE_INCOME:
-            income += amount
-            monthly_data_dict[tx_month]["income"] += amount
-            if tx.category_id:
-                cat = db.get(BudgetCategory, tx.category_id)
-                if cat:
-                    income_by_cat[cat.name] = income_by_cat.get(cat.name, Decimal(0)) + amount
-            acc = db.get(BudgetAccount, tx.account_id) if tx.account_id else None
-            if acc and acc.is_savings:
-                savings_net += amount
-                savings_in += amount
-                monthly_data_dict[tx_month]["savings"] += amount
-
-        elif tx.type == TRANSACTION_TYPE_EXPENSE:
-            expense += amount
-            monthly_data_dict[tx_month]["expense"] += amount
-            if tx.category_id:
-                cat = db.get(BudgetCategory, tx.category_id)
-                if cat:
-                    expense_by_cat[cat.name] = expense_by_cat.get(cat.name, Decimal(0)) + amount
-            acc = db.get(BudgetAccount, tx.account_id) if tx.account_id else None
-            if acc and acc.is_savings:
-                savings_net -= amount
-                monthly_data_dict[tx_month]["savings"] -= amount
-
-        elif tx.type == TRANSACTION_TYPE_TRANSFER:
-            acc_to = db.get(BudgetAccount, tx.contra_account_id) if tx.contra_account_id else None
-            acc_from = db.get(BudgetAccount, tx.account_id) if tx.account_id else None
-            
-            if acc_to and acc_to.is_savings:
-                savings_in += amount
-                savings_net += amount
-                monthly_data_dict[tx_month]["savings"] += amount
-            elif acc_from and acc_from.is_savings:
-                savings_net -= amount
-                monthly_data_dict[tx_month]["savings"] -= amount
+    aggregator = BudgetAggregator.for_user(db, user_id)
+    agg = aggregator.load(db, user_id, d1, d2)
 
     # Формируем данные по месяцам
     monthly_data = []
     for month in range(1, 13):
-        month_data = monthly_data_dict[month]
+        month_data = agg.by_month.get((year, month), MonthTotals())
         monthly_data.append({
             "month": month,
-            "income": float(month_data["income"]),
-            "expense": float(month_data["expense"]),
-            "net": float(month_data["income"] - month_data["expense"]),
-            "savings": float(month_data["savings"]),
+            "income": float(month_data.income),
+            "expense": float(month_data.expense),
+            "net": float(month_data.income - month_data.expense),
+            "savings": float(month_data.savings),
         })
 
     # Сортируем категории по сумме
-    income_by_cat_sorted = sorted(income_by_cat.items(), key=lambda x: x[1], reverse=True)
-    expense_by_cat_sorted = sorted(expense_by_cat.items(), key=lambda x: x[1], reverse=True)
+    income_by_cat_sorted = sorted(_slices(agg.income_by_category, aggregator), key=lambda x: x[1], reverse=True)
+    expense_by_cat_sorted = sorted(_slices(agg.expense_by_category, aggregator), key=lambda x: x[1], reverse=True)
 
     return YearSummaryOut(
         year=year,
-        income_total=float(income),
-        expense_total=float(expense),
-        net_total=float(income - expense),
-        savings_transferred=float(savings_in),
-        savings=float(savings_net),
+        income_total=float(agg.income),
+        expense_total=float(agg.expense),
+        net_total=float(agg.net),
+        # в годовой сводке пополнения сбережений включают доходы на накопительные счета
+        savings_transferred=float(agg.savings_transferred + agg.savings_income),
+        savings=float(agg.savings_net),
         income_by_category=[{"name": n, "amount": float(v)} for (n, v) in income_by_cat_sorted],
         expense_by_category=[{"name": n, "amount": float(v)} for (n, v) in expense_by_cat_sorted],
         monthly_data=monthly_data,
     )
 
 
+# ===== Routes =====
+
+@router.get("/month", response_model=MonthSummaryOut)
+async def month_summary(
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    user: User = Depends(get_current_user),
+):
+    d1, d2 = _dates(date_from, date_to)
+
+    async def _load():
+        return (await run_in_threadpool(with_session, _month_summary, user.id, d1, d2)).model_dump()
+    data = await cached_budget_json(user.id, f"summary:month:{d1}:{d2}", _load)
+    return MonthSummaryOut(**data)
+
+
+@router.get("/charts", response_model=ChartsOut)
+async def charts(
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    user: User = Depends(get_current_user),
+):
+    d1, d2 = _dates(date_from, date_to)
+
+    async def _load():
+        return (await run_in_threadpool(with_session, _charts, user.id, d1, d2)).model_dump()
+    data = await cached_budget_json(user.id, f"summary:charts:{d1}:{d2}", _load)
+    return ChartsOut(**data)
+
+
+@router.get("/year", response_model=YearSummaryOut)
+async def year_summary(
+    year: int = Query(..., description="Год (например, 2024)"),
+    user: User = Depends(get_current_user),
+):
+    """Годовая статистика: доходы, расходы, категории, данные по месяцам."""
+    async def _load():
+        return (await run_in_threadpool(with_session, _year_summary, user.id, year)).model_dump()
+    data = await cached_budget_json(user.id, f"summary:year:{year}", _load)
+    return YearSummaryOut(**data)
+
+
 @router.get("/export/xlsx")
 def export_budget_xlsx(
     date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
@@ -11,7 +11,7 @@ from sqlalchemy.types import Date
 from sqlalchemy.orm import Session
 
 from app.backend.core.auth import get_current_user
-from app.backend.core.security import encrypt_amount, decrypt_amount
+from app.backend.core.security import encrypt_amount_v2
 from app.backend.core.constants import (
     DEFAULT_CURRENCY,
     MONTH_END_CALC_DAY,
@@ -35,6 +35,9 @@ from app.backend.models.budget import (
     BudgetAccount,
     BudgetCategory,
 )
+from app.backend.services.budget_amounts import tx_amount, tx_amount_map
+from app.backend.services.budget_rollup import apply_transaction
+from app.backend.services.budget_cache import invalidate_budget_cache
 
 router = APIRouter(prefix="/budget/transactions", tags=["budget: transactions"])
 
@@ -121,15 +124,10 @@ def list_transactions(
     )
 
     rows = db.execute(q).all()
+    # Расшифровываем суммы одной пачкой (старые записи без шифротекста берут amount)
+    amounts = tx_amount_map(bt for bt, _ in rows)
     out: List[TransactionOut] = []
     for bt, cat in rows:
-        # Расшифровываем сумму (используем зашифрованную, если есть, иначе старую)
-        if bt.amount_encrypted:
-            decrypted_amount = decrypt_amount(bt.amount_encrypted)
-        else:
-            # Обратная совместимость со старыми записями
-            decrypted_amount = bt.amount
-        
         out.append(
             TransactionOut(
                 id=bt.id,
@@ -138,7 +136,7 @@ def list_transactions(
                 contra_account_id=bt.contra_account_id,
                 category_id=bt.category_id,
                 category=(CategoryOut(id=cat.id, name=cat.name) if cat else None),
-                amount=float(decrypted_amount),
+                amount=float(amounts[bt.id]),
                 currency=bt.currency,
                 occurred_at=bt.occurred_at.isoformat() if hasattr(bt.occurred_at, "isoformat") else str(bt.occurred_at),
                 description=bt.description,
@@ -147,7 +145,7 @@ def list_transactions(
     return out
 
 
-@router.post("", response_model=TransactionOut, status_code=201)
+@router.post("", response_model=TransactionOut, status_code=201, dependencies=[Depends(invalidate_budget_cache)])
 def create_transaction(
     payload: TransactionCreate,
     db: Session = Depends(get_db),
@@ -180,12 +178,13 @@ def create_transaction(
             contra_account_id=acc_to.id,
             category_id=None,
             amount=payload.amount,  # Оставляем для обратной совместимости
-            amount_encrypted=encrypt_amount(payload.amount),  # Шифруем сумму
+            amount_encrypted_v2=encrypt_amount_v2(payload.amount),  # Шифруем сумму (формат v2)
             currency=payload.currency,
             occurred_at=payload.occurred_at or date.today(),
             description=payload.description or None,
         )
         db.add(tx)
+        apply_transaction(db, tx, payload.amount)
         db.commit()
         db.refresh(tx)
 
@@ -207,12 +206,13 @@ def create_transaction(
             contra_account_id=None,
             category_id=category.id,
             amount=payload.amount,  # Оставляем для обратной совместимости
-            amount_encrypted=encrypt_amount(payload.amount),  # Шифруем сумму
+            amount_encrypted_v2=encrypt_amount_v2(payload.amount),  # Шифруем сумму (формат v2)
             currency=payload.currency,
             occurred_at=payload.occurred_at or date.today(),
             description=payload.description or None,
         )
         db.add(tx)
+        apply_transaction(db, tx, payload.amount)
         db.commit()
         db.refresh(tx)
 
@@ -226,12 +226,8 @@ def create_transaction(
             cat = CategoryOut(id=c.id, name=c.name)
 
     # Расшифровываем сумму (используем зашифрованную, если есть, иначе старую)
-    if tx.amount_encrypted:
-        decrypted_amount = decrypt_amount(tx.amount_encrypted)
-    else:
-        # Обратная совместимость со старыми записями
-        decrypted_amount = tx.amount
-    
+    decrypted_amount = tx_amount(tx)
+
     return TransactionOut(
         id=tx.id,
         type=tx.type,
@@ -246,7 +242,7 @@ def create_transaction(
     )
 
 
-@router.delete("/{transaction_id}")
+@router.delete("/{transaction_id}", dependencies=[Depends(invalidate_budget_cache)])
 def delete_transaction(
     transaction_id: int,
     db: Session = Depends(get_db),
@@ -257,6 +253,7 @@ def delete_transaction(
     if not tx or tx.user_id != user.id:
         raise HTTPException(HTTP_404_NOT_FOUND, detail=ERROR_TRANSACTION_NOT_FOUND)
     
+    apply_transaction(db, tx, tx_amount(tx), sign=-1)
     db.delete(tx)
     db.commit()
     return {"status": "ok"}
\ No newline at end of file
@@ -1,21 +1,19 @@
 from __future__ import annotations
 
-from datetime import date, datetime, timedelta, time
-from decimal import Decimal
+from datetime import date
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import select, func, and_, or_
 from sqlalchemy.orm import Session
 
 from app.backend.core.auth import get_current_user
-from app.backend.core.security import decrypt_amount
-from app.backend.core.constants import TRANSACTION_TYPE_INCOME, TRANSACTION_TYPE_EXPENSE
-from app.backend.db.session import get_db
+from app.backend.core.constants import TRANSACTION_TYPE_EXPENSE
+from app.backend.db.session import with_session
 from app.backend.models.user import User
 from app.backend.models.budget import (
-    BudgetTransaction,
     BudgetCategory,
     ObligationBlock,
     ObligationPayment,
@@ -26,6 +24,8 @@ from app.backend.api.budget_obligation_blocks import (
     resolve_next_payment_date,
     resolve_next_payment_amount,
 )
+from app.backend.services.budget_aggregator import BudgetAggregator
+from app.backend.services.budget_cache import cached_budget_json
 from app.backend.api.monthly_review_utils import (
     month_bounds,
     resolve_review_month,
@@ -86,52 +86,20 @@ class MonthlyReviewOut(BaseModel):
     obligations: ObligationReview
 
 
-def _get_decrypted_amount(tx: BudgetTransaction) -> Decimal:
-    if tx.amount_encrypted:
-        return decrypt_amount(tx.amount_encrypted)
-    return tx.amount
-
-
-@router.get("", response_model=MonthlyReviewOut)
-def get_monthly_review(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    year: Optional[int] = Query(None, description="Год обзора (например 2026)"),
-    month: Optional[int] = Query(None, ge=1, le=12, description="Месяц обзора (1–12)"),
-):
-    today = date.today()
-
-    review_month = resolve_review_month(today, year, month)
+def _monthly_review(db: Session, user_id: int, today: date, review_month: date) -> MonthlyReviewOut:
     month_start, month_end = month_bounds(review_month)
     
-    month_start_dt = datetime.combine(month_start, time.min)
-    month_end_dt = datetime.combine(month_end, time.max)
-    
-    transactions = db.execute(
-        select(BudgetTransaction)
-        .where(
-            BudgetTransaction.user_id == user.id,
-            BudgetTransaction.occurred_at >= month_start_dt,
-            BudgetTransaction.occurred_at <= month_end_dt,
-        )
-    ).scalars().all()
-    
-    income_total = sum(
-        float(_get_decrypted_amount(tx)) for tx in transactions
-        if tx.type == TRANSACTION_TYPE_INCOME
-    )
-    
-    expense_total = sum(
-        float(_get_decrypted_amount(tx)) for tx in transactions
-        if tx.type == TRANSACTION_TYPE_EXPENSE
-    )
-    
+    # Месяц обзора выровнен по границам — суммы берутся из помесячных агрегатов
+    agg = BudgetAggregator.for_user(db, user_id).load(db, user_id, month_start, month_end)
+    income_total = float(agg.income)
+    expense_total = float(agg.expense)
+
     net_result = income_total - expense_total
     
     categories_with_limits = db.execute(
         select(BudgetCategory)
         .where(
-            BudgetCategory.user_id == user.id,
+            BudgetCategory.user_id == user_id,
             BudgetCategory.kind == TRANSACTION_TYPE_EXPENSE,
             BudgetCategory.is_active.is_(True),
             BudgetCategory.monthly_limit.isnot(None),
@@ -140,11 +108,7 @@ def get_monthly_review(
     
     category_statuses = []
     for cat in categories_with_limits:
-        cat_transactions = [
-            tx for tx in transactions
-            if tx.category_id == cat.id and tx.type == TRANSACTION_TYPE_EXPENSE
-        ]
-        spent = sum(float(_get_decrypted_amount(tx)) for tx in cat_transactions)
+        spent = float(agg.expense_by_category.get(cat.id, 0))
         limit = float(cat.monthly_limit or 0)
         percentage = (spent / limit * 100) if limit > 0 else 0
         is_over = spent > limit
@@ -176,7 +140,7 @@ def get_monthly_review(
     
     portfolios = db.execute(
         select(Portfolio)
-        .where(Portfolio.user_id == user.id)
+        .where(Portfolio.user_id == user_id)
     ).scalars().all()
     
     portfolios_count = len(portfolios)
@@ -185,7 +149,7 @@ def get_monthly_review(
             select(func.count(Position.id))
             .select_from(Position)
             .join(Portfolio, Portfolio.id == Position.portfolio_id)
-            .where(Portfolio.user_id == user.id)
+            .where(Portfolio.user_id == user_id)
         ).scalar()
         or 0
     )
@@ -198,7 +162,7 @@ def get_monthly_review(
     obligation_blocks = db.execute(
         select(ObligationBlock)
         .where(
-            ObligationBlock.user_id == user.id,
+            ObligationBlock.user_id == user_id,
             ObligationBlock.status == "Активный",
         )
     ).scalars().all()
@@ -255,3 +219,19 @@ def get_monthly_review(
         investments=investment_review,
         obligations=obligation_review,
     )
+
+
+@router.get("", response_model=MonthlyReviewOut)
+async def get_monthly_review(
+    user: User = Depends(get_current_user),
+    year: Optional[int] = Query(None, description="Год обзора (например 2026)"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Месяц обзора (1–12)"),
+):
+    today = date.today()
+    review_month = resolve_review_month(today, year, month)
+
+    # «Ближайшие платежи» зависят от сегодняшней даты — она входит в ключ
+    async def _load():
+        return (await run_in_threadpool(with_session, _monthly_review, user.id, today, review_month)).model_dump()
+    data = await cached_budget_json(user.id, f"monthly_review:{review_month}:{today}", _load)
+    return MonthlyReviewOut(**data)
@@ -6,12 +6,12 @@ import logging
 
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.backend.core.auth import get_staff_user
 from app.backend.core.config import get_settings
 from app.backend.core.constants import ERROR_INVALID_TOKEN
-from app.backend.db.session import SessionLocal, get_db
+from app.backend.db.async_session import AsyncSessionLocal, get_async_db
 from app.backend.models.user import User
 from app.backend.services.presence import presence_service
 
@@ -22,16 +22,16 @@ settings = get_settings()
 WS_AUTH_TIMEOUT_SEC = 10.0
 
 
-def _user_from_token(token: str, db: Session) -> User | None:
+async def _user_from_token(token: str, db: AsyncSession) -> User | None:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id = int(payload.get("sub", "0"))
     except (JWTError, ValueError):
         return None
-    return db.query(User).filter(User.id == user_id).first()
+    return await db.get(User, user_id)
 
 
-async def _authenticate_ws(websocket: WebSocket, db: Session) -> User | None:
+async def _authenticate_ws(websocket: WebSocket) -> User | None:
     """Auth via first JSON message {type: auth, token: ...} — token not in URL."""
     try:
         raw = await asyncio.wait_for(websocket.receive_text(), timeout=WS_AUTH_TIMEOUT_SEC)
@@ -47,7 +47,9 @@ async def _authenticate_ws(websocket: WebSocket, db: Session) -> User | None:
         await websocket.close(code=4401, reason="auth required")
         return None
 
-    user = _user_from_token(str(msg["token"]), db)
+    # сессия только на время проверки: соединение не держится всё время жизни сокета
+    async with AsyncSessionLocal() as db:
+        user = await _user_from_token(str(msg["token"]), db)
     if not user:
         await websocket.close(code=4401, reason=ERROR_INVALID_TOKEN)
         return None
@@ -59,11 +61,10 @@ async def _authenticate_ws(websocket: WebSocket, db: Session) -> User | None:
 @router.websocket("/ws/presence")
 async def presence_websocket(websocket: WebSocket) -> None:
     await websocket.accept()
-    db = SessionLocal()
     user: User | None = None
     is_staff = False
     try:
-        user = await _authenticate_ws(websocket, db)
+        user = await _authenticate_ws(websocket)
         if not user:
             return
 
@@ -82,7 +83,8 @@ async def presence_websocket(websocket: WebSocket) -> None:
 
         if is_staff:
             await presence_service.register_staff(websocket)
-            snapshot = await presence_service.build_snapshot(db)
+            async with AsyncSessionLocal() as db:
+                snapshot = await presence_service.build_snapshot(db)
             await websocket.send_json({"type": "snapshot", "users": snapshot})
 
         while True:
@@ -113,13 +115,12 @@ async def presence_websocket(websocket: WebSocket) -> None:
                     await presence_service.publish({"type": "offline", "user_id": user.id})
             except Exception:
                 log.exception("presence disconnect cleanup failed user_id=%s", user.id)
-        db.close()
 
 
 @router.get("/admin/presence/online")
 async def list_online_users(
     admin: User = Depends(get_staff_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """REST fallback: текущий список онлайн-пользователей."""
     users = await presence_service.build_snapshot(db)
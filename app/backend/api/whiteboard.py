@@ -11,7 +11,7 @@ from sqlalchemy import select, desc
 from sqlalchemy.orm import Session
 
 from app.backend.core.auth import get_current_user
-from app.backend.core.security import encrypt_amount
+from app.backend.core.security import encrypt_amount_v2
 from app.backend.core.constants import (
     ERROR_NOT_FOUND,
     HTTP_400_BAD_REQUEST,
@@ -26,6 +26,8 @@ from app.backend.db.session import get_db
 from app.backend.models.user import User
 from app.backend.models.whiteboard import Whiteboard
 from app.backend.models.budget import BudgetTransaction, BudgetAccount, BudgetCategory
+from app.backend.services.budget_rollup import apply_transaction
+from app.backend.services.budget_cache import invalidate_budget_cache
 
 router = APIRouter(prefix="/whiteboard", tags=["whiteboard"])
 
@@ -255,7 +257,7 @@ def delete_whiteboard(
     return {"ok": True}
 
 
-@router.post("/{board_id}/export", response_model=ExportToBudgetOut)
+@router.post("/{board_id}/export", response_model=ExportToBudgetOut, dependencies=[Depends(invalidate_budget_cache)])
 def export_whiteboard_to_budget(
     board_id: int,
     payload: ExportToBudgetIn,
@@ -312,13 +314,14 @@ def export_whiteboard_to_budget(
             contra_account_id=None,
             category_id=category.id,
             amount=Decimal(str(amount)),
-            amount_encrypted=encrypt_amount(Decimal(str(amount))),
+            amount_encrypted_v2=encrypt_amount_v2(Decimal(str(amount))),
             currency=DEFAULT_CURRENCY,
             occurred_at=occurred,
             description=raw.get("title") or None,
         )
         db.add(tx)
         db.flush()
+        apply_transaction(db, tx, Decimal(str(amount)))
         tx_ids.append(tx.id)
         created += 1
 
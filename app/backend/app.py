@@ -10,6 +10,7 @@ from sqlalchemy import text
 
 from app.backend.core.config import get_settings
 from app.backend.core.cache import close_redis
+from app.backend.core.security import shutdown_decrypt_pool, shutdown_hash_pool
 from app.backend.core.constants import (
     APP_TITLE,
     APP_VERSION,
@@ -17,9 +18,11 @@ from app.backend.core.constants import (
     ALLOWED_HTTP_HEADERS,
     CORS_PREFLIGHT_MAX_AGE,
 )
+from app.backend.db.async_session import async_engine
 from app.backend.db.session import engine
 
 from app.backend.routes.init import api_router
+from app.backend.routes.market import price_fanout
 
 # твои бюджетные эндпоинты
 from app.backend.api.budget_accounts import router as budget_accounts_router
@@ -34,7 +37,10 @@ from app.backend.api.whiteboard import router as whiteboard_router
 from app.backend.api.admin import router as admin_router
 from app.backend.api.admin_enhancements import router as admin_enhancements_router
 from app.backend.api.presence import router as presence_router
+from app.backend.services.instrument_registry import instrument_registry
+from app.backend.services.market_stream import start_market_stream
 from app.backend.services.presence import presence_service
+from app.backend.services.tinkoff_clients import tinkoff_clients
 
 settings = get_settings()
 logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL.upper(), logging.DEBUG))
@@ -45,13 +51,23 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
         schema = conn.execute(text("SHOW search_path")).scalar()
         log.info(f"DB connected. search_path = {schema}")
     listener_task = asyncio.create_task(presence_service.run_event_listener())
+    instruments_task = asyncio.create_task(instrument_registry.run(settings.TINKOFF_TOKEN))
+    stream_task = start_market_stream()
     yield
-    listener_task.cancel()
-    try:
-        await listener_task
-    except asyncio.CancelledError:
-        pass
+    for task in (listener_task, instruments_task, stream_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await price_fanout.close()
+    await tinkoff_clients.close()
     await close_redis()
+    await async_engine.dispose()
+    shutdown_decrypt_pool()
+    shutdown_hash_pool()
     log.info("Server shutdown")
 
 def create_app() -> FastAPI:
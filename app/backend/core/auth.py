@@ -1,9 +1,18 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import anyio.from_thread
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import make_transient_to_detached
+from starlette.concurrency import run_in_threadpool
 
+from app.backend.core.cache import cached_json, get_redis
 from app.backend.core.config import get_settings
 from app.backend.core.constants import (
     ERROR_INVALID_TOKEN,
@@ -11,11 +20,14 @@ from app.backend.core.constants import (
     ERROR_ACCESS_DENIED,
     HTTP_401_UNAUTHORIZED,
     HTTP_403_FORBIDDEN,
+    PRINCIPAL_CACHE_TTL_SEC,
+    PRINCIPAL_TOKENS_MAX_ITEMS,
 )
-from app.backend.db.session import get_db
+from app.backend.db.session import SessionLocal
 from app.backend.models.user import User
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 security = HTTPBearer(auto_error=True)
 
 def create_access_token(user_id: int, expires_minutes: int | None = None, extra: dict | None = None) -> str:
@@ -31,20 +43,106 @@ def create_access_token(user_id: int, expires_minutes: int | None = None, extra:
 def create_impersonation_token(target_user_id: int, admin_id: int, expires_minutes: int = 60) -> str:
     return create_access_token(target_user_id, expires_minutes, extra={"imp_by": admin_id})
 
-def get_current_user(
+# ---------- principal cache ----------
+# Проверенные claims по sha256 токена (до exp, но не дольше PRINCIPAL_CACHE_TTL_SEC) и снимок
+# пользователя через core.cache.cached_json: сессия БД открывается только при промахе.
+# Ключ снимка содержит версию пользователя из Redis (principal:ver:{user_id}), которая
+# читается на каждый запрос: сброс (права, удаление, токен) сразу виден всем воркерам,
+# их L1 со старой версией больше не читается. Redis недоступен — кэш обходится.
+_PRINCIPAL_FIELDS = ("id", "email", "full_name", "tg_username", "is_staff", "tinkoff_token_enc")
+_verified_tokens: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+
+def _version_key(user_id: int) -> str:
+    return f"principal:ver:{user_id}"
+
+
+async def _principal_version(user_id: int) -> Optional[int]:
+    """Текущая версия снимка пользователя; None — Redis недоступен."""
+    try:
+        r = await get_redis()
+        raw = await r.get(_version_key(user_id))
+        return int(raw) if raw else 0
+    except Exception:
+        return None
+
+
+def _verified_claims(token: str) -> dict:
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    hit = _verified_tokens.get(digest)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=ERROR_INVALID_TOKEN)
+    expires_at = min(float(payload.get("exp") or now), now + PRINCIPAL_CACHE_TTL_SEC)
+    _verified_tokens[digest] = (payload, expires_at)
+    _verified_tokens.move_to_end(digest)
+    while len(_verified_tokens) > PRINCIPAL_TOKENS_MAX_ITEMS:
+        _verified_tokens.popitem(last=False)
+    return payload
+
+
+def _load_principal(user_id: int) -> Optional[dict]:
+    with SessionLocal() as db:
+        user = db.get(User, user_id)
+        if user is None:
+            return None
+        return {f: getattr(user, f) for f in _PRINCIPAL_FIELDS}
+
+
+def _user_from_principal(data: dict) -> User:
+    """
+    Отсоединённый User из снимка (новый объект на каждый запрос). Для изменения
+    пользователя в обработчике загружайте строку заново: db.get(User, user.id).
+    """
+    user = User(**{f: data.get(f) for f in _PRINCIPAL_FIELDS})
+    make_transient_to_detached(user)
+    return user
+
+
+async def invalidate_principal(user_id: int) -> None:
+    try:
+        r = await get_redis()
+        await r.incr(_version_key(user_id))
+    except Exception:
+        logger.warning("Не удалось сбросить снимок пользователя user_id=%s", user_id, exc_info=True)
+
+
+def invalidate_principal_sync(user_id: int) -> None:
+    """Для синхронных обработчиков (threadpool): сброс снимка после commit."""
+    try:
+        anyio.from_thread.run(invalidate_principal, user_id)
+    except RuntimeError:
+        pass
+
+
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
 ) -> User:
-    token = creds.credentials
+    payload = _verified_claims(creds.credentials)
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id = int(payload.get("sub", "0"))
-    except (JWTError, ValueError):
+    except (TypeError, ValueError):
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=ERROR_INVALID_TOKEN)
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+
+    async def _load():
+        return await run_in_threadpool(_load_principal, user_id)
+    version = await _principal_version(user_id)
+    if version is None:
+        data = await _load()
+    else:
+        data = await cached_json(
+            f"principal:{user_id}:v{version}",
+            ttl_sec=PRINCIPAL_CACHE_TTL_SEC,
+            loader=_load,
+            local_only=not settings.PRINCIPAL_CACHE_REDIS,
+        )
+    if not data:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=ERROR_USER_NOT_FOUND)
-    return user
+    return _user_from_principal(data)
 
 def get_staff_user(
     user: User = Depends(get_current_user),
@@ -1,12 +1,21 @@
 from __future__ import annotations
-import json, time
-from typing import Any, Optional, Awaitable, Callable
+import asyncio, json, logging, math, secrets, time
+from collections import OrderedDict
+from typing import Any, Optional, Awaitable, Callable, Sequence
 
 import redis.asyncio as redis
 from fastapi import HTTPException
 
 from app.backend.core.config import get_settings
+from app.backend.core.constants import (
+    CACHE_LOCK_POLL_SEC,
+    CACHE_LOCK_TTL_SEC,
+    CACHE_LOCK_WAIT_SEC,
+    LOCAL_CACHE_MAX_ITEMS,
+    LOCAL_RATE_LIMIT_MAX_KEYS,
+)
 
+log = logging.getLogger(__name__)
 _settings = get_settings()
 _redis: Optional[redis.Redis] = None
 
@@ -45,37 +54,446 @@ async def cache_set(key: str, value: Any, ttl_sec: int) -> None:
     except Exception:
         pass
 
-async def cached_json(key: str, ttl_sec: int, loader: Callable[[], Awaitable[Any]]) -> Any:
-    cached = await cache_get(key)
-    if cached is not None:
-        return cached
-    data = await loader()
-    await cache_set(key, data, ttl_sec)
-    return data
+# ---------- L1: in-process LRU/TTL ----------
+class _LocalCache:
+    """Ограниченный LRU в памяти воркера: key -> (value, fresh_until, stale_until)."""
 
-# ---------- simple rate limit (fixed window) ----------
-async def rate_limit(key: str, limit: int, window_sec: int, *, fail_closed: bool = False) -> None:
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._data: OrderedDict[str, tuple[Any, float, float]] = OrderedDict()
+
+    def get(self, key: str, now: float) -> Optional[tuple[Any, bool]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, fresh_until, stale_until = item
+        if now >= stale_until:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value, now < fresh_until
+
+    def set(self, key: str, value: Any, fresh_until: float, stale_until: float) -> None:
+        self._data[key] = (value, fresh_until, max(fresh_until, stale_until))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+_local = _LocalCache(LOCAL_CACHE_MAX_ITEMS)
+_inflight: dict[str, asyncio.Task] = {}
+_background: set[asyncio.Task] = set()
+
+# снятие блокировки только своим токеном
+_UNLOCK_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+def clear_local_cache() -> None:
+    _local.clear()
+
+
+# ---------- L2: Redis ----------
+# Значение хранится в конверте {"__v": value, "__fresh": unix-время}: после __fresh оно
+# ещё живёт stale_ttl_sec секунд и отдаётся как устаревшее, пока идёт обновление.
+def _unwrap(raw: Any, ttl_sec: int) -> tuple[Any, float]:
+    if isinstance(raw, dict) and "__v" in raw and "__fresh" in raw:
+        return raw["__v"], float(raw["__fresh"])
+    return raw, time.time() + ttl_sec  # значение без конверта (записано cache_set)
+
+
+async def _l2_get(key: str, ttl_sec: int) -> Optional[tuple[Any, float]]:
+    raw = await cache_get(key)
+    return None if raw is None else _unwrap(raw, ttl_sec)
+
+
+async def _store(key: str, value: Any, ttl_sec: int, stale_ttl_sec: int, local_only: bool) -> None:
+    fresh_until = time.time() + ttl_sec
+    _local.set(key, value, fresh_until, fresh_until + stale_ttl_sec)
+    if not local_only:
+        await cache_set(key, {"__v": value, "__fresh": fresh_until}, ttl_sec + stale_ttl_sec)
+
+
+async def cache_delete(key: str) -> None:
+    """Удаляет ключ из L1 этого воркера и из Redis (L1 других воркеров истечёт по TTL)."""
+    _local.delete(key)
+    try:
+        r = await get_redis()
+        await r.delete(key)
+    except Exception:
+        pass
+
+
+async def _acquire_lock(key: str) -> Optional[str]:
+    """Распределённая блокировка загрузки ключа; None — держит другой воркер."""
+    token = secrets.token_hex(8)
+    try:
+        r = await get_redis()
+        ok = await r.set(f"lock:{key}", token, nx=True, ex=CACHE_LOCK_TTL_SEC)
+    except Exception:
+        return token  # Redis недоступен — грузим сами
+    return token if ok else None
+
+
+async def _release_lock(key: str, token: str) -> None:
+    try:
+        r = await get_redis()
+        await r.eval(_UNLOCK_LUA, 1, f"lock:{key}", token)
+    except Exception:
+        pass
+
+
+async def _wait_for_l2(key: str, ttl_sec: int) -> Optional[tuple[Any, float]]:
+    deadline = time.monotonic() + CACHE_LOCK_WAIT_SEC
+    while time.monotonic() < deadline:
+        await asyncio.sleep(CACHE_LOCK_POLL_SEC)
+        entry = await _l2_get(key, ttl_sec)
+        if entry is not None and entry[1] > time.time():
+            return entry
+    return None
+
+
+async def _load(
+    key: str,
+    ttl_sec: int,
+    stale_ttl_sec: int,
+    loader: Callable[[], Awaitable[Any]],
+    lock: bool,
+    local_only: bool,
+) -> Any:
+    token = None
+    if lock:
+        token = await _acquire_lock(key)
+        if token is None:
+            entry = await _wait_for_l2(key, ttl_sec)
+            if entry is not None:
+                value, fresh_until = entry
+                _local.set(key, value, fresh_until, fresh_until + stale_ttl_sec)
+                return value
+            # владелец блокировки не успел — грузим сами
+    try:
+        data = await loader()
+        if data is not None:
+            await _store(key, data, ttl_sec, stale_ttl_sec, local_only)
+        return data
+    finally:
+        if token is not None:
+            await _release_lock(key, token)
+
+
+def _start_load(
+    key: str,
+    ttl_sec: int,
+    stale_ttl_sec: int,
+    loader: Callable[[], Awaitable[Any]],
+    lock: bool,
+    local_only: bool = False,
+) -> asyncio.Task:
+    """Single-flight: не больше одной загрузки ключа на воркер."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_load(key, ttl_sec, stale_ttl_sec, loader, lock, local_only))
+        _inflight[key] = task
+
+        def _done(t: asyncio.Task, k: str = key) -> None:
+            if _inflight.get(k) is t:
+                del _inflight[k]
+
+        task.add_done_callback(_done)
+    return task
+
+
+def _refresh_in_background(
+    key: str,
+    ttl_sec: int,
+    stale_ttl_sec: int,
+    loader: Callable[[], Awaitable[Any]],
+    lock: bool,
+    local_only: bool,
+) -> None:
+    if key in _inflight:
+        return
+    task = _start_load(key, ttl_sec, stale_ttl_sec, loader, lock, local_only)
+    _background.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        _background.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            log.warning("Фоновое обновление кэша %s не удалось: %r", key, t.exception())
+
+    task.add_done_callback(_done)
+
+
+async def cached_json(
+    key: str,
+    ttl_sec: int,
+    loader: Callable[[], Awaitable[Any]],
+    *,
+    stale_ttl_sec: int = 0,
+    lock: bool = False,
+    local_only: bool = False,
+) -> Any:
     """
-    Не более `limit` инкрементов за `window_sec`.
-    fail_closed=True — при недоступности Redis отклонять запрос (для auth).
+    Двухуровневый кэш: L1 в памяти воркера, L2 в Redis. Конкурентные промахи по ключу
+    объединяются в одну загрузку; lock=True дополнительно объединяет их между воркерами.
+    stale_ttl_sec > 0 — после истечения ttl значение ещё столько секунд отдаётся сразу,
+    а обновление идёт в фоне. local_only=True — только L1, без Redis.
+    Возвращаемые значения общие — не изменяйте их. Загрузка переживает отмену вызвавшего
+    запроса, поэтому loader не должен захватывать ресурсы запроса (сессию из get_db).
     """
+    now = time.time()
+    hit = _local.get(key, now)
+    if hit is not None:
+        value, fresh = hit
+        if not fresh:
+            _refresh_in_background(key, ttl_sec, stale_ttl_sec, loader, lock, local_only)
+        return value
+
+    entry = None if local_only else await _l2_get(key, ttl_sec)
+    if entry is not None:
+        value, fresh_until = entry
+        if now < fresh_until + stale_ttl_sec:
+            _local.set(key, value, fresh_until, fresh_until + stale_ttl_sec)
+            if now >= fresh_until:
+                _refresh_in_background(key, ttl_sec, stale_ttl_sec, loader, lock, local_only)
+            return value
+
+    return await asyncio.shield(_start_load(key, ttl_sec, stale_ttl_sec, loader, lock, local_only))
+
+# ---------- пакетное чтение по ключу на элемент ----------
+async def _l2_get_many(keys: list[str], ttl_sec: int) -> list[Optional[tuple[Any, float]]]:
+    """Один MGET; при недоступности Redis — все промахи."""
     try:
         r = await get_redis()
+        raws = await r.mget(keys)
     except Exception:
-        if fail_closed:
-            raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+        return [None] * len(keys)
+    return [_unwrap(json.loads(raw), ttl_sec) if raw else None for raw in raws]
+
+
+async def _store_many(items: dict[str, Any], ttl_sec: int, stale_ttl_sec: int) -> None:
+    """L1 + один pipeline SETEX в Redis."""
+    if not items:
+        return
+    fresh_until = time.time() + ttl_sec
+    for key, value in items.items():
+        _local.set(key, value, fresh_until, fresh_until + stale_ttl_sec)
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.setex(key, ttl_sec + stale_ttl_sec, json.dumps({"__v": value, "__fresh": fresh_until}))
+            await pipe.execute()
+    except Exception:
+        pass
+
+
+async def _pick(batch: asyncio.Task, item_id: str) -> Any:
+    return (await batch).get(item_id)
+
+
+def _start_load_many(
+    ids: Sequence[str],
+    key_fn: Callable[[str], str],
+    ttl_sec: int,
+    stale_ttl_sec: int,
+    loader: Callable[[list[str]], Awaitable[dict[str, Any]]],
+) -> dict[str, asyncio.Task]:
+    """
+    Одна загрузка на все ещё не загружающиеся элементы; каждый элемент регистрируется
+    в _inflight под своим ключом, так что cached_json по тому же ключу к ней присоединяется.
+    """
+    out: dict[str, asyncio.Task] = {}
+    todo: list[str] = []
+    for item_id in ids:
+        task = _inflight.get(key_fn(item_id))
+        if task is not None:
+            out[item_id] = task
+        else:
+            todo.append(item_id)
+    if not todo:
+        return out
+
+    async def _load_batch() -> dict[str, Any]:
+        data = await loader(todo) or {}
+        await _store_many(
+            {key_fn(i): v for i, v in data.items() if i in todo and v is not None}, ttl_sec, stale_ttl_sec
+        )
+        return data
+
+    batch = asyncio.ensure_future(_load_batch())
+    for item_id in todo:
+        key = key_fn(item_id)
+        task = asyncio.ensure_future(_pick(batch, item_id))
+        _inflight[key] = task
+
+        def _done(t: asyncio.Task, k: str = key) -> None:
+            if _inflight.get(k) is t:
+                del _inflight[k]
+            if not t.cancelled():
+                t.exception()  # ошибку получает тот, кто ждёт; здесь только помечаем прочитанной
+
+        task.add_done_callback(_done)
+        out[item_id] = task
+    return out
+
+
+def _refresh_many_in_background(
+    ids: Sequence[str],
+    key_fn: Callable[[str], str],
+    ttl_sec: int,
+    stale_ttl_sec: int,
+    loader: Callable[[list[str]], Awaitable[dict[str, Any]]],
+) -> None:
+    ids = [i for i in ids if key_fn(i) not in _inflight]
+    if not ids:
         return
+    tasks = list(_start_load_many(ids, key_fn, ttl_sec, stale_ttl_sec, loader).values())
+    for task in tasks:
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    def _log_failure(t: asyncio.Task) -> None:
+        if not t.cancelled() and t.exception() is not None:
+            log.warning("Фоновое обновление %s ключей кэша не удалось: %r", len(ids), t.exception())
+
+    tasks[0].add_done_callback(_log_failure)
+
+
+async def cached_json_many(
+    ids: Sequence[str],
+    key_fn: Callable[[str], str],
+    ttl_sec: int,
+    loader: Callable[[list[str]], Awaitable[dict[str, Any]]],
+    *,
+    stale_ttl_sec: int = 0,
+) -> dict[str, Any]:
+    """
+    Пакетный cached_json с отдельным ключом на элемент (key_fn(id)) и тем же форматом
+    записи: L1, затем один MGET по промахам, затем один вызов loader(только недостающие id),
+    который возвращает {id: значение}. Элементы без значения в ответе отсутствуют.
+    """
+    unique = list(dict.fromkeys(ids))
+    now = time.time()
+    out: dict[str, Any] = {}
+    stale: list[str] = []
+    misses: list[str] = []
+    for item_id in unique:
+        hit = _local.get(key_fn(item_id), now)
+        if hit is None:
+            misses.append(item_id)
+            continue
+        out[item_id], fresh = hit
+        if not fresh:
+            stale.append(item_id)
+
+    missing: list[str] = []
+    if misses:
+        for item_id, entry in zip(misses, await _l2_get_many([key_fn(i) for i in misses], ttl_sec)):
+            if entry is None or now >= entry[1] + stale_ttl_sec:
+                missing.append(item_id)
+                continue
+            value, fresh_until = entry
+            _local.set(key_fn(item_id), value, fresh_until, fresh_until + stale_ttl_sec)
+            out[item_id] = value
+            if now >= fresh_until:
+                stale.append(item_id)
+
+    if stale:
+        _refresh_many_in_background(stale, key_fn, ttl_sec, stale_ttl_sec, loader)
+    if missing:
+        tasks = _start_load_many(missing, key_fn, ttl_sec, stale_ttl_sec, loader)
+        values = await asyncio.shield(asyncio.gather(*tasks.values()))
+        for item_id, value in zip(tasks, values):
+            if value is not None:
+                out[item_id] = value
+    return out
+
+# ---------- rate limit (sliding window) ----------
+# Скользящее окно по двум счётчикам (текущее и предыдущее окно) в одном hash: оценка
+# prev * (доля оставшегося окна) + cur. Один вызов EVAL, время берётся с сервера Redis.
+_RATE_LIMIT_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local start = now - (now % window)
+local h = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local w = tonumber(h[1])
+local c = tonumber(h[2]) or 0
+local p = tonumber(h[3]) or 0
+if w ~= start then
+    if w == start - window then p = c else p = 0 end
+    c = 0
+end
+local estimate = p * (window - (now - start)) / window + c
+local allowed = 0
+if estimate + 1 <= limit then
+    c = c + 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'w', start, 'c', c, 'p', p)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {allowed, window - (now - start)}
+"""
+
+
+class _LocalTokenBuckets:
+    """Запасной лимитер на случай недоступности Redis: token bucket в памяти воркера."""
 
-    now_bucket = int(time.time()) // window_sec
-    window_key = f"rl:{key}:{now_bucket}"
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+
+    def take(self, key: str, limit: int, window_sec: int) -> float:
+        """0 — разрешено, иначе через сколько секунд появится токен."""
+        now = time.monotonic()
+        rate = limit / window_sec
+        tokens, updated = self._buckets.get(key, (float(limit), now))
+        tokens = min(float(limit), tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+_local_buckets = _LocalTokenBuckets(LOCAL_RATE_LIMIT_MAX_KEYS)
+
+
+def _too_many(retry_after_sec: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, slow down",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after_sec)))},
+    )
+
+
+async def rate_limit(key: str, limit: int, window_sec: int, *, fail_closed: bool = False) -> None:
+    """
+    Не более `limit` запросов за скользящие `window_sec` секунд.
+    При недоступности Redis считает локальный token bucket воркера;
+    fail_closed=True — вместо этого отклонять запрос (для auth).
+    """
     try:
-        count = await r.incr(window_key, 1)
-        if count == 1:
-            await r.expire(window_key, window_sec)
-        if count > limit:
-            raise HTTPException(status_code=429, detail="Too many requests, slow down")
-    except HTTPException:
-        raise
+        r = await get_redis()
+        allowed, retry_ms = await r.eval(_RATE_LIMIT_LUA, 1, f"rl:{key}", limit, window_sec * 1000)
     except Exception:
         if fail_closed:
             raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+        retry_after = _local_buckets.take(key, limit, window_sec)
+        if retry_after:
+            raise _too_many(retry_after)
+        return
+    if not int(allowed):
+        raise _too_many(int(retry_ms) / 1000)
@@ -17,6 +17,9 @@ class Settings(BaseModel):
     SQL_MAX_OVERFLOW: int = int(os.getenv("SQL_MAX_OVERFLOW", "10"))
     SQL_POOL_RECYCLE: int = int(os.getenv("SQL_POOL_RECYCLE", "1800"))  # 30 мин
     SQL_POOL_TIMEOUT: int = int(os.getenv("SQL_POOL_TIMEOUT", "30"))
+    # async-движок (asyncpg) для async-обработчиков — свой пул поверх синхронного
+    SQL_ASYNC_POOL_SIZE: int = int(os.getenv("SQL_ASYNC_POOL_SIZE", "3"))
+    SQL_ASYNC_MAX_OVERFLOW: int = int(os.getenv("SQL_ASYNC_MAX_OVERFLOW", "5"))
 
     # --- App logging/CORS ---
     DEBUG: bool = (os.getenv("DEBUG", "false").lower() == "true")
@@ -33,6 +36,8 @@ class Settings(BaseModel):
         "DATABASE_URL",
         _DEV_DATABASE_URL,
     )
+    # пусто — выводится из DATABASE_URL заменой драйвера на asyncpg
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
     DB_SCHEMA: str = os.getenv("DB_SCHEMA", "pf")
 
     # --- Auth/JWT ---
@@ -41,12 +46,25 @@ class Settings(BaseModel):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
     # Fernet key (url-safe base64, 44 chars). If empty, derived from SECRET_KEY for backward compat.
     ENCRYPTION_KEY: str = os.getenv("ENCRYPTION_KEY", "")
+    # Пул процессов для пакетной расшифровки сумм (0 — расшифровывать в текущем процессе)
+    DECRYPT_POOL_WORKERS: int = int(os.getenv("DECRYPT_POOL_WORKERS", "0"))
+    # bcrypt: стоимость и пул для хэширования паролей; сверх PASSWORD_HASH_MAX_PENDING задач — 503
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_PROCESSES: bool = (os.getenv("PASSWORD_HASH_PROCESSES", "true").lower() == "true")
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
 
     # --- Market ---
     TINKOFF_TOKEN: str = os.getenv("TINKOFF_API_TOKEN") or os.getenv("TINKOFF_TOKEN") or ""
+    # Квоты Tinkoff API делятся между воркерами gunicorn
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # Поток последних цен (MarketDataStream) держит один выбранный воркер; нужен TINKOFF_TOKEN
+    MARKET_STREAM_ENABLED: bool = (os.getenv("MARKET_STREAM_ENABLED", "true").lower() == "true")
 
     # --- Redis ---
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://bigs-redis:6379/0")
+    # Снимок пользователя запроса хранить и в Redis (false — только в памяти воркера)
+    PRINCIPAL_CACHE_REDIS: bool = (os.getenv("PRINCIPAL_CACHE_REDIS", "true").lower() == "true")
 
     # --- Backups ---
     BACKUP_DIR: str = os.getenv("BACKUP_DIR", "/opt/backups")
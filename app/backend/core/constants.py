@@ -42,6 +42,7 @@ CATEGORY_KINDS = [CATEGORY_KIND_INCOME, CATEGORY_KIND_EXPENSE]
 # Портфели
 DEFAULT_PORTFOLIO_TYPE = "broker"
 DEFAULT_INSTRUMENT_CLASS = "other"
+TRADE_SOURCE_MANUAL = "manual"  # сделка, введённая пользователем (в т.ч. через /portfolio/positions)
 
 # ===== Валидация =====
 
@@ -67,6 +68,9 @@ CATEGORY_KIND_MAX_LENGTH = 7
 
 # ===== Rate Limiting =====
 
+# Запасной лимитер в памяти воркера (когда Redis недоступен): сколько ключей держать
+LOCAL_RATE_LIMIT_MAX_KEYS = 10000
+
 # Логин
 LOGIN_RATE_LIMIT = 5
 LOGIN_RATE_WINDOW_SEC = 60
@@ -79,16 +83,90 @@ REGISTER_RATE_WINDOW_SEC = 3600
 QUOTE_RATE_LIMIT = 30
 QUOTE_RATE_WINDOW_SEC = 60
 QUOTE_CACHE_TTL_SEC = 120
+QUOTE_STALE_TTL_SEC = 60
+# оценка портфеля: ключ уже содержит версию позиций и отпечаток цен — TTL лишь чистит старые
+PORTFOLIO_VALUATION_TTL_SEC = QUOTE_CACHE_TTL_SEC
+# облигации: расписание купонов меняется редко; точность и предел итераций Ньютона для доходности
+BOND_SCHEDULE_TTL_SEC = 12 * 3600
+BOND_YTM_TOLERANCE = 1e-10
+BOND_YTM_MAX_ITER = 50
 
 # Свечи
 CANDLES_RATE_LIMIT = 60
 CANDLES_RATE_WINDOW_SEC = 60
-CANDLES_CACHE_TTL_SEC = 120
+CANDLES_CACHE_TTL_SEC = 120  # незавершённый хвост окна; завершённые свечи — в pf.candles
 CANDLES_DEFAULT_DAYS = 30
+CANDLES_SETTLE_SEC = 60  # свеча считается окончательной через минуту после закрытия
+CANDLES_INSERT_BATCH = 5000
+# лимит окна одного GetCandles по интервалам
+CANDLES_REQUEST_WINDOW_DAYS = {"1min": 1, "5min": 1, "15min": 1, "1h": 7, "1d": 365}
+# наибольшее окно одного запроса /candles: не больше ~20 вызовов get_candles на пустом хранилище
+CANDLES_MAX_WINDOW_DAYS = {"1min": 1, "5min": 7, "15min": 21, "1h": 90, "1d": 3650}
+CANDLES_EXCHANGE_TZ = "Europe/Moscow"  # дневные свечи при пересборке — по дате биржи
 
 # Инструменты
-INSTRUMENTS_CACHE_TTL_SEC = 12 * 60 * 60  # 12 часов
-BATCH_QUOTES_CACHE_TTL_SEC = 120
+INSTRUMENTS_REFRESH_SEC = 12 * 60 * 60  # справочник инструментов пересобирается раз в 12 часов
+INSTRUMENTS_SYNC_SEC = 30  # воркеры сверяют версию снимка в Redis
+INSTRUMENTS_BUILD_LOCK_TTL_SEC = 120
+INSTRUMENT_SEARCH_DEFAULT_LIMIT = 20
+RESOLVE_BATCH_MAX_TICKERS = 500
+INSTRUMENT_SEARCH_MAX_LIMIT = 50
+INSTRUMENT_SEARCH_MAX_PREFIX_HITS = 2000  # короткий префикс («s») не перебирает весь индекс
+INSTRUMENT_SEARCH_MIN_SIMILARITY = 0.5  # доля общих триграмм для нечёткого совпадения
+
+# Пул AsyncClient Tinkoff: простой до закрытия канала, проверка живости, переподключение с backoff
+TINKOFF_CLIENT_IDLE_TTL_SEC = 10 * 60
+TINKOFF_CLIENT_MAX_CHANNELS = 256
+TINKOFF_HEALTHCHECK_INTERVAL_SEC = 60
+TINKOFF_HEALTHCHECK_TIMEOUT_SEC = 5
+TINKOFF_RECONNECT_BACKOFF_SEC = 1
+TINKOFF_RECONNECT_BACKOFF_MAX_SEC = 60
+
+# Планировщик запросов Tinkoff: лимиты методов на токен в минуту (по документации API),
+# ожидание квоты, окно склейки get_last_prices и размер одного вызова
+TINKOFF_METHOD_QUOTAS = {"market_data": 600, "instruments": 200, "users": 100}
+TINKOFF_QUEUE_MAX_WAIT_SEC = 5
+TINKOFF_COALESCE_WINDOW_SEC = 0.005
+TINKOFF_LAST_PRICES_BATCH = 300
+# как часто удалять квоты простаивающих токенов (полная квота неотличима от новой)
+TINKOFF_BUCKET_SWEEP_SEC = 60
+# предохранитель: таймаут вызова, «медленный» вызов, сбоев подряд до размыкания, пауза до пробы
+TINKOFF_CALL_TIMEOUT_SEC = 15
+TINKOFF_BREAKER_SLOW_CALL_SEC = 5
+TINKOFF_BREAKER_FAILURES = 5
+TINKOFF_BREAKER_OPEN_SEC = 30
+
+# Поток последних цен: лидерство воркера, пересборка подписки, сброс цен в Redis
+MARKET_STREAM_LEADER_TTL_SEC = 15
+MARKET_STREAM_RENEW_SEC = 5
+MARKET_STREAM_RESYNC_SEC = 60
+MARKET_STREAM_FLUSH_SEC = 0.5
+MARKET_STREAM_WATCH_TTL_SEC = 24 * 60 * 60  # FIGI без позиций держим в подписке сутки после запроса
+MARKET_STREAM_MAX_FIGIS = 300  # лимит подписок одного стрима Tinkoff
+
+# Push стоимости портфеля (SSE): keepalive соединения и пауза перед переподпиской на Redis
+PORTFOLIO_STREAM_KEEPALIVE_SEC = 15
+PRICE_FANOUT_RETRY_SEC = 1
+
+# Двухуровневый кэш: размер L1 в воркере и распределённая блокировка загрузки
+LOCAL_CACHE_MAX_ITEMS = 4096
+CACHE_LOCK_TTL_SEC = 10
+CACHE_LOCK_WAIT_SEC = 5
+CACHE_LOCK_POLL_SEC = 0.05
+
+# Пользователь запроса (get_current_user): снимок и проверенные токены
+PRINCIPAL_CACHE_TTL_SEC = 30
+PRINCIPAL_TOKENS_MAX_ITEMS = 10000
+
+# Очередь bcrypt заполнена: через сколько секунд клиенту повторить вход/регистрацию
+AUTH_BUSY_RETRY_AFTER_SEC = 1
+
+# Чтения бюджета (ключи версионированы, TTL ограничивает только жизнь мусора)
+BUDGET_CACHE_TTL_SEC = 10 * 60
+
+# Пул соединений БД: границы гистограммы ожидания checkout (мс) и порог предупреждения в лог
+SQL_POOL_WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+SQL_POOL_SLOW_CHECKOUT_MS = 250
 
 # ===== Округление и вычисления =====
 
@@ -96,6 +174,12 @@ BOND_DEFAULT_NOMINAL = 1000.0
 NANO_TO_FLOAT_DIVISOR = 1e9
 PERCENT_TO_DECIMAL = 100.0
 
+# ===== Шифрование =====
+
+# Пакетная расшифровка сумм: с какого размера пачки использовать пул процессов
+DECRYPT_POOL_MIN_BATCH = 5000
+DECRYPT_POOL_CHUNK_SIZE = 2000
+
 # ===== Сообщения об ошибках =====
 
 # Общие
@@ -117,6 +201,7 @@ ERROR_UNKNOWN_TRANSACTION_TYPE = "Неизвестный тип операции
 ERROR_INVALID_TOKEN = "Недействительный токен"
 ERROR_USER_NOT_FOUND = "Пользователь не найден"
 ERROR_INVALID_CREDENTIALS = "Неверный email или пароль"
+ERROR_AUTH_BUSY = "Сервис входа перегружен, повторите попытку позже"
 ERROR_USER_EXISTS = "Пользователь с таким email уже существует"
 ERROR_SERVICE_LOGIN_EXISTS = "Логин сервиса уже занят"
 ERROR_ACCESS_DENIED = "Доступ запрещен. Требуются административные права"
@@ -137,12 +222,15 @@ ERROR_PHONE_FORMAT = ERROR_PHONE_FORMAT_TEMPLATE.format(min=PHONE_MIN_DIGITS, ma
 # Портфель
 ERROR_PORTFOLIO_ACCESS_DENIED = "Нет доступа к этому портфелю"
 ERROR_POSITION_NOT_FOUND = "Позиция не найдена"
+ERROR_TRADE_NOT_FOUND = "Сделка не найдена"
+ERROR_CANDLES_WINDOW_TOO_LONG = "Слишком длинный период для интервала {interval}: не больше {days} дн."
 ERROR_FIGI_REQUIRED = "Требуется figi (разрешай тикер через /resolve)"
 
 # Рынок
 ERROR_EMPTY_TICKER = "Пустой тикер"
 ERROR_CACHE_EMPTY = "Кэш инструментов пуст, попробуйте позже"
 ERROR_FIGI_NOT_FOUND_TEMPLATE = "FIGI по тикеру {ticker} не найден"
+ERROR_TOO_MANY_TICKERS = f"Не больше {RESOLVE_BATCH_MAX_TICKERS} тикеров за запрос"
 ERROR_NO_DATA_TEMPLATE = "Нет данных по FIGI={figi}"
 ERROR_NO_TINKOFF_TOKEN = "У пользователя не задан Tinkoff токен"
 ERROR_TINKOFF_TOKEN_INVALID = "Токен Tinkoff недействителен или отозван. Обновите его в настройках."
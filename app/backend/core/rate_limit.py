@@ -0,0 +1,53 @@
+"""
+Rate limit как FastAPI-зависимость.
+
+    @router.get("/quote/{figi}", dependencies=[Depends(user_rate_limit("quote", QUOTE_RATE_LIMIT, QUOTE_RATE_WINDOW_SEC, params=("figi",)))])
+
+Ключ: имя лимита + пользователь (или IP клиента) + значения перечисленных параметров пути/запроса.
+"""
+
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Sequence
+
+from fastapi import Depends, Request
+
+from app.backend.core.auth import get_current_user
+from app.backend.core.cache import rate_limit
+from app.backend.core.request_utils import client_ip
+from app.backend.models.user import User
+
+
+def _params_suffix(request: Request, params: Sequence[str]) -> str:
+    values = [str(request.path_params.get(p, request.query_params.get(p, ""))) for p in params]
+    return "".join(f":{v}" for v in values)
+
+
+def user_rate_limit(
+    name: str,
+    limit: int,
+    window_sec: int,
+    *,
+    params: Sequence[str] = (),
+) -> Callable[..., Awaitable[None]]:
+    """Лимит на пользователя (get_current_user кэшируется в рамках запроса)."""
+
+    async def _dependency(request: Request, user: User = Depends(get_current_user)) -> None:
+        await rate_limit(f"user:{user.id}:{name}{_params_suffix(request, params)}", limit=limit, window_sec=window_sec)
+
+    return _dependency
+
+
+def ip_rate_limit(
+    name: str,
+    limit: int,
+    window_sec: int,
+    *,
+    fail_closed: bool = False,
+) -> Callable[..., Awaitable[None]]:
+    """Лимит на IP клиента — для маршрутов без авторизации."""
+
+    async def _dependency(request: Request) -> None:
+        await rate_limit(f"{name}:{client_ip(request)}", limit=limit, window_sec=window_sec, fail_closed=fail_closed)
+
+    return _dependency
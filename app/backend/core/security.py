@@ -1,30 +1,128 @@
 from __future__ import annotations
 
+import asyncio
+import base64, hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Iterable, Optional, Union
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from passlib.context import CryptContext
 
+from app.backend.core.config import get_settings
+from app.backend.core.constants import DECRYPT_POOL_CHUNK_SIZE, DECRYPT_POOL_MIN_BATCH
+
+log = logging.getLogger("security")
+
+
+# ===== Пароли (bcrypt) =====
+
+_bcrypt_rounds = get_settings().BCRYPT_ROUNDS
+# min/max_rounds: хэш с другой стоимостью считается устаревшим и перехэшируется при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=_bcrypt_rounds,
+    bcrypt__min_rounds=_bcrypt_rounds,
+    bcrypt__max_rounds=_bcrypt_rounds,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хэширования паролей заполнена — запрос нужно отклонить (503)."""
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(raw: str) -> str:
     return pwd_context.hash(raw)
 
+
 def verify_password(raw: str, hashed: str) -> bool:
     return pwd_context.verify(raw, hashed)
 
 
-import base64, hashlib
-from decimal import Decimal
-from cryptography.fernet import Fernet, InvalidToken
-from app.backend.core.config import get_settings
+def verify_and_update_password(raw: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """(пароль верен, новый хэш или None — если параметры стоимости не менялись)."""
+    return pwd_context.verify_and_update(raw, hashed)
 
-def _get_fernet() -> Fernet:
-    settings = get_settings()
-    if settings.ENCRYPTION_KEY:
-        return Fernet(settings.ENCRYPTION_KEY.encode("utf-8"))
-    digest = hashlib.sha256(settings.SECRET_KEY.encode("utf-8")).digest()
+
+_hash_pool: Executor | None = None
+_hash_pending = 0
+
+
+def _get_hash_pool() -> Executor:
+    global _hash_pool
+    if _hash_pool is None:
+        settings = get_settings()
+        workers = max(settings.PASSWORD_HASH_WORKERS, 1)
+        if settings.PASSWORD_HASH_PROCESSES:
+            _hash_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            # bcrypt отпускает GIL, потоки тоже масштабируются по ядрам
+            _hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    return _hash_pool
+
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    if _hash_pool is not None:
+        try:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            _hash_pool = None
+
+
+async def _run_hash_job(fn, *args):
+    """
+    Выполняет bcrypt в пуле, не занимая event loop. В очереди и в работе одновременно
+    не больше PASSWORD_HASH_MAX_PENDING задач, сверх — PasswordHasherBusy.
+    """
+    global _hash_pending
+    if _hash_pending >= get_settings().PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy()
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_hash_pool(), fn, *args)
+        except BrokenProcessPool:
+            log.exception("password hash pool failed, retrying in a thread")
+            shutdown_hash_pool()
+            return await asyncio.to_thread(fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password_async(raw: str) -> str:
+    return await _run_hash_job(hash_password, raw)
+
+
+async def verify_and_update_password_async(raw: str, hashed: str) -> tuple[bool, Optional[str]]:
+    return await _run_hash_job(verify_and_update_password, raw, hashed)
+
+
+@lru_cache(maxsize=4)
+def _fernet_for(encryption_key: str, secret_key: str) -> Fernet:
+    # Ключ (и SHA-256 от SECRET_KEY) вычисляем один раз на процесс
+    if encryption_key:
+        return Fernet(encryption_key.encode("utf-8"))
+    digest = hashlib.sha256(secret_key.encode("utf-8")).digest()
     key = base64.urlsafe_b64encode(digest)
     return Fernet(key)
 
+
+def _get_fernet() -> Fernet:
+    settings = get_settings()
+    return _fernet_for(settings.ENCRYPTION_KEY, settings.SECRET_KEY)
+
 def encrypt_token(plain: str) -> str:
     if not plain:
         return ""
@@ -43,6 +141,29 @@ def decrypt_token(enc: str) -> str:
 
 # ===== Шифрование сумм транзакций =====
 
+# Формат v2 (bytea): версия(1) | nonce(12) | AES-GCM(копейки int64 big-endian)(8) | tag(16)
+AMOUNT_V2_VERSION = 2
+_AMOUNT_V2_NONCE_LEN = 12
+_AMOUNT_V2_LEN = 1 + _AMOUNT_V2_NONCE_LEN + 8 + 16
+_AMOUNT_V2_AAD = b"pf.budget_transactions.amount:v2"
+_KOPECKS = Decimal(100)
+
+AmountCipher = Union[str, bytes, bytearray, memoryview, None]
+
+
+@lru_cache(maxsize=4)
+def _aesgcm_for(encryption_key: str, secret_key: str) -> AESGCM:
+    # Отдельный ключ для v2, выведенный из того же секрета, что и Fernet
+    material = (encryption_key or secret_key).encode("utf-8")
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"amount-v2").derive(material)
+    return AESGCM(key)
+
+
+def _get_aesgcm() -> AESGCM:
+    settings = get_settings()
+    return _aesgcm_for(settings.ENCRYPTION_KEY, settings.SECRET_KEY)
+
+
 def encrypt_amount(amount: Decimal | float | str) -> str:
     """
     Шифрует сумму транзакции для безопасного хранения в БД.
@@ -54,15 +175,111 @@ def encrypt_amount(amount: Decimal | float | str) -> str:
     return f.encrypt(amount_str.encode("utf-8")).decode("utf-8")
 
 
-def decrypt_amount(enc: str) -> Decimal:
+def encrypt_amount_v2(amount: Decimal | float | str) -> bytes:
     """
-    Расшифровывает сумму транзакции из БД.
+    Шифрует сумму в компактный формат v2 (37 байт) для колонки amount_encrypted_v2.
     """
+    kopecks = int((Decimal(str(amount)) * _KOPECKS).to_integral_value(rounding=ROUND_HALF_UP))
+    try:
+        plain = kopecks.to_bytes(8, "big", signed=True)
+    except OverflowError:
+        raise ValueError("Сумма вне допустимого диапазона")
+    nonce = os.urandom(_AMOUNT_V2_NONCE_LEN)
+    return bytes([AMOUNT_V2_VERSION]) + nonce + _get_aesgcm().encrypt(nonce, plain, _AMOUNT_V2_AAD)
+
+
+def _decrypt_amount_v2_with(aead: AESGCM, blob: bytes) -> Decimal:
+    if len(blob) != _AMOUNT_V2_LEN or blob[0] != AMOUNT_V2_VERSION:
+        return Decimal("0")
+    nonce = blob[1:1 + _AMOUNT_V2_NONCE_LEN]
+    try:
+        plain = aead.decrypt(nonce, blob[1 + _AMOUNT_V2_NONCE_LEN:], _AMOUNT_V2_AAD)
+    except InvalidTag:
+        return Decimal("0")
+    return Decimal(int.from_bytes(plain, "big", signed=True)).scaleb(-2)
+
+
+def reencrypt_amount_v2(enc: str) -> Optional[bytes]:
+    """
+    Перешифровывает Fernet-токен в формат v2. None — если токен не расшифровывается.
+    """
+    try:
+        decrypted = _get_fernet().decrypt(enc.encode("utf-8")).decode("utf-8")
+        return encrypt_amount_v2(Decimal(decrypted))
+    except (InvalidToken, ValueError, ArithmeticError):
+        return None
+
+
+def _decrypt_amount_with(f: Fernet, aead: AESGCM, enc: AmountCipher) -> Decimal:
     if not enc:
         return Decimal(0)
-    f = _get_fernet()
+    if isinstance(enc, (bytes, bytearray, memoryview)):
+        return _decrypt_amount_v2_with(aead, bytes(enc))
     try:
         decrypted = f.decrypt(enc.encode("utf-8")).decode("utf-8")
         return Decimal(decrypted)
-    except (InvalidToken, ValueError):
-        return Decimal("0")
\ No newline at end of file
+    except (InvalidToken, ValueError, ArithmeticError):
+        return Decimal("0")
+
+
+def decrypt_amount(enc: AmountCipher) -> Decimal:
+    """
+    Расшифровывает сумму транзакции из БД: str — Fernet-токен (v1), bytes — формат v2.
+    """
+    return _decrypt_amount_with(_get_fernet(), _get_aesgcm(), enc)
+
+
+# ===== Пакетная расшифровка сумм =====
+
+_decrypt_pool: ProcessPoolExecutor | None = None
+
+
+def _decrypt_chunk(chunk: list[AmountCipher]) -> list[Decimal]:
+    f = _get_fernet()
+    aead = _get_aesgcm()
+    return [_decrypt_amount_with(f, aead, enc) for enc in chunk]
+
+
+def _get_decrypt_pool() -> ProcessPoolExecutor | None:
+    global _decrypt_pool
+    workers = get_settings().DECRYPT_POOL_WORKERS
+    if workers <= 0:
+        return None
+    if _decrypt_pool is None:
+        # spawn: форк процесса с потоками uvicorn/anyio небезопасен
+        _decrypt_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _decrypt_pool
+
+
+def shutdown_decrypt_pool() -> None:
+    global _decrypt_pool
+    if _decrypt_pool is not None:
+        try:
+            _decrypt_pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            _decrypt_pool = None
+
+
+def decrypt_amounts(values: Iterable[AmountCipher]) -> list[Decimal]:
+    """
+    Пакетно расшифровывает суммы (порядок сохраняется, пустые значения -> 0).
+    Большие пачки (от DECRYPT_POOL_MIN_BATCH) раздаются по пулу процессов,
+    если он включён через DECRYPT_POOL_WORKERS.
+    """
+    tokens = [bytes(v) if isinstance(v, memoryview) else v for v in values]
+    if len(tokens) >= DECRYPT_POOL_MIN_BATCH:
+        pool = _get_decrypt_pool()
+        if pool is not None:
+            chunks = [tokens[i:i + DECRYPT_POOL_CHUNK_SIZE] for i in range(0, len(tokens), DECRYPT_POOL_CHUNK_SIZE)]
+            try:
+                out: list[Decimal] = []
+                for part in pool.map(_decrypt_chunk, chunks):
+                    out.extend(part)
+                return out
+            except (BrokenProcessPool, OSError):
+                log.exception("decrypt pool failed, falling back to inline decryption")
+                shutdown_decrypt_pool()
+    return _decrypt_chunk(tokens)
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Async-движок (asyncpg) для обработчиков `async def`: запрос к БД не блокирует event loop.
+Синхронные обработчики по-прежнему работают через db.session (threadpool).
+"""
+
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.backend.core.config import get_settings
+from app.backend.db.pool_stats import InstrumentedAsyncQueuePool
+
+s = get_settings()
+
+
+def async_database_url(url: str) -> str:
+    """postgresql[+psycopg2]://... -> postgresql+asyncpg://..."""
+    scheme, sep, rest = url.partition("://")
+    if scheme.split("+", 1)[0] in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+async_engine = create_async_engine(
+    s.ASYNC_DATABASE_URL or async_database_url(str(s.DATABASE_URL)),
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_pre_ping=True,
+    pool_recycle=s.SQL_POOL_RECYCLE,
+    pool_size=s.SQL_ASYNC_POOL_SIZE,
+    max_overflow=s.SQL_ASYNC_MAX_OVERFLOW,
+    pool_timeout=s.SQL_POOL_TIMEOUT,
+)
+
+# expire_on_commit=False: после commit атрибуты читаются без ленивой догрузки (в async её нет)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,127 @@
+"""
+Метрики пула соединений SQLAlchemy: сколько ждали checkout, сколько соединений занято,
+сколько раз уходили в overflow и упирались в pool_timeout.
+
+Снимок синхронного и async-пулов отдаёт GET /admin/system/db-pool — по нему подбираются
+SQL_POOL_SIZE/SQL_MAX_OVERFLOW.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.backend.core.constants import SQL_POOL_SLOW_CHECKOUT_MS, SQL_POOL_WAIT_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Счётчики с момента старта воркера (потокобезопасно: checkout идёт из threadpool)."""
+
+    def __init__(self, buckets_ms: tuple[int, ...] = SQL_POOL_WAIT_BUCKETS_MS):
+        self._lock = threading.Lock()
+        self.buckets_ms = tuple(buckets_ms)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.overflow_checkouts = 0
+            self.timeouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.peak_in_use = 0
+            self.wait_histogram = [0] * (len(self.buckets_ms) + 1)  # последний — больше всех границ
+
+    def record_checkout(self, wait_ms: float, *, in_use: int, overflow: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if overflow:
+                self.overflow_checkouts += 1
+            self.wait_histogram[self._bucket(wait_ms)] += 1
+
+    def record_timeout(self, wait_ms: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.wait_histogram[-1] += 1
+
+    def _bucket(self, wait_ms: float) -> int:
+        for i, bound in enumerate(self.buckets_ms):
+            if wait_ms <= bound:
+                return i
+        return len(self.buckets_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            labels = [f"le_{b}ms" for b in self.buckets_ms] + ["inf"]
+            return {
+                "checkouts": self.checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+                "peak_in_use": self.peak_in_use,
+                "wait_histogram": dict(zip(labels, self.wait_histogram)),
+            }
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, замеряющий ожидание соединения и занятость пула."""
+
+    def __init__(self, *args: Any, stats: Optional[PoolStats] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.stats = stats or pool_stats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            wait_ms = (time.perf_counter() - started) * 1000
+            self.stats.record_timeout(wait_ms)
+            logger.warning("Таймаут пула БД после %.0f мс: %s", wait_ms, self.status())
+            raise
+        wait_ms = (time.perf_counter() - started) * 1000
+        in_use = self.checkedout()
+        self.stats.record_checkout(wait_ms, in_use=in_use, overflow=in_use > self.size())
+        if wait_ms >= SQL_POOL_SLOW_CHECKOUT_MS:
+            logger.warning("Долгий checkout из пула БД: %.0f мс, %s", wait_ms, self.status())
+        return conn
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """То же для async-движка (asyncpg)."""
+
+    def __init__(self, *args: Any, stats: Optional[PoolStats] = None, **kwargs: Any):
+        super().__init__(*args, stats=stats or async_pool_stats, **kwargs)
+
+
+def pool_status(pool: Any) -> dict[str, Any]:
+    """Текущее состояние пула плюс накопленные счётчики."""
+    out: dict[str, Any] = {}
+    if isinstance(pool, QueuePool):
+        out.update(
+            size=pool.size(),
+            in_use=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    stats = getattr(pool, "stats", None)
+    if isinstance(stats, PoolStats):
+        out.update(stats.snapshot())
+    return out
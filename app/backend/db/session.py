@@ -1,12 +1,16 @@
+from typing import Callable, Iterator, Optional, TypeVar
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.backend.core.config import get_settings
+from app.backend.db.pool_stats import InstrumentedQueuePool
 
 s = get_settings()
 
 engine = create_engine(
     s.DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
     pool_pre_ping=True,
     pool_recycle=s.SQL_POOL_RECYCLE,
     pool_size=s.SQL_POOL_SIZE,
@@ -17,8 +21,64 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
+T = TypeVar("T")
+
+
+class LazySession:
+    """
+    Прокси сессии для get_db: Session создаётся при первом обращении к любому атрибуту,
+    соединение берётся из пула при первом запросе. Обработчик, ответивший из кэша,
+    пул не трогает.
+    """
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory: sessionmaker = SessionLocal):
+        self._factory = factory
+        self._session: Optional[Session] = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def _get(self) -> Session:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+    def __contains__(self, instance) -> bool:
+        return self._session is not None and instance in self._session
+
+    def __iter__(self):
+        return iter(self._session) if self._session is not None else iter(())
+
+    def __enter__(self) -> Session:
+        return self._get()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def with_session(fn: Callable[..., T], *args) -> T:
+    """
+    fn(db, *args) в собственной сессии (для run_in_threadpool). Загрузчики cached_json
+    выполняются общей задачей, которая переживает отменённый запрос: сессия запроса из
+    get_db к тому времени уже закрыта, поэтому им нужна своя.
+    """
+    with SessionLocal() as db:
+        return fn(db, *args)
+
+
+def get_db() -> Iterator[Session]:
+    db = LazySession()
     try:
         yield db
     finally:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import sqlalchemy as sa
-from sqlalchemy import Column, Text, String, DateTime, Boolean, ForeignKey, Numeric, Date
+from sqlalchemy import Column, Text, String, DateTime, Boolean, ForeignKey, Numeric, Date, LargeBinary
 from sqlalchemy.orm import relationship
 
 from app.backend.db.base import Base
@@ -85,7 +85,8 @@ class BudgetTransaction(Base):
     category_id = Column(sa.BigInteger, ForeignKey("pf.budget_categories.id", ondelete="SET NULL"), nullable=True)
 
     amount = Column(Numeric(20, 2), nullable=False)  # Оставляем для обратной совместимости и миграции
-    amount_encrypted = Column(Text, nullable=True)  # Зашифрованная сумма
+    amount_encrypted = Column(Text, nullable=True)  # Зашифрованная сумма (v1, Fernet)
+    amount_encrypted_v2 = Column(LargeBinary, nullable=True)  # v2: AES-GCM над копейками, bytea
     currency = Column(String(3), nullable=False, server_default="RUB")
     description = Column(Text, nullable=True)
 
@@ -96,6 +97,50 @@ class BudgetTransaction(Base):
     category = relationship("BudgetCategory")
 
 
+class BudgetMonthlyRollup(Base):
+    """
+    Помесячные агрегаты транзакций пользователя. Сумма хранится зашифрованной (формат v2),
+    обновляется в той же транзакции БД, что и создание/удаление операций.
+    """
+    __tablename__ = "budget_monthly_rollups"
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "user_id", "year", "month", "type", "account_id", "contra_account_id", "category_id",
+            name="uq_budget_monthly_rollups_key",
+        ),
+        {"schema": "pf"},
+    )
+
+    id = Column(sa.BigInteger, primary_key=True)
+    user_id = Column(
+        sa.BigInteger,
+        ForeignKey("pf.users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    year = Column(sa.SmallInteger, nullable=False)
+    month = Column(sa.SmallInteger, nullable=False)
+    type = Column(String(10), nullable=False)
+
+    account_id = Column(sa.BigInteger, ForeignKey("pf.budget_accounts.id", ondelete="CASCADE"), nullable=False)
+    # 0 — нет контр-счёта/категории (без FK: удалённые счёт/категория ведут себя как NULL в транзакциях)
+    contra_account_id = Column(sa.BigInteger, nullable=False, server_default="0")
+    category_id = Column(sa.BigInteger, nullable=False, server_default="0")
+
+    amount_encrypted = Column(LargeBinary, nullable=False)
+    tx_count = Column(sa.Integer, nullable=False, server_default="0")
+
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=sa.func.now(), onupdate=sa.func.now())
+
+
+class BudgetRollupState(Base):
+    """Отметка, что агрегаты пользователя построены и поддерживаются инкрементально."""
+    __tablename__ = "budget_rollup_state"
+    __table_args__ = {"schema": "pf"}
+
+    user_id = Column(sa.BigInteger, ForeignKey("pf.users.id", ondelete="CASCADE"), primary_key=True)
+    rebuilt_at = Column(DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+
+
 
 class BudgetObligation(Base):
     __tablename__ = "budget_obligations"
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from datetime import datetime
+from sqlalchemy import BigInteger, DateTime, Float, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.backend.db.base import Base
+
+# --- Хранилище свечей (партиции по interval) ---
+
+class Candle(Base):
+    __tablename__ = "candles"
+
+    figi: Mapped[str] = mapped_column(Text, primary_key=True)
+    interval: Mapped[str] = mapped_column(Text, primary_key=True)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    open: Mapped[float] = mapped_column(Float, nullable=False)
+    high: Mapped[float] = mapped_column(Float, nullable=False)
+    low: Mapped[float] = mapped_column(Float, nullable=False)
+    close: Mapped[float] = mapped_column(Float, nullable=False)
+    volume: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class CandleRange(Base):
+    """Загруженный диапазон [range_start, range_end) свечей FIGI на интервале."""
+    __tablename__ = "candle_ranges"
+
+    figi: Mapped[str] = mapped_column(Text, primary_key=True)
+    interval: Mapped[str] = mapped_column(Text, primary_key=True)
+    range_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    range_end: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
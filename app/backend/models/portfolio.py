@@ -61,3 +61,4 @@ class Trade(Base):
 Index("trades_portfolio_idx", Trade.portfolio_id)
 Index("trades_figi_idx",      Trade.figi)
 Index("trades_dt_idx",        Trade.trade_at)
+Index("trades_position_idx",  Trade.portfolio_id, Trade.figi, Trade.trade_at, Trade.id)
@@ -5,12 +5,21 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, field_validator
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-
-from app.backend.core.security import verify_password, hash_password, encrypt_token
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.core.security import (
+    PasswordHasherBusy,
+    encrypt_token,
+    hash_password_async,
+    verify_and_update_password_async,
+)
 from app.backend.core.auth import create_access_token
+from app.backend.core.rate_limit import ip_rate_limit
 from app.backend.core.constants import (
+    AUTH_BUSY_RETRY_AFTER_SEC,
+    ERROR_AUTH_BUSY,
+    HTTP_503_SERVICE_UNAVAILABLE,
     PHONE_PATTERN,
     ERROR_PHONE_FORMAT,
     ERROR_INVALID_CREDENTIALS,
@@ -18,9 +27,13 @@ from app.backend.core.constants import (
     ERROR_SERVICE_LOGIN_EXISTS,
     HTTP_401_UNAUTHORIZED,
     HTTP_409_CONFLICT,
+    LOGIN_RATE_LIMIT,
+    LOGIN_RATE_WINDOW_SEC,
+    REGISTER_RATE_LIMIT,
+    REGISTER_RATE_WINDOW_SEC,
 )
 from app.backend.core.validators import validate_email, validate_password, validate_service_login
-from app.backend.db.session import get_db
+from app.backend.db.async_session import get_async_db
 from app.backend.models.user import User
 from app.backend.models.admin import AdminCategoryTemplate
 from app.backend.models.budget import BudgetCategory
@@ -30,21 +43,25 @@ import re
 router = APIRouter()
 settings = get_settings()
 
-def _apply_auto_category_templates(db: Session, user_id: int) -> int:
+async def _apply_auto_category_templates(db: AsyncSession, user_id: int) -> int:
     templates = (
-        db.query(AdminCategoryTemplate)
-        .filter(AdminCategoryTemplate.apply_to_new_users.is_(True))
-        .order_by(AdminCategoryTemplate.id)
-        .all()
-    )
+        await db.scalars(
+            select(AdminCategoryTemplate)
+            .where(AdminCategoryTemplate.apply_to_new_users.is_(True))
+            .order_by(AdminCategoryTemplate.id)
+        )
+    ).all()
+    existing = {
+        (kind, name)
+        for kind, name in (
+            await db.execute(
+                select(BudgetCategory.kind, BudgetCategory.name).where(BudgetCategory.user_id == user_id)
+            )
+        ).all()
+    }
     created = 0
     for t in templates:
-        exists = db.query(BudgetCategory).filter(
-            BudgetCategory.user_id == user_id,
-            BudgetCategory.kind == t.kind,
-            BudgetCategory.name == t.name,
-        ).first()
-        if exists:
+        if (t.kind, t.name) in existing:
             continue
         db.add(BudgetCategory(
             user_id=user_id,
@@ -53,10 +70,19 @@ def _apply_auto_category_templates(db: Session, user_id: int) -> int:
             monthly_limit=t.monthly_limit,
             is_active=True,
         ))
+        existing.add((t.kind, t.name))
         created += 1
     return created
 
 
+def _busy() -> HTTPException:
+    return HTTPException(
+        HTTP_503_SERVICE_UNAVAILABLE,
+        ERROR_AUTH_BUSY,
+        headers={"Retry-After": str(AUTH_BUSY_RETRY_AFTER_SEC)},
+    )
+
+
 class LoginIn(BaseModel):
     email: str
     password: str
@@ -123,17 +149,38 @@ class LoginOut(BaseModel):
     is_staff: bool = False
 
 
-@router.post("/login", response_model=LoginOut)
-async def login(payload: LoginIn, db: Session = Depends(get_db)):
+@router.post(
+    "/login",
+    response_model=LoginOut,
+    dependencies=[Depends(ip_rate_limit("login", LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW_SEC, fail_closed=True))],
+)
+async def login(payload: LoginIn, db: AsyncSession = Depends(get_async_db)):
     normalized_email = payload.email.strip().lower()
-    user = db.query(User).filter(func.lower(User.email) == normalized_email).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+    row = (await db.execute(
+        select(User.id, User.password_hash).where(func.lower(User.email) == normalized_email)
+    )).first()
+    if not row:
+        raise HTTPException(HTTP_401_UNAUTHORIZED, ERROR_INVALID_CREDENTIALS)
+    user_id, password_hash = row
+    # пока задача ждёт очереди bcrypt, транзакция не держит соединение пула
+    await db.rollback()
+    try:
+        ok, new_hash = await verify_and_update_password_async(payload.password, password_hash)
+    except PasswordHasherBusy:
+        raise _busy()
+    if not ok:
+        raise HTTPException(HTTP_401_UNAUTHORIZED, ERROR_INVALID_CREDENTIALS)
+    user = await db.get(User, user_id)
+    if not user:
         raise HTTPException(HTTP_401_UNAUTHORIZED, ERROR_INVALID_CREDENTIALS)
+    if new_hash:
+        # изменилась стоимость bcrypt — сохраняем хэш с новыми параметрами
+        user.password_hash = new_hash
     if not (user.full_name or "").strip():
         user.full_name = (user.tg_username or user.email.split("@", 1)[0] or "Пользователь").strip()
     token = create_access_token(user.id, settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     user.last_login_at = datetime.now(timezone.utc)
-    db.commit()
+    await db.commit()
     return LoginOut(
         access_token=token,
         user_id=user.id,
@@ -145,22 +192,33 @@ async def login(payload: LoginIn, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/register", response_model=LoginOut)
-async def register(payload: RegisterIn, db: Session = Depends(get_db)):
+@router.post(
+    "/register",
+    response_model=LoginOut,
+    dependencies=[Depends(ip_rate_limit("register", REGISTER_RATE_LIMIT, REGISTER_RATE_WINDOW_SEC, fail_closed=True))],
+)
+async def register(payload: RegisterIn, db: AsyncSession = Depends(get_async_db)):
     normalized_email = payload.email.strip().lower()
-    existing_user = db.query(User).filter(func.lower(User.email) == normalized_email).first()
+    existing_user = (await db.scalars(select(User.id).where(func.lower(User.email) == normalized_email))).first()
     if existing_user:
         raise HTTPException(HTTP_409_CONFLICT, ERROR_USER_EXISTS)
-    existing_service_login = db.query(User).filter(
-        func.lower(User.tg_username) == payload.tg_username.strip().lower()
+    existing_service_login = (
+        await db.scalars(select(User.id).where(func.lower(User.tg_username) == payload.tg_username.strip().lower()))
     ).first()
     if existing_service_login:
         raise HTTPException(HTTP_409_CONFLICT, ERROR_SERVICE_LOGIN_EXISTS)
+    # пока задача ждёт очереди bcrypt, транзакция не держит соединение пула
+    await db.rollback()
+
+    try:
+        password_hash = await hash_password_async(payload.password)
+    except PasswordHasherBusy:
+        raise _busy()
 
     user = User(
         email=normalized_email,
         full_name=payload.full_name.strip(),
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
         tg_username=payload.tg_username,
         phone=payload.phone,
         created_at=datetime.now(timezone.utc),
@@ -170,10 +228,10 @@ async def register(payload: RegisterIn, db: Session = Depends(get_db)):
         user.tinkoff_token_enc = encrypt_token(payload.tinkoff_token)
 
     db.add(user)
-    db.flush()  # нужен user.id до общего commit
-    _apply_auto_category_templates(db, user.id)
-    db.commit()
-    db.refresh(user)
+    await db.flush()  # нужен user.id до общего commit
+    await _apply_auto_category_templates(db, user.id)
+    await db.commit()
+    await db.refresh(user)
 
     token = create_access_token(user.id, settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return LoginOut(
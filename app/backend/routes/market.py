@@ -1,43 +1,63 @@
 from __future__ import annotations
 
+import json
+import math
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, ConfigDict
-from starlette.concurrency import run_in_threadpool
-from tinkoff.invest import Client
+from sqlalchemy import select
 from tinkoff.invest.exceptions import RequestError, UnauthenticatedError
 from tinkoff.invest.schemas import CandleInterval
 
 from app.backend.core.config import get_settings
 from app.backend.core.auth import get_current_user
 from app.backend.core.security import decrypt_token
-from app.backend.core.cache import cached_json, rate_limit
+from app.backend.core.cache import cached_json, cached_json_many
+from app.backend.core.rate_limit import user_rate_limit
 from app.backend.core.constants import (
     BOND_DEFAULT_NOMINAL,
     NANO_TO_FLOAT_DIVISOR,
     PERCENT_TO_DECIMAL,
-    INSTRUMENTS_CACHE_TTL_SEC,
     QUOTE_RATE_LIMIT,
     QUOTE_RATE_WINDOW_SEC,
     QUOTE_CACHE_TTL_SEC,
+    QUOTE_STALE_TTL_SEC,
     CANDLES_RATE_LIMIT,
     CANDLES_RATE_WINDOW_SEC,
-    CANDLES_CACHE_TTL_SEC,
     CANDLES_DEFAULT_DAYS,
-    BATCH_QUOTES_CACHE_TTL_SEC,
+    CANDLES_MAX_WINDOW_DAYS,
     ERROR_EMPTY_TICKER,
     ERROR_CACHE_EMPTY,
+    ERROR_CANDLES_WINDOW_TOO_LONG,
     ERROR_FIGI_NOT_FOUND_TEMPLATE,
+    ERROR_TOO_MANY_TICKERS,
+    RESOLVE_BATCH_MAX_TICKERS,
     ERROR_NO_DATA_TEMPLATE,
     ERROR_NO_TINKOFF_TOKEN,
     ERROR_TINKOFF_TOKEN_INVALID,
+    ERROR_PORTFOLIO_ACCESS_DENIED,
+    PORTFOLIO_STREAM_KEEPALIVE_SEC,
+    INSTRUMENT_SEARCH_DEFAULT_LIMIT,
+    INSTRUMENT_SEARCH_MAX_LIMIT,
     HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
     HTTP_503_SERVICE_UNAVAILABLE,
 )
+from app.backend.db.async_session import AsyncSessionLocal
+from app.backend.models.portfolio import Portfolio, Position
 from app.backend.models.user import User
+from app.backend.services import bond_analytics, market_stream
+from app.backend.services.candle_store import load_candles
+from app.backend.services.instrument_registry import instrument_registry
+from app.backend.services.instrument_search import search_index
+from app.backend.services.portfolio_valuation import UNKNOWN_CURRENCY, value_price
+from app.backend.services.price_fanout import PriceFanout
+from app.backend.services.tinkoff_clients import TinkoffUnavailable
+from app.backend.services.tinkoff_scheduler import tinkoff_scheduler
 
 settings = get_settings()
 router = APIRouter()
@@ -55,46 +75,6 @@ INTERVAL_MAP = {
     "1d": CandleInterval.CANDLE_INTERVAL_DAY,
 }
 
-# --- Кэши инструментов в памяти процесса (быстрый словарь) ---
-INSTR_CACHE: Dict[str, List[dict]] = {}
-FIGI_CACHE: Dict[str, dict] = {}
-
-def _add_many(cache_t: Dict[str, List[dict]], cache_f: Dict[str, dict], items, cls: str):
-    for it in items:
-        t = (getattr(it, "ticker", None) or "").strip().upper()
-        if not t:
-            continue
-        rec = {
-            "figi": getattr(it, "figi", None),
-            "class": cls,
-            "name": getattr(it, "name", None),
-            "currency": getattr(it, "currency", None),
-            "isin": getattr(it, "isin", None),
-            "ticker": t,
-        }
-        if cls == "bond":
-            nominal = q2f(getattr(it, "nominal", None)) or BOND_DEFAULT_NOMINAL
-            rec["nominal"] = nominal
-        cache_t.setdefault(t, []).append({k: rec.get(k) for k in ("figi", "class", "name", "currency", "isin", "nominal", "ticker")})
-        if rec["figi"]:
-            cache_f[rec["figi"]] = rec
-
-def refresh_instruments_cache(token: str | None = None):
-    t_cache: Dict[str, List[dict]] = {}
-    f_cache: Dict[str, dict] = {}
-    use_token = token or settings.TINKOFF_TOKEN
-    if not use_token:
-        return
-    with Client(use_token) as client:
-        shares = client.instruments.shares().instruments
-        bonds = client.instruments.bonds().instruments
-        etfs = client.instruments.etfs().instruments
-    _add_many(t_cache, f_cache, shares, "share")
-    _add_many(t_cache, f_cache, bonds, "bond")
-    _add_many(t_cache, f_cache, etfs, "etf")
-    INSTR_CACHE.clear(); INSTR_CACHE.update(t_cache)
-    FIGI_CACHE.clear(); FIGI_CACHE.update(f_cache)
-
 class ResolveItem(BaseModel):
     figi: str
     class_: str = Field(alias="class")
@@ -108,6 +88,14 @@ class ResolveOut(BaseModel):
     ticker: str
     results: List[ResolveItem]
 
+class SearchItem(ResolveItem):
+    ticker: str
+    score: float
+
+class SearchOut(BaseModel):
+    query: str
+    results: List[SearchItem]
+
 class QuoteOut(BaseModel):
     figi: str
     price: float
@@ -119,6 +107,10 @@ class QuoteOut(BaseModel):
     nominal: float | None = None
     aci: float | None = None
     dirty_price: float | None = None
+    ytm: float | None = None  # доходность к погашению, % годовых (эффективная)
+    modified_duration: float | None = None  # лет
+    as_of: datetime | None = None  # время цены: сделка из потока или запрос к API
+    stale: bool = False  # Tinkoff недоступен — последняя известная цена
     model_config = ConfigDict(populate_by_name=True)
 
 class CandleOut(BaseModel):
@@ -129,10 +121,6 @@ class CandleOut(BaseModel):
     close: float
     volume: int
 
-@router.on_event("startup")
-async def _startup():
-    await run_in_threadpool(refresh_instruments_cache)
-
 # --- helpers ---
 def _token_from_user(user: User) -> str:
     token = decrypt_token(getattr(user, "tinkoff_token_enc", "") or "")
@@ -141,7 +129,20 @@ def _token_from_user(user: User) -> str:
     return token
 
 
+async def _ensure_instruments(user: User) -> None:
+    """Пустой справочник (Redis пуст, фоновая сборка не успела) — собрать с токеном пользователя."""
+    if instrument_registry:
+        return
+    token = _token_from_user(user)
+    try:
+        await instrument_registry.ensure(token)
+    except Exception as exc:
+        _reraise_tinkoff_error(exc)
+
+
 def _reraise_tinkoff_error(exc: Exception) -> None:
+    if isinstance(exc, TinkoffUnavailable):
+        raise HTTPException(HTTP_503_SERVICE_UNAVAILABLE, "Tinkoff API временно недоступен") from exc
     if isinstance(exc, UnauthenticatedError):
         raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_TINKOFF_TOKEN_INVALID) from exc
     if isinstance(exc, RequestError):
@@ -149,54 +150,48 @@ def _reraise_tinkoff_error(exc: Exception) -> None:
     raise exc
 
 
-def _get_last_price_blocking(figi: str, token: str) -> float:
-    try:
-        with Client(token) as client:
-            lp = client.market_data.get_last_prices(figi=[figi])
-            if not lp.last_prices:
-                raise HTTPException(HTTP_404_NOT_FOUND, ERROR_NO_DATA_TEMPLATE.format(figi=figi))
-            return q2f(lp.last_prices[0].price)
-    except HTTPException:
-        raise
-    except Exception as exc:
-        _reraise_tinkoff_error(exc)
+async def _get_live_price(figi: str, token: str) -> market_stream.LivePrice:
+    prices = await _get_live_prices([figi], token)
+    if figi not in prices:
+        raise HTTPException(HTTP_404_NOT_FOUND, ERROR_NO_DATA_TEMPLATE.format(figi=figi))
+    return prices[figi]
 
 
-def _get_last_prices_blocking(figis: List[str], token: str) -> Dict[str, float]:
+async def _get_live_prices(figis: List[str], token: str) -> Dict[str, market_stream.LivePrice]:
+    """Последние цены со временем сделки; они же запоминаются как последние известные."""
+    # одновременные запросы разных пользователей планировщик склеивает в один вызов
     try:
-        with Client(token) as client:
-            lp = client.market_data.get_last_prices(figi=figis)
-            return {it.figi: q2f(it.price) for it in lp.last_prices}
-    except HTTPException:
-        raise
+        prices = await tinkoff_scheduler.last_prices(figis, token)
     except Exception as exc:
         _reraise_tinkoff_error(exc)
+    await market_stream.remember_prices(prices)
+    return prices
+
+
+async def _get_last_prices(figis: List[str], token: str) -> Dict[str, float]:
+    return {figi: lp.price for figi, lp in (await _get_live_prices(figis, token)).items()}
 
 
-def _get_candles_blocking(figi: str, from_dt: datetime, to_dt: datetime, interval: CandleInterval, token: str):
+async def _get_candles(figi: str, from_dt: datetime, to_dt: datetime, interval: CandleInterval, token: str):
     try:
-        with Client(token) as client:
-            return client.market_data.get_candles(figi=figi, from_=from_dt, to=to_dt, interval=interval).candles
-    except HTTPException:
-        raise
+        resp = await tinkoff_scheduler.call(
+            token, "market_data", lambda c: c.market_data.get_candles(figi=figi, from_=from_dt, to=to_dt, interval=interval)
+        )
     except Exception as exc:
         _reraise_tinkoff_error(exc)
+    return resp.candles
 
-def _pick_figi_for_ticker(ticker: str, class_hint: str | None = None) -> dict:
-    t = ticker.strip().upper()
-    if not t:
-        raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_EMPTY_TICKER)
-    if not INSTR_CACHE:
+def _resolve_tickers(tickers: List[str], class_hint: str | None = None) -> List[tuple[str, Optional[dict]]]:
+    """(тикер, запись справочника или None) для каждого тикера — один проход по снимку."""
+    snapshot = instrument_registry.snapshot
+    if not snapshot:
         raise HTTPException(HTTP_503_SERVICE_UNAVAILABLE, ERROR_CACHE_EMPTY)
-    cand = INSTR_CACHE.get(t, [])
-    if class_hint:
-        cand = [x for x in cand if x["class"] == class_hint]
-    if not cand:
-        raise HTTPException(HTTP_404_NOT_FOUND, ERROR_FIGI_NOT_FOUND_TEMPLATE.format(ticker=t))
-    return cand[0]
-
-def _normalize_quote(figi: str, raw_price: float) -> QuoteOut:
-    meta = FIGI_CACHE.get(figi, {})
+    normalized = [t.strip().upper() for t in tickers]
+    rows = snapshot.resolve_many(normalized, class_hint)
+    return [(t, snapshot.record(int(row)) if row >= 0 else None) for t, row in zip(normalized, rows)]
+
+def _normalize_quote(figi: str, raw_price: float, as_of: float | None = None, stale: bool = False) -> QuoteOut:
+    meta = instrument_registry.snapshot.by_figi(figi) or {}
     cls = meta.get("class")
     out_common = {
         "figi": figi,
@@ -204,6 +199,8 @@ def _normalize_quote(figi: str, raw_price: float) -> QuoteOut:
         "ticker": meta.get("ticker"),
         "name": meta.get("name"),
         "class": cls,
+        "as_of": datetime.fromtimestamp(as_of, timezone.utc) if as_of is not None else datetime.now(timezone.utc),
+        "stale": stale,
     }
     if cls == "bond":
         nominal = meta.get("nominal") or BOND_DEFAULT_NOMINAL
@@ -212,6 +209,91 @@ def _normalize_quote(figi: str, raw_price: float) -> QuoteOut:
         return QuoteOut(price=price_clean, price_percent=price_percent, nominal=nominal, **out_common)
     return QuoteOut(price=raw_price, **out_common)
 
+
+def _apply_bond_analytics(quotes: Dict[str, dict], schedules: Dict[str, dict]) -> None:
+    """
+    НКД, грязная цена, доходность и дюрация облигаций — один расчёт на всю пачку.
+    Дописывает поля в quotes: словари должны быть свои, а не значения из кэша.
+    """
+    figis = [f for f in schedules if f in quotes and quotes[f].get("price_percent") is not None]
+    if not figis:
+        return
+    snapshot = instrument_registry.snapshot
+    metrics = bond_analytics.bond_metrics(
+        [quotes[f]["price_percent"] for f in figis],
+        [quotes[f]["nominal"] for f in figis],
+        [(snapshot.by_figi(f) or {}).get("maturity") for f in figis],
+        [schedules[f] for f in figis],
+    )
+    columns = {name: values.tolist() for name, values in metrics.items()}
+    for i, figi in enumerate(figis):
+        quotes[figi].update({name: None if math.isnan(col[i]) else col[i] for name, col in columns.items()})
+
+
+def _with_bond_analytics(quotes: Dict[str, dict], user: User) -> None:
+    """Аналитика по уже загруженным расписаниям; недостающие грузятся в фоне, котировки их не ждут."""
+    bonds = [f for f, q in quotes.items() if q.get("class_") == "bond"]
+    if not bonds:
+        return
+    bond_analytics.prefetch_schedules(bonds, _token_from_user(user))
+    _apply_bond_analytics(quotes, bond_analytics.known_schedules(bonds))
+
+
+def _stream_quote(figi: str, lp: market_stream.LivePrice) -> dict:
+    quotes = {figi: _normalize_quote(figi, lp.price, lp.as_of).model_dump(mode="json")}
+    # синхронный путь: только расписания, уже загруженные запросами котировок
+    _apply_bond_analytics(quotes, bond_analytics.known_schedules([figi]))
+    return QuoteOut(**quotes[figi]).model_dump(mode="json", by_alias=True)
+
+
+# push живых цен: котировка по FIGI считается один раз на воркер для всех подписчиков
+price_fanout = PriceFanout(_stream_quote)
+
+def _quote_key(figi: str) -> str:
+    return f"quote:{figi}"
+
+
+async def _cached_quotes(figis: List[str], user: User) -> Dict[str, dict]:
+    """
+    Котировки по FIGI: сначала цены из потока (один HMGET), остальные — из общего
+    хранилища quote:{figi} (его же читает /quote/{figi}): один MGET, недостающие —
+    одним get_last_prices. Запрошенные FIGI попадают в подписку потока.
+    Если Tinkoff недоступен, остальные — последние известные цены с stale=True.
+    Облигации дополняются НКД, грязной ценой, доходностью и дюрацией одним расчётом.
+    """
+    await market_stream.watch(figis)
+    live = await market_stream.last_prices(figis)
+    out = {figi: _normalize_quote(figi, lp.price, lp.as_of).model_dump(mode="json") for figi, lp in live.items()}
+    rest = [f for f in figis if f not in live]
+
+    async def _load(missing: list[str]) -> Dict[str, dict]:
+        prices_map = await _get_live_prices(missing, _token_from_user(user))
+        return {figi: _normalize_quote(figi, lp.price, lp.as_of).model_dump(mode="json") for figi, lp in prices_map.items()}
+
+    if rest:
+        try:
+            cached = await cached_json_many(
+                rest, _quote_key, ttl_sec=QUOTE_CACHE_TTL_SEC, loader=_load, stale_ttl_sec=QUOTE_STALE_TTL_SEC
+            )
+            # значения общие с L1-кэшем, а аналитика облигаций дописывает поля — берём копии
+            out.update({figi: dict(q) for figi, q in cached.items()})
+        except HTTPException as exc:
+            fallback = await _last_good_quotes(rest) if exc.status_code == HTTP_503_SERVICE_UNAVAILABLE else {}
+            if not fallback:
+                raise
+            out.update(fallback)
+    _with_bond_analytics(out, user)
+    return out
+
+
+async def _last_good_quotes(figis: List[str]) -> Dict[str, dict]:
+    """Котировки по последним известным ценам (market:last_good_prices) — при недоступном Tinkoff."""
+    prices = await market_stream.last_good_prices(figis)
+    return {
+        figi: _normalize_quote(figi, lp.price, lp.as_of, stale=True).model_dump(mode="json")
+        for figi, lp in prices.items()
+    }
+
 # --- endpoints ---
 
 @router.get("/resolve", response_model=ResolveOut)
@@ -220,37 +302,59 @@ async def resolve(ticker: str, user: User = Depends(get_current_user)):
     if not t:
         raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_EMPTY_TICKER)
 
-    if not INSTR_CACHE:
-        token = _token_from_user(user)
-        await run_in_threadpool(refresh_instruments_cache, token)
-
-    key = f"resolve:{t}"
-    async def _load():
-        items = INSTR_CACHE.get(t, [])
-        return {
-            "ticker": t,
-            "results": [
-                {"figi": i["figi"], "class": i["class"], "name": i["name"],
-                 "currency": i.get("currency"), "isin": i.get("isin"), "nominal": i.get("nominal")}
-                for i in items
-            ]
-        }
-    data = await cached_json(key, ttl_sec=INSTRUMENTS_CACHE_TTL_SEC, loader=_load)
-    return ResolveOut(**data)
-
-@router.get("/quote/{figi}", response_model=QuoteOut)
+    await _ensure_instruments(user)
+    # справочник в памяти воркера — Redis-кэш здесь был бы медленнее самого поиска
+    items = instrument_registry.snapshot.by_ticker(t)
+    return ResolveOut(ticker=t, results=[ResolveItem(**i) for i in items])
+
+@router.get("/search", response_model=SearchOut)
+async def search_instruments(
+    q: str = Query(..., min_length=1, max_length=64),
+    cls: Optional[List[str]] = Query(None, description="share / bond / etf"),
+    limit: int = Query(INSTRUMENT_SEARCH_DEFAULT_LIMIT, ge=1, le=INSTRUMENT_SEARCH_MAX_LIMIT),
+    user: User = Depends(get_current_user),
+):
+    """Автодополнение по тикеру, ISIN и названию с ранжированием."""
+    await _ensure_instruments(user)
+    index = await search_index(instrument_registry.snapshot)
+    hits = index.search(q, classes=cls, limit=limit)
+    # строки — из снимка, по которому построен индекс (справочник мог смениться)
+    return SearchOut(query=q, results=[SearchItem(**index.snapshot.record(row), score=round(score, 2)) for row, score in hits])
+
+@router.get(
+    "/quote/{figi}",
+    response_model=QuoteOut,
+    dependencies=[Depends(user_rate_limit("quote", QUOTE_RATE_LIMIT, QUOTE_RATE_WINDOW_SEC, params=("figi",)))],
+)
 async def get_quote(figi: str, user: User = Depends(get_current_user)):
     token = _token_from_user(user)
-    await rate_limit(f"user:{user.id}:quote:{figi}", limit=QUOTE_RATE_LIMIT, window_sec=QUOTE_RATE_WINDOW_SEC)
-
-    key = f"quote:{figi}"
-    async def _load():
-        raw = await run_in_threadpool(_get_last_price_blocking, figi, token)
-        return _normalize_quote(figi, raw).model_dump()
-    data = await cached_json(key, ttl_sec=QUOTE_CACHE_TTL_SEC, loader=_load)
-    return QuoteOut(**data)
-
-@router.get("/candles/{figi}", response_model=list[CandleOut])
+    await market_stream.watch([figi])
+    live = await market_stream.last_prices([figi])
+    if figi in live:
+        data = _normalize_quote(figi, live[figi].price, live[figi].as_of).model_dump(mode="json")
+    else:
+        async def _load():
+            lp = await _get_live_price(figi, token)
+            return _normalize_quote(figi, lp.price, lp.as_of).model_dump(mode="json")
+        # популярные FIGI: одна загрузка на все воркеры, устаревшая цена отдаётся на время обновления
+        try:
+            data = await cached_json(
+                _quote_key(figi), ttl_sec=QUOTE_CACHE_TTL_SEC, loader=_load, stale_ttl_sec=QUOTE_STALE_TTL_SEC, lock=True
+            )
+        except HTTPException as exc:
+            fallback = await _last_good_quotes([figi]) if exc.status_code == HTTP_503_SERVICE_UNAVAILABLE else {}
+            if not fallback:
+                raise
+            data = fallback[figi]
+    quotes = {figi: dict(data)}
+    _with_bond_analytics(quotes, user)
+    return QuoteOut(**quotes[figi])
+
+@router.get(
+    "/candles/{figi}",
+    response_model=list[CandleOut],
+    dependencies=[Depends(user_rate_limit("candles", CANDLES_RATE_LIMIT, CANDLES_RATE_WINDOW_SEC, params=("figi", "interval")))],
+)
 async def get_candles(
     figi: str,
     interval: str = Query("1d", pattern="^(1min|5min|15min|1h|1d)$"),
@@ -262,19 +366,21 @@ async def get_candles(
     ci = INTERVAL_MAP[interval]
     to_dt = (datetime.fromisoformat((to or datetime.now(timezone.utc).isoformat()).replace("Z", "+00:00"))
              if to else datetime.now(timezone.utc))
+    max_days = CANDLES_MAX_WINDOW_DAYS[interval]
     from_dt = (datetime.fromisoformat((from_ or "").replace("Z", "+00:00"))
-               if from_ else to_dt - timedelta(days=CANDLES_DEFAULT_DAYS))
-
-    await rate_limit(f"user:{user.id}:candles:{figi}:{interval}", limit=CANDLES_RATE_LIMIT, window_sec=CANDLES_RATE_WINDOW_SEC)
-
-    key = f"candles:{figi}:{interval}:{from_dt.isoformat()}:{to_dt.isoformat()}"
-
-    async def _load():
-        candles = await run_in_threadpool(_get_candles_blocking, figi, from_dt, to_dt, ci, token)
-        return [CandleOut(time=c.time, open=q2f(c.open), high=q2f(c.high), low=q2f(c.low), close=q2f(c.close), volume=c.volume).model_dump()
-                for c in candles]
-
-    data = await cached_json(key, ttl_sec=CANDLES_CACHE_TTL_SEC, loader=_load)
+               if from_ else to_dt - timedelta(days=min(CANDLES_DEFAULT_DAYS, max_days)))
+    # from_ без зоны — UTC, как в load_candles
+    span = to_dt.replace(tzinfo=to_dt.tzinfo or timezone.utc) - from_dt.replace(tzinfo=from_dt.tzinfo or timezone.utc)
+    if span > timedelta(days=max_days):
+        raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_CANDLES_WINDOW_TOO_LONG.format(interval=interval, days=max_days))
+
+    async def _fetch(start: datetime, end: datetime) -> list[dict]:
+        candles = await _get_candles(figi, start, end, ci, token)
+        return [{"time": c.time, "open": q2f(c.open), "high": q2f(c.high), "low": q2f(c.low),
+                 "close": q2f(c.close), "volume": c.volume} for c in candles]
+
+    # история — из pf.candles (из API только пробелы), незавершённый хвост — из кэша
+    data = await load_candles(figi, interval, from_dt, to_dt, _fetch)
     return [CandleOut(**it) for it in data]
 
 class BatchTickersIn(BaseModel):
@@ -287,46 +393,48 @@ class BatchFigisIn(BaseModel):
 class BatchQuotesOut(BaseModel):
     results: list[QuoteOut]
 
+class ResolveBatchItem(BaseModel):
+    ticker: str
+    status: str  # ok | not_found | empty
+    result: ResolveItem | None = None
+    error: str | None = None
+
+class ResolveBatchOut(BaseModel):
+    results: list[ResolveBatchItem]
+
+@router.post("/resolve_batch", response_model=ResolveBatchOut)
+async def resolve_batch(payload: BatchTickersIn, user: User = Depends(get_current_user)):
+    """Разрешение тикеров портфеля одним вызовом: статус по каждому тикеру."""
+    if len(payload.tickers) > RESOLVE_BATCH_MAX_TICKERS:
+        raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_TOO_MANY_TICKERS)
+    if not payload.tickers:
+        return ResolveBatchOut(results=[])
+    await _ensure_instruments(user)
+
+    results = []
+    for t, rec in _resolve_tickers(payload.tickers, payload.class_hint):
+        if not t:
+            results.append(ResolveBatchItem(ticker=t, status="empty", error=ERROR_EMPTY_TICKER))
+        elif rec is None:
+            results.append(ResolveBatchItem(ticker=t, status="not_found", error=ERROR_FIGI_NOT_FOUND_TEMPLATE.format(ticker=t)))
+        else:
+            results.append(ResolveBatchItem(ticker=t, status="ok", result=ResolveItem(**rec)))
+    return ResolveBatchOut(results=results)
+
 @router.post("/quotes_by_tickers", response_model=BatchQuotesOut)
 async def quotes_by_tickers(payload: BatchTickersIn, user: User = Depends(get_current_user)):
     if not payload.tickers:
         return BatchQuotesOut(results=[])
-    if not INSTR_CACHE:
-        token = _token_from_user(user)
-        await run_in_threadpool(refresh_instruments_cache, token)
-
-    # Создаем ключ кэша на основе тикеров и class_hint
-    tickers_sorted = sorted([t.strip().upper() for t in payload.tickers])
-    cache_key = f"quotes_batch:{':'.join(tickers_sorted)}:{payload.class_hint or 'all'}"
-
-    async def _load():
-        metas: list[dict] = []
-        for t in payload.tickers:
-            try:
-                m = await run_in_threadpool(_pick_figi_for_ticker, t, payload.class_hint)
-                metas.append({"ticker": t.strip().upper(), **m})
-            except HTTPException:
-                continue
-        if not metas:
-            return {"results": []}
-
-        token = _token_from_user(user)
-        figis = [m["figi"] for m in metas]
-        prices_map = await run_in_threadpool(_get_last_prices_blocking, figis, token)
-
-        out: list[dict] = []
-        for m in metas:
-            raw = prices_map.get(m["figi"])
-            if raw is None:
-                continue
-            qo = _normalize_quote(m["figi"], raw)
-            qo.ticker = m["ticker"]
-            out.append(qo.model_dump())
-        return {"results": out}
-
-    # Кэшируем на заданное время - обновляем котировки периодически
-    data = await cached_json(cache_key, ttl_sec=BATCH_QUOTES_CACHE_TTL_SEC, loader=_load)
-    return BatchQuotesOut(**data)
+    await _ensure_instruments(user)
+
+    metas = [{**rec, "ticker": t} for t, rec in _resolve_tickers(payload.tickers, payload.class_hint) if rec]
+    if not metas:
+        return BatchQuotesOut(results=[])
+
+    quotes = await _cached_quotes([m["figi"] for m in metas], user)
+    # запись кэша общая — тикер запроса подставляем в копию
+    results = [QuoteOut(**{**quotes[m["figi"]], "ticker": m["ticker"]}) for m in metas if m["figi"] in quotes]
+    return BatchQuotesOut(results=results)
 
 
 @router.post("/quotes_by_figis", response_model=BatchQuotesOut)
@@ -335,25 +443,99 @@ async def quotes_by_figis(payload: BatchFigisIn, user: User = Depends(get_curren
     if not payload.figis:
         return BatchQuotesOut(results=[])
 
-    if not INSTR_CACHE:
-        token = _token_from_user(user)
-        await run_in_threadpool(refresh_instruments_cache, token)
+    await _ensure_instruments(user)
 
     figis = list(dict.fromkeys(f.strip() for f in payload.figis if f and f.strip()))
-    cache_key = f"quotes_figis:{':'.join(sorted(figis))}"
-
-    async def _load():
-        token = _token_from_user(user)
-        prices_map = await run_in_threadpool(_get_last_prices_blocking, figis, token)
-
-        out: list[dict] = []
-        for figi in figis:
-            raw = prices_map.get(figi)
-            if raw is None:
-                continue
-            qo = _normalize_quote(figi, raw)
-            out.append(qo.model_dump())
-        return {"results": out}
-
-    data = await cached_json(cache_key, ttl_sec=BATCH_QUOTES_CACHE_TTL_SEC, loader=_load)
-    return BatchQuotesOut(**data)
+    quotes = await _cached_quotes(figis, user)
+    return BatchQuotesOut(results=[QuoteOut(**quotes[figi]) for figi in figis if figi in quotes])
+
+
+# --- push стоимости портфеля ---
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _position_values(positions: list[dict], prices: Dict[str, float], currencies: Dict[str, str]) -> list[dict]:
+    out = []
+    for p in positions:
+        price = prices.get(p["figi"])
+        if price is None:
+            continue
+        value = p["quantity"] * price
+        out.append({
+            **p, "currency": currencies.get(p["figi"]) or UNKNOWN_CURRENCY,
+            "price": price, "value": value, "pnl": value - p["quantity"] * p["avg_price"],
+        })
+    return out
+
+
+def _totals(valued: list[dict]) -> Dict[str, float]:
+    """Стоимость по валютам: суммы разных валют не складываются."""
+    out: Dict[str, float] = {}
+    for p in valued:
+        out[p["currency"]] = out.get(p["currency"], 0.0) + p["value"]
+    return out
+
+
+@router.get("/stream/portfolio/{portfolio_id}")
+async def stream_portfolio(portfolio_id: int, request: Request, user: User = Depends(get_current_user)):
+    """
+    SSE со стоимостью позиций портфеля. Первое событие snapshot — все позиции, дальше
+    update — только изменившиеся котировки и пересчитанные по ним позиции плюс итоги по
+    валютам (totals).
+    Состав позиций фиксируется при подключении: после правок клиент переподключается.
+    """
+    # сессия только на время чтения позиций — соединение с БД не держится весь стрим
+    async with AsyncSessionLocal() as db:
+        owner = await db.scalar(select(Portfolio.user_id).where(Portfolio.id == portfolio_id))
+        if owner != user.id:
+            raise HTTPException(HTTP_403_FORBIDDEN, ERROR_PORTFOLIO_ACCESS_DENIED)
+        rows = (await db.execute(
+            select(Position.id, Position.figi, Position.quantity, Position.avg_price)
+            .where(Position.portfolio_id == portfolio_id)
+        )).all()
+    positions = [
+        {"id": r.id, "figi": r.figi, "quantity": float(r.quantity or 0), "avg_price": float(r.avg_price or 0)}
+        for r in rows
+    ]
+    figis = list(dict.fromkeys(p["figi"] for p in positions))
+
+    # подписка до снимка: изменения между снимком и первым update не теряются
+    sub = price_fanout.subscribe(figis)
+    try:
+        quotes = await _cached_quotes(figis, user) if figis else {}
+    except BaseException:
+        price_fanout.unsubscribe(sub)
+        raise
+    prices = {figi: value_price(q) for figi, q in quotes.items()}
+    currencies = {figi: q.get("currency") for figi, q in quotes.items()}
+
+    async def _events():
+        try:
+            valued = _position_values(positions, prices, currencies)
+            yield _sse("snapshot", {
+                "quotes": [QuoteOut(**q).model_dump(mode="json", by_alias=True) for q in quotes.values()],
+                "positions": valued,
+                "totals": _totals(valued),
+            })
+            while not await request.is_disconnected():
+                changed = await sub.changes(PORTFOLIO_STREAM_KEEPALIVE_SEC)
+                if not changed:
+                    yield ": keepalive\n\n"
+                    continue
+                prices.update({figi: value_price(q) for figi, q in changed.items()})
+                currencies.update({figi: q.get("currency") for figi, q in changed.items()})
+                yield _sse("update", {
+                    "quotes": list(changed.values()),
+                    "positions": _position_values([p for p in positions if p["figi"] in changed], prices, currencies),
+                    "totals": _totals(_position_values(positions, prices, currencies)),
+                })
+        finally:
+            price_fanout.unsubscribe(sub)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Literal
 from pydantic import BaseModel, Field, ConfigDict
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.backend.core.auth import get_current_user
@@ -12,14 +14,21 @@ from app.backend.core.constants import (
     DEFAULT_INSTRUMENT_CLASS,
     ERROR_PORTFOLIO_ACCESS_DENIED,
     ERROR_POSITION_NOT_FOUND,
+    ERROR_TRADE_NOT_FOUND,
     ERROR_FIGI_REQUIRED,
     HTTP_400_BAD_REQUEST,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
+    TRADE_SOURCE_MANUAL,
 )
+from app.backend.db.async_session import AsyncSessionLocal
 from app.backend.db.session import get_db
-from app.backend.models.portfolio import Portfolio, Position
+from app.backend.models.portfolio import Portfolio, Position, Trade
 from app.backend.models.instrument import Instrument
+from app.backend.models.user import User
+from app.backend.services import trade_ledger
+from app.backend.services.budget_cache import cached_budget_json, invalidate_budget_cache
+from app.backend.services.portfolio_valuation import cached_valuation, value_positions
 
 router = APIRouter()
 
@@ -70,21 +79,187 @@ class PositionOut(BaseModel):
 class PositionFullOut(PositionOut):
     instrument: InstrumentShort
 
+class TradeIn(BaseModel):
+    portfolio_id: int
+    figi: str
+    side: Literal[1, -1] = Field(..., description="1 — покупка, -1 — продажа")
+    quantity: float = Field(..., gt=0)
+    price: float = Field(..., ge=0)
+    fee: float = Field(0, ge=0)
+    trade_at: datetime | None = None  # по умолчанию — сейчас
+    source: str | None = None
+
+class TradeUpdateIn(BaseModel):
+    side: Literal[1, -1] | None = None
+    quantity: float | None = Field(None, gt=0)
+    price: float | None = Field(None, ge=0)
+    fee: float | None = Field(None, ge=0)
+    trade_at: datetime | None = None
+
+class TradeOut(BaseModel):
+    id: int
+    portfolio_id: int
+    figi: str
+    side: int
+    quantity: float
+    price: float
+    fee: float
+    trade_at: datetime
+    source: str | None = None
+    model_config = ConfigDict(from_attributes=True)
+
+class ShareOut(BaseModel):
+    value: float
+    weight: float | None = None  # % от стоимости
+
+class PositionValuationOut(BaseModel):
+    id: int
+    figi: str
+    ticker: str | None = None
+    class_: str = Field(..., alias="class")
+    currency: str | None = None
+    quantity: float
+    avg_price: float
+    price: float | None = None  # облигации — грязная цена
+    value: float | None = None
+    cost: float
+    pnl: float | None = None
+    pnl_percent: float | None = None
+    weight: float | None = None  # % от стоимости портфеля в той же валюте
+    model_config = ConfigDict(populate_by_name=True)
+
+class CurrencyValuationOut(BaseModel):
+    value: float
+    cost: float
+    pnl: float
+    pnl_percent: float | None = None
+    weight: float | None = None  # % от стоимости всех портфелей в этой валюте
+    by_class: dict[str, ShareOut]
+
+class PortfolioValuationOut(BaseModel):
+    portfolio_id: int
+    title: str | None = None
+    by_currency: dict[str, CurrencyValuationOut]
+    positions: list[PositionValuationOut]
+    unpriced: list[str] = []
+    stale: bool = False
+
+class ValuationOut(BaseModel):
+    portfolios: list[PortfolioValuationOut]
+    by_currency: dict[str, CurrencyValuationOut]
+    unpriced: list[str]
+    stale: bool = False
+
 # ====== Helpers ======
 
+def _ensure_instrument(
+    db: Session,
+    figi: str,
+    *,
+    ticker: str | None = None,
+    name: str | None = None,
+    currency: str | None = None,
+    nominal: float | None = None,
+    class_hint: str | None = None,
+) -> Instrument:
+    """Гарантирует наличие инструмента в каталоге (на него ссылаются позиции и сделки)."""
+    inst = db.get(Instrument, figi)
+    if not inst:
+        inst = Instrument(
+            figi=figi,
+            ticker=(ticker or "").upper() or None,
+            name=name,
+            currency=currency,
+            nominal=nominal,
+            class_=class_hint or DEFAULT_INSTRUMENT_CLASS,  # в модели column='class'
+        )
+        db.add(inst)
+        db.flush()
+    return inst
+
+def _as_utc(ts: datetime | None) -> datetime | None:
+    # время сделки без зоны считаем UTC: сравнивается с timestamptz из БД
+    return ts.replace(tzinfo=timezone.utc) if ts is not None and ts.tzinfo is None else ts
+
+def _record_trade(db: Session, trade: Trade) -> Position:
+    """
+    Пишет сделку и обновляет позицию: сделка позже последней — инкрементально,
+    задним числом — пересчётом всей истории. Последняя сделка читается под блокировкой
+    позиции: параллельные сделки по той же бумаге применяются по очереди.
+    """
+    trade_ledger.lock_position(db, trade.portfolio_id, trade.figi)
+    latest = trade_ledger.latest_trade_at(db, trade.portfolio_id, trade.figi)
+    db.add(trade)
+    db.flush()
+    if latest is not None and trade.trade_at < latest:
+        return trade_ledger.recompute_position(db, trade.portfolio_id, trade.figi)
+    return trade_ledger.apply_trade(db, trade)
+
+def _trade_of_user(db: Session, trade_id: int, user_id: int) -> Trade:
+    trade = db.get(Trade, trade_id)
+    if not trade:
+        raise HTTPException(HTTP_404_NOT_FOUND, ERROR_TRADE_NOT_FOUND)
+    _ensure_portfolio_of_user(db, trade.portfolio_id, user_id)
+    return trade
+
 def _ensure_portfolio_of_user(db: Session, portfolio_id: int, user_id: int) -> Portfolio:
     pf = db.query(Portfolio).filter(Portfolio.id == portfolio_id, Portfolio.user_id == user_id).first()
     if not pf:
         raise HTTPException(HTTP_403_FORBIDDEN, ERROR_PORTFOLIO_ACCESS_DENIED)
     return pf
 
+async def _user_positions(user_id: int) -> dict:
+    """Портфели и позиции пользователя; кэш по версии его данных (правки позиций её меняют)."""
+    async def _load():
+        async with AsyncSessionLocal() as db:
+            portfolios = (await db.execute(
+                select(Portfolio.id, Portfolio.title).where(Portfolio.user_id == user_id).order_by(Portfolio.id)
+            )).all()
+            positions = (await db.execute(
+                select(Position.id, Position.portfolio_id, Position.figi, Position.quantity, Position.avg_price)
+                .join(Portfolio, Portfolio.id == Position.portfolio_id)
+                .where(Portfolio.user_id == user_id, Position.quantity != 0)
+            )).all()
+        return {
+            "portfolios": [{"id": r.id, "title": r.title} for r in portfolios],
+            "positions": [
+                {"id": r.id, "portfolio_id": r.portfolio_id, "figi": r.figi,
+                 "quantity": float(r.quantity or 0), "avg_price": float(r.avg_price or 0)}
+                for r in positions
+            ],
+        }
+    return await cached_budget_json(user_id, "portfolio:positions", _load)
+
+
+async def _valuation(user: User, portfolio_id: int | None = None) -> dict:
+    data = await _user_positions(user.id)
+    portfolios = data["portfolios"]
+    positions = data["positions"]
+    if portfolio_id is not None:
+        portfolios = [p for p in portfolios if p["id"] == portfolio_id]
+        if not portfolios:
+            raise HTTPException(HTTP_403_FORBIDDEN, ERROR_PORTFOLIO_ACCESS_DENIED)
+        positions = [p for p in positions if p["portfolio_id"] == portfolio_id]
+
+    # market тянет SDK Tinkoff — импорт по месту, чтобы остальные маршруты портфеля от него не зависели
+    from app.backend.routes.market import _cached_quotes
+
+    figis = list(dict.fromkeys(p["figi"] for p in positions))
+    quotes = await _cached_quotes(figis, user) if figis else {}
+
+    async def _compute():
+        return value_positions(portfolios, positions, quotes)
+
+    scope = "all" if portfolio_id is None else str(portfolio_id)
+    return await cached_valuation(user.id, scope, quotes, _compute)
+
 # ====== Endpoints ======
 
 @router.get("", response_model=list[PortfolioOut])
 def list_portfolios(user=Depends(get_current_user), db: Session = Depends(get_db)):
     return db.query(Portfolio).filter(Portfolio.user_id == user.id).all()
 
-@router.post("", response_model=PortfolioOut)
+@router.post("", response_model=PortfolioOut, dependencies=[Depends(invalidate_budget_cache)])
 def create_portfolio(payload: PortfolioCreateIn, user=Depends(get_current_user), db: Session = Depends(get_db)):
     p = Portfolio(
         user_id=user.id,
@@ -128,89 +303,120 @@ def list_positions_full(portfolio_id: int, user=Depends(get_current_user), db: S
         ))
     return out
 
-@router.post("/positions", response_model=PositionOut)
+@router.post("/positions", response_model=PositionOut, dependencies=[Depends(invalidate_budget_cache)])
 def upsert_position(payload: PositionUpsertIn, user=Depends(get_current_user), db: Session = Depends(get_db)):
     """
-    Аддитивное обновление позиции:
-      - если позиции нет -> создаём;
-      - если есть:
-          * quantity > 0 (покупка): складываем количество, avg_price -> взвешенная средняя;
-          * quantity < 0 (продажа): уменьшаем количество, avg_price не меняем; если стало 0 -> avg_price = 0.
+    Аддитивное обновление позиции — записывается сделкой в журнал:
+      - quantity > 0 (покупка): складываем количество, avg_price -> взвешенная средняя;
+      - quantity < 0 (продажа): уменьшаем количество, avg_price не меняем; если стало 0 -> avg_price = 0.
     """
     _ensure_portfolio_of_user(db, payload.portfolio_id, user.id)
 
     figi = (payload.figi or "").strip()
     if not figi:
         raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_FIGI_REQUIRED)
-
-    # гарантируем наличие инструмента в каталоге
-    inst = db.get(Instrument, figi)
-    if not inst:
-        inst = Instrument(
-            figi=figi,
-            ticker=(payload.ticker or "").upper() or None,
-            name=payload.name,
-            currency=payload.currency,
-            nominal=payload.nominal,
-            class_=payload.class_hint or DEFAULT_INSTRUMENT_CLASS,  # в модели column='class'
-        )
-        db.add(inst)
-
-    # Находим текущую позицию (и лочим строку, чтобы избежать гонок)
-    pos = (
-        db.query(Position)
-        .filter(Position.portfolio_id == payload.portfolio_id, Position.figi == figi)
-        .with_for_update()
-        .first()
-    )
+    _ensure_instrument(db, figi, ticker=payload.ticker, name=payload.name, currency=payload.currency,
+                       nominal=payload.nominal, class_hint=payload.class_hint)
 
     delta_qty = float(payload.quantity or 0)
-    delta_price = float(payload.avg_price or 0)
-
-    if not pos:
-        # новая позиция
-        qty = max(0.0, delta_qty)
-        avg = float(delta_price) if qty > 0 else 0.0
-        pos = Position(
+    if delta_qty == 0:
+        pos = trade_ledger.recompute_position(db, payload.portfolio_id, figi)
+    else:
+        trade = Trade(
             portfolio_id=payload.portfolio_id,
             figi=figi,
-            quantity=qty,
-            avg_price=avg,
-            updated_at=datetime.utcnow(),
+            side=trade_ledger.BUY if delta_qty > 0 else trade_ledger.SELL,
+            quantity=abs(delta_qty),
+            price=float(payload.avg_price or 0),
+            fee=0,
+            trade_at=datetime.now(timezone.utc),
+            source=TRADE_SOURCE_MANUAL,
         )
-        db.add(pos)
-    else:
-        cur_qty = float(pos.quantity or 0)
-        cur_avg = float(pos.avg_price or 0)
-
-        if delta_qty > 0:
-            # Покупка: взвешенная средняя
-            new_qty = cur_qty + delta_qty
-            new_avg = ((cur_avg * cur_qty) + (delta_price * delta_qty)) / new_qty if new_qty else 0.0
-            pos.quantity = new_qty
-            pos.avg_price = new_avg
-        elif delta_qty < 0:
-            # Продажа: средняя не меняется
-            new_qty = cur_qty + delta_qty
-            if new_qty <= 0:
-                pos.quantity = 0.0
-                pos.avg_price = 0.0
-            else:
-                pos.quantity = new_qty
-                # avg_price оставляем прежним
-        # delta_qty == 0 -> ничего не меняем
-
-        pos.updated_at = datetime.utcnow()
-
+        pos = _record_trade(db, trade)
     db.commit()
-    db.refresh(pos)
     return pos
 
-@router.delete("/positions/{position_id}", status_code=204)
+@router.delete("/positions/{position_id}", status_code=204, dependencies=[Depends(invalidate_budget_cache)])
 def delete_position(position_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
     pos = db.get(Position, position_id)
     if not pos:
         raise HTTPException(HTTP_404_NOT_FOUND, ERROR_POSITION_NOT_FOUND)
     _ensure_portfolio_of_user(db, pos.portfolio_id, user.id)
+    # вместе с историей: иначе пересчёт из журнала вернул бы позицию
+    db.query(Trade).filter(Trade.portfolio_id == pos.portfolio_id, Trade.figi == pos.figi).delete(synchronize_session=False)
     db.delete(pos); db.commit()
     return
+
+@router.get("/{portfolio_id}/trades", response_model=list[TradeOut])
+def list_trades(portfolio_id: int, figi: str | None = None, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    _ensure_portfolio_of_user(db, portfolio_id, user.id)
+    q = db.query(Trade).filter(Trade.portfolio_id == portfolio_id)
+    if figi:
+        q = q.filter(Trade.figi == figi)
+    return q.order_by(Trade.trade_at.desc(), Trade.id.desc()).all()
+
+@router.post("/trades", response_model=TradeOut, dependencies=[Depends(invalidate_budget_cache)])
+def create_trade(payload: TradeIn, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    _ensure_portfolio_of_user(db, payload.portfolio_id, user.id)
+    figi = payload.figi.strip()
+    if not figi:
+        raise HTTPException(HTTP_400_BAD_REQUEST, ERROR_FIGI_REQUIRED)
+    _ensure_instrument(db, figi)
+    trade = Trade(
+        portfolio_id=payload.portfolio_id,
+        figi=figi,
+        side=payload.side,
+        quantity=payload.quantity,
+        price=payload.price,
+        fee=payload.fee,
+        trade_at=_as_utc(payload.trade_at) or datetime.now(timezone.utc),
+        source=payload.source or TRADE_SOURCE_MANUAL,
+    )
+    _record_trade(db, trade)
+    db.commit()
+    db.refresh(trade)
+    return trade
+
+@router.patch("/trades/{trade_id}", response_model=TradeOut, dependencies=[Depends(invalidate_budget_cache)])
+def update_trade(trade_id: int, payload: TradeUpdateIn, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    trade = _trade_of_user(db, trade_id, user.id)
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(trade, field, _as_utc(value) if field == "trade_at" else value)
+    db.flush()
+    trade_ledger.recompute_position(db, trade.portfolio_id, trade.figi)
+    db.commit()
+    db.refresh(trade)
+    return trade
+
+@router.delete("/trades/{trade_id}", status_code=204, dependencies=[Depends(invalidate_budget_cache)])
+def delete_trade(trade_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    trade = _trade_of_user(db, trade_id, user.id)
+    portfolio_id, figi = trade.portfolio_id, trade.figi
+    db.delete(trade)
+    db.flush()
+    trade_ledger.recompute_position(db, portfolio_id, figi)
+    db.commit()
+    return
+
+@router.post("/{portfolio_id}/recompute", response_model=list[PositionOut], dependencies=[Depends(invalidate_budget_cache)])
+def recompute_positions(portfolio_id: int, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    """Полный пересчёт всех позиций портфеля из журнала сделок."""
+    _ensure_portfolio_of_user(db, portfolio_id, user.id)
+    figis = {f for (f,) in db.query(Trade.figi).filter(Trade.portfolio_id == portfolio_id).distinct()}
+    figis |= {f for (f,) in db.query(Position.figi).filter(Position.portfolio_id == portfolio_id)}
+    out = [trade_ledger.recompute_position(db, portfolio_id, figi) for figi in sorted(figis)]
+    db.commit()
+    return out
+
+@router.get("/valuation", response_model=ValuationOut)
+async def valuation_all(user: User = Depends(get_current_user)):
+    """Сводная оценка всех портфелей: стоимость, P&L, доли и разбивка по классам — по каждой валюте."""
+    return await _valuation(user)
+
+@router.get("/{portfolio_id}/valuation", response_model=PortfolioValuationOut)
+async def valuation_portfolio(portfolio_id: int, user: User = Depends(get_current_user)):
+    """Оценка одного портфеля по кэшированным котировкам (облигации — по грязной цене)."""
+    data = await _valuation(user, portfolio_id)
+    return {**data["portfolios"][0], "unpriced": data["unpriced"], "stale": data["stale"]}
+
@@ -7,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, field_validator, model_validator
 from sqlalchemy.orm import Session
 
-from app.backend.core.auth import get_current_user, get_staff_user
+from app.backend.core.auth import get_current_user, get_staff_user, invalidate_principal_sync
 from app.backend.core.security import encrypt_token
 from app.backend.core.constants import (
     ERROR_USER_NOT_FOUND,
@@ -88,6 +88,14 @@ class StaffToggleIn(BaseModel):
     is_staff: bool
 
 
+def _own_row(db: Session, current: User) -> User:
+    """get_current_user отдаёт снимок из кэша — для изменения берём строку из БД."""
+    user = db.get(User, current.id)
+    if not user:
+        raise HTTPException(HTTP_404_NOT_FOUND, ERROR_USER_NOT_FOUND)
+    return user
+
+
 @router.get("/me", response_model=UserMeOut)
 def me(user: User = Depends(get_current_user)):
     return UserMeOut(
@@ -101,14 +109,15 @@ def me(user: User = Depends(get_current_user)):
 
 
 @router.put("/me/token", response_model=UserMeOut)
-def update_token(payload: TokenUpdateIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_token(payload: TokenUpdateIn, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = _own_row(db, current)
     if payload.tinkoff_token:
         user.tinkoff_token_enc = encrypt_token(payload.tinkoff_token.strip())
     else:
         user.tinkoff_token_enc = None
-    db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_principal_sync(user.id)
     return UserMeOut(
         id=user.id,
         email=user.email,
@@ -120,11 +129,12 @@ def update_token(payload: TokenUpdateIn, user: User = Depends(get_current_user),
 
 
 @router.put("/me/name", response_model=UserMeOut)
-def update_name(payload: UserNameUpdateIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_name(payload: UserNameUpdateIn, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = _own_row(db, current)
     user.full_name = payload.resolved_name
-    db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_principal_sync(user.id)
     return UserMeOut(
         id=user.id,
         email=user.email,
@@ -136,14 +146,15 @@ def update_name(payload: UserNameUpdateIn, user: User = Depends(get_current_user
 
 
 @router.put("/me/email", response_model=UserMeOut)
-def update_email(payload: UserEmailUpdateIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_email(payload: UserEmailUpdateIn, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = _own_row(db, current)
     existing = db.query(User).filter(User.email == payload.email, User.id != user.id).first()
     if existing:
         raise HTTPException(HTTP_409_CONFLICT, ERROR_USER_EXISTS)
     user.email = payload.email
-    db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_principal_sync(user.id)
     return UserMeOut(
         id=user.id,
         email=user.email,
@@ -193,6 +204,7 @@ def toggle_staff(
     db.add(target_user)
     db.commit()
     db.refresh(target_user)
+    invalidate_principal_sync(target_user.id)
 
     log_admin_action(db, admin, "toggle_staff", target_user.id, {"is_staff": payload.is_staff})
 
@@ -222,6 +234,7 @@ def admin_update_name(
     db.add(target_user)
     db.commit()
     db.refresh(target_user)
+    invalidate_principal_sync(target_user.id)
 
     log_admin_action(db, admin, "update_name", target_user.id, {"name": payload.resolved_name})
 
@@ -255,6 +268,7 @@ def admin_update_email(
     db.add(target_user)
     db.commit()
     db.refresh(target_user)
+    invalidate_principal_sync(target_user.id)
 
     log_admin_action(db, admin, "update_email", target_user.id, {"email": payload.email})
 
@@ -0,0 +1,57 @@
+"""
+Микробенчмарк проверки паролей: пропускная способность verify при разном числе процессов пула.
+
+Показывает, что вход масштабируется по ядрам (до PASSWORD_HASH_WORKERS), а не упирается
+в один event loop.
+
+    python -m app.backend.scripts.bench_password_hashing
+    python -m app.backend.scripts.bench_password_hashing --jobs 64 --rounds 12 --max-workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.backend.core.security import pwd_context, verify_password
+
+_PASSWORD = "Bench-Password-123!"
+
+
+def _throughput(workers: int, hashed: str, jobs: int) -> float:
+    """Проверок в секунду на пуле из workers процессов (прогрев не учитывается)."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(verify_password, [_PASSWORD] * workers, [hashed] * workers))
+        started = time.perf_counter()
+        results = list(pool.map(verify_password, [_PASSWORD] * jobs, [hashed] * jobs))
+        elapsed = time.perf_counter() - started
+    assert all(results)
+    return jobs / elapsed
+
+
+def run(jobs: int, rounds: int, max_workers: int) -> list[tuple[int, float]]:
+    hashed = pwd_context.handler("bcrypt").using(rounds=rounds).hash(_PASSWORD)
+    counts = sorted({1, *range(2, max_workers + 1, 2), max_workers})
+    return [(w, _throughput(w, hashed, jobs)) for w in counts]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пропускная способность bcrypt verify по числу процессов")
+    parser.add_argument("--jobs", type=int, default=48)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rows = run(args.jobs, args.rounds, args.max_workers)
+    base = rows[0][1]
+    print(f"bcrypt rounds={args.rounds}, jobs={args.jobs}, cpu={os.cpu_count()}")
+    print(f"{'workers':>8} {'verify/s':>10} {'speedup':>8}")
+    for workers, rate in rows:
+        print(f"{workers:>8} {rate:>10.1f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
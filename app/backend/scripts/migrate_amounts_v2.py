@@ -0,0 +1,93 @@
+"""
+Фоновая миграция зашифрованных сумм из Fernet (amount_encrypted) в формат v2 (amount_encrypted_v2).
+
+Работает пачками по id, каждая пачка — отдельная транзакция, поэтому скрипт можно
+прервать и запустить снова: уже перенесённые строки повторно не трогаются.
+
+    python -m app.backend.scripts.migrate_amounts_v2 --batch-size 1000 --sleep 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.backend.core.security import reencrypt_amount_v2
+from app.backend.db.session import SessionLocal
+from app.backend.models.budget import BudgetTransaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def migrate_batch(db: Session, after_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> tuple[int, int, int]:
+    """
+    Переносит одну пачку строк с id > after_id.
+
+    Returns:
+        (последний обработанный id, перенесено, пропущено из-за нерасшифровываемого токена)
+    """
+    rows = db.execute(
+        select(BudgetTransaction.id, BudgetTransaction.amount_encrypted)
+        .where(
+            BudgetTransaction.id > after_id,
+            BudgetTransaction.amount_encrypted.isnot(None),
+            BudgetTransaction.amount_encrypted_v2.is_(None),
+        )
+        .order_by(BudgetTransaction.id.asc())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        return after_id, 0, 0
+
+    params = []
+    skipped = 0
+    for tx_id, token in rows:
+        blob = reencrypt_amount_v2(token)
+        if blob is None:
+            skipped += 1
+            continue
+        params.append({"id": tx_id, "amount_encrypted_v2": blob, "amount_encrypted": None})
+    if params:
+        db.execute(update(BudgetTransaction), params)
+    db.commit()
+    return rows[-1][0], len(params), skipped
+
+
+def run(batch_size: int = DEFAULT_BATCH_SIZE, sleep_sec: float = 0.0) -> int:
+    """Прогоняет миграцию до конца, возвращает число перенесённых строк."""
+    last_id = 0
+    total = 0
+    while True:
+        with SessionLocal() as db:
+            new_last_id, migrated, skipped = migrate_batch(db, last_id, batch_size)
+        if new_last_id == last_id:
+            break
+        total += migrated
+        if skipped:
+            logger.warning("Пропущено %s строк с нерасшифровываемым токеном (id <= %s)", skipped, new_last_id)
+        logger.info("Перенесено %s строк (всего %s), последний id=%s", migrated, total, new_last_id)
+        last_id = new_last_id
+        if sleep_sec:
+            time.sleep(sleep_sec)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Миграция сумм транзакций в формат v2")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--sleep", type=float, default=0.0, help="Пауза между пачками, сек")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    total = run(batch_size=args.batch_size, sleep_sec=args.sleep)
+    logger.info("Готово: перенесено %s строк", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Перестроение помесячных агрегатов бюджета (pf.budget_monthly_rollups).
+
+Нужно для начального заполнения и после ручных правок budget_transactions в обход API.
+Каждый пользователь перестраивается в отдельной транзакции.
+
+    python -m app.backend.scripts.rebuild_budget_rollups            # все пользователи
+    python -m app.backend.scripts.rebuild_budget_rollups --user-id 42
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.backend.db.session import SessionLocal
+from app.backend.models.user import User
+from app.backend.services.budget_rollup import rebuild_user_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def run(user_id: Optional[int] = None) -> int:
+    """Перестраивает агрегаты, возвращает число обработанных пользователей."""
+    with SessionLocal() as db:
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            user_ids = list(db.scalars(select(User.id).order_by(User.id)).all())
+
+    for uid in user_ids:
+        with SessionLocal() as db:
+            rows = rebuild_user_rollups(db, uid)
+            db.commit()
+        logger.info("user_id=%s: %s строк агрегата", uid, rows)
+    return len(user_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перестроение помесячных агрегатов бюджета")
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    count = run(user_id=args.user_id)
+    logger.info("Готово: пользователей %s", count)
+
+
+if __name__ == "__main__":
+    main()
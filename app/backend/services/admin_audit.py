@@ -2,24 +2,44 @@ from __future__ import annotations
 
 from typing import Any, Optional
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.backend.models.admin import AdminAuditLog
 from app.backend.models.user import User
 
 
-def log_admin_action(
-    db: Session,
+def _entry(
     admin: User,
     action: str,
-    target_user_id: Optional[int] = None,
-    details: Optional[dict[str, Any]] = None,
-) -> None:
-    entry = AdminAuditLog(
+    target_user_id: Optional[int],
+    details: Optional[dict[str, Any]],
+) -> AdminAuditLog:
+    return AdminAuditLog(
         admin_id=admin.id,
         action=action,
         target_user_id=target_user_id,
         details=details,
     )
-    db.add(entry)
+
+
+def log_admin_action(
+    db: Session,
+    admin: User,
+    action: str,
+    target_user_id: Optional[int] = None,
+    details: Optional[dict[str, Any]] = None,
+) -> None:
+    db.add(_entry(admin, action, target_user_id, details))
     db.commit()
+
+
+async def log_admin_action_async(
+    db: AsyncSession,
+    admin: User,
+    action: str,
+    target_user_id: Optional[int] = None,
+    details: Optional[dict[str, Any]] = None,
+) -> None:
+    db.add(_entry(admin, action, target_user_id, details))
+    await db.commit()
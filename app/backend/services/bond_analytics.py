@@ -0,0 +1,203 @@
+"""
+Аналитика облигаций: НКД, грязная цена, доходность к погашению и модифицированная дюрация.
+
+Номинал и дата погашения берутся из справочника инструментов, расписание купонов FIGI
+(get_bond_coupons) кэшируется в Redis на BOND_SCHEDULE_TTL_SEC. Котировки расписаний не
+ждут: недостающие грузятся в фоне (prefetch_schedules), а до загрузки облигация отдаётся
+без аналитики. Загруженные расписания воркер держит в памяти. Расчёт по пачке — один
+проход numpy: купоны пачки сводятся в матрицу «облигация × купон», доходность находится
+методом Ньютона сразу для всех строк.
+
+Соглашения: НКД — доля купона пропорционально дням периода; доходность — эффективная
+годовая (как у Мосбиржи), время — в годах по DAYS_IN_YEAR. Купоны с ещё не объявленным
+размером (флоатеры) считаются равными последнему известному.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+from app.backend.core.cache import cached_json_many
+from app.backend.core.constants import (
+    BOND_SCHEDULE_TTL_SEC,
+    BOND_YTM_MAX_ITER,
+    BOND_YTM_TOLERANCE,
+    DAYS_IN_YEAR,
+    NANO_TO_FLOAT_DIVISOR,
+    PERCENT_TO_DECIMAL,
+)
+
+log = logging.getLogger("market.bonds")
+
+_YEAR_SEC = DAYS_IN_YEAR * 86400.0
+# расписание: {"coupons": [[начало, конец, выплата, сумма], ...]}
+_START, _END, _PAY, _AMOUNT = range(4)
+
+_known: dict[str, dict[str, Any]] = {}
+_loaded_at: dict[str, float] = {}
+_loading: set[str] = set()
+_background: set[asyncio.Task] = set()
+
+
+def _q2f(q: Any) -> float:
+    if q is None:
+        return 0.0
+    return float(getattr(q, "units", 0)) + float(getattr(q, "nano", 0)) / NANO_TO_FLOAT_DIVISOR
+
+
+def _ts(dt: Optional[datetime]) -> Optional[float]:
+    # пустые даты в API приходят как 1970-01-01
+    return dt.timestamp() if dt is not None and dt.year > 1970 else None
+
+
+def schedule_from_api(coupons: Sequence[Any]) -> dict[str, Any]:
+    rows = []
+    for c in coupons:
+        start, end, pay = _ts(getattr(c, "coupon_start_date", None)), _ts(getattr(c, "coupon_end_date", None)), _ts(c.coupon_date)
+        if pay is None:
+            continue
+        rows.append([start if start is not None else pay, end if end is not None else pay, pay, _q2f(c.pay_one_bond)])
+    rows.sort(key=lambda r: r[_PAY])
+    return {"coupons": rows}
+
+
+async def _fetch_schedule(figi: str, token: str) -> dict[str, Any]:
+    from app.backend.services.tinkoff_scheduler import tinkoff_scheduler
+
+    coupons = await tinkoff_scheduler.call(token, "instruments", lambda c: c.instruments.get_bond_coupons(figi=figi))
+    return schedule_from_api(coupons.events)
+
+
+async def load_schedules(figis: Sequence[str], token: str) -> dict[str, dict[str, Any]]:
+    """Расписания по FIGI облигаций; не загрузившиеся отсутствуют в ответе."""
+    async def _load(missing: list[str]) -> dict[str, dict[str, Any]]:
+        results = await asyncio.gather(*(_fetch_schedule(f, token) for f in missing), return_exceptions=True)
+        out = {}
+        for figi, res in zip(missing, results):
+            if isinstance(res, BaseException):
+                log.warning("Расписание купонов %s не загружено: %r", figi, res)
+            else:
+                out[figi] = res
+        return out
+
+    schedules = await cached_json_many(figis, lambda f: f"bond:schedule:{f}", ttl_sec=BOND_SCHEDULE_TTL_SEC, loader=_load)
+    _known.update(schedules)
+    now = time.time()
+    _loaded_at.update((f, now) for f in schedules)
+    return schedules
+
+
+async def _prefetch(figis: list[str], token: str) -> None:
+    try:
+        await load_schedules(figis, token)
+    except Exception:
+        log.warning("Фоновая загрузка расписаний купонов не удалась", exc_info=True)
+    finally:
+        _loading.difference_update(figis)
+
+
+def prefetch_schedules(figis: Sequence[str], token: str) -> None:
+    """
+    Запускает фоновую загрузку расписаний, которых нет в памяти воркера или которые старше
+    BOND_SCHEDULE_TTL_SEC; уже загружаемые FIGI повторно не запрашиваются.
+    """
+    now = time.time()
+    missing = [
+        f for f in dict.fromkeys(figis)
+        if f not in _loading and now - _loaded_at.get(f, 0.0) >= BOND_SCHEDULE_TTL_SEC
+    ]
+    if not missing:
+        return
+    _loading.update(missing)
+    task = asyncio.create_task(_prefetch(missing, token))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def known_schedules(figis: Sequence[str]) -> dict[str, dict[str, Any]]:
+    """Расписания, уже загруженные этим воркером, — без обращения к Redis и API."""
+    return {f: _known[f] for f in figis if f in _known}
+
+
+def _matrix(schedules: Sequence[dict[str, Any]]) -> np.ndarray:
+    """Купоны пачки: массив (облигация, купон, поле); пустые ячейки — NaN."""
+    width = max((len(s["coupons"]) for s in schedules), default=0)
+    out = np.full((len(schedules), max(width, 1), 4), np.nan)
+    for i, s in enumerate(schedules):
+        if s["coupons"]:
+            out[i, :len(s["coupons"])] = s["coupons"]
+    return out
+
+
+def bond_metrics(
+    price_percent: Sequence[float],
+    nominal: Sequence[float],
+    maturity: Sequence[Optional[float]],
+    schedules: Sequence[dict[str, Any]],
+    *,
+    now: Optional[float] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Метрики пачки облигаций по чистой цене в % от номинала, номиналу и дате погашения
+    (unix) из справочника: price (чистая, в валюте), aci, dirty_price, ytm (% годовых) и
+    modified_duration (лет). NaN — не посчитать (погашена, нет даты погашения или цены).
+    """
+    now = time.time() if now is None else now
+    n = len(schedules)
+    price_percent = np.asarray(price_percent, dtype=np.float64)
+    nominal = np.asarray(nominal, dtype=np.float64)
+    coupons = _matrix(schedules)
+    start, end, pay, amount = (coupons[..., f] for f in (_START, _END, _PAY, _AMOUNT))
+
+    # НКД — доля текущего купона по дням периода
+    current = (start <= now) & (now < end) & (end > start)
+    elapsed = np.where(current, (now - start) / np.where(end > start, end - start, 1.0), 0.0)
+    aci = np.nansum(np.where(current, amount * elapsed, 0.0), axis=1)
+
+    # необъявленные купоны = последнему известному в строке
+    known = np.nan_to_num(amount) > 0
+    cols = np.arange(coupons.shape[1])
+    last_known = np.maximum.accumulate(np.where(known, cols, -1), axis=1)
+    filled = np.where(last_known >= 0, amount[np.arange(n)[:, None], np.maximum(last_known, 0)], 0.0)
+
+    # денежные потоки: будущие купоны плюс номинал в дату погашения
+    maturity = np.array([m or np.nan for m in maturity], dtype=np.float64)
+    future = np.nan_to_num(pay) > now
+    if n:
+        future &= ~(pay > maturity[:, None] + 86400)  # выплаты после погашения — мусор расписания
+    cf = np.concatenate([np.where(future, filled, 0.0), nominal[:, None]], axis=1)
+    t = np.concatenate([np.where(future, (pay - now) / _YEAR_SEC, 0.0), ((maturity - now) / _YEAR_SEC)[:, None]], axis=1)
+    valid = (maturity > now) & (price_percent > 0) & (nominal > 0)
+    t = np.where(valid[:, None], t, 0.0)
+
+    clean = price_percent * nominal / PERCENT_TO_DECIMAL
+    dirty = clean + aci
+
+    # Ньютон по всем строкам: PV(y) = Σ cf · (1 + y)^-t = грязная цена
+    y = np.full(n, 0.1)
+    for _ in range(BOND_YTM_MAX_ITER):
+        disc = (1.0 + y)[:, None] ** -t
+        pv = (cf * disc).sum(axis=1)
+        dpv = -(t * cf * disc).sum(axis=1) / (1.0 + y)
+        step = np.where(valid & (dpv != 0), (pv - dirty) / np.where(dpv != 0, dpv, 1.0), 0.0)
+        y = np.clip(y - step, -0.99, 100.0)
+        if np.all(np.abs(step) < BOND_YTM_TOLERANCE):
+            break
+
+    disc = (1.0 + y)[:, None] ** -t
+    pv = (cf * disc).sum(axis=1)
+    macaulay = (t * cf * disc).sum(axis=1) / np.where(pv > 0, pv, 1.0)
+    return {
+        "nominal": nominal,
+        "price": clean,
+        "aci": aci,
+        "dirty_price": dirty,
+        "ytm": np.where(valid, y * PERCENT_TO_DECIMAL, np.nan),
+        "modified_duration": np.where(valid, macaulay / (1.0 + y), np.nan),
+    }
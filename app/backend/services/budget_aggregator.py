@@ -0,0 +1,227 @@
+"""
+Однопроходная агрегация бюджета за период.
+
+Счета и категории пользователя загружаются один раз в словари, транзакции (или помесячные
+агрегаты) классифицируются за один проход: итоги, разрезы по категориям, дням и месяцам,
+сбережения. Правило сбережений:
+  - доход на накопительный счёт — пополнение, расход с накопительного — снятие;
+  - перевод на накопительный счёт — пополнение, иначе перевод с накопительного — снятие.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.backend.core.constants import (
+    TRANSACTION_TYPE_EXPENSE,
+    TRANSACTION_TYPE_INCOME,
+    TRANSACTION_TYPE_TRANSFER,
+)
+from app.backend.models.budget import BudgetAccount, BudgetCategory, BudgetTransaction
+from app.backend.services.budget_amounts import tx_amounts
+from app.backend.services.budget_rollup import RollupEntry, load_rollups
+
+_ZERO = Decimal(0)
+
+
+def _decimal_map() -> defaultdict:
+    return defaultdict(lambda: _ZERO)
+
+
+@dataclass
+class MonthTotals:
+    income: Decimal = _ZERO
+    expense: Decimal = _ZERO
+    savings: Decimal = _ZERO
+
+
+@dataclass
+class BudgetAggregate:
+    income: Decimal = _ZERO
+    expense: Decimal = _ZERO
+    savings_transferred: Decimal = _ZERO  # переводы на накопительные счета
+    savings_income: Decimal = _ZERO  # доходы, зачисленные на накопительные счета
+    savings_net: Decimal = _ZERO
+    tx_count: int = 0
+    income_by_category: dict[Optional[int], Decimal] = field(default_factory=_decimal_map)
+    expense_by_category: dict[Optional[int], Decimal] = field(default_factory=_decimal_map)
+    income_by_day: dict[date, Decimal] = field(default_factory=_decimal_map)
+    expense_by_day: dict[date, Decimal] = field(default_factory=_decimal_map)
+    by_month: dict[tuple[int, int], MonthTotals] = field(default_factory=lambda: defaultdict(MonthTotals))
+    active_days: set[date] = field(default_factory=set)
+
+    @property
+    def net(self) -> Decimal:
+        return self.income - self.expense
+
+
+def tx_day(tx: BudgetTransaction) -> date:
+    occurred = tx.occurred_at
+    if hasattr(occurred, "date"):
+        return occurred.date()
+    return occurred
+
+
+class BudgetAggregator:
+    """Классификатор операций с предзагруженными счетами и категориями."""
+
+    def __init__(
+        self,
+        accounts: dict[int, BudgetAccount],
+        categories: Optional[dict[int, BudgetCategory]] = None,
+    ):
+        self.accounts = accounts
+        self.categories = categories or {}
+
+    @classmethod
+    def for_users(cls, db: Session, user_ids: Sequence[int]) -> "BudgetAggregator":
+        accounts = db.scalars(select(BudgetAccount).where(BudgetAccount.user_id.in_(user_ids))).all()
+        categories = db.scalars(select(BudgetCategory).where(BudgetCategory.user_id.in_(user_ids))).all()
+        return cls({a.id: a for a in accounts}, {c.id: c for c in categories})
+
+    @classmethod
+    def for_user(cls, db: Session, user_id: int) -> "BudgetAggregator":
+        return cls.for_users(db, [user_id])
+
+    def category_name(self, category_id: Optional[int], default: Optional[str] = None) -> Optional[str]:
+        cat = self.categories.get(category_id or 0)
+        return cat.name if cat else default
+
+    def _is_savings(self, account_id: Optional[int]) -> bool:
+        acc = self.accounts.get(account_id or 0)
+        return bool(acc and acc.is_savings)
+
+    def add(
+        self,
+        agg: BudgetAggregate,
+        *,
+        tx_type: str,
+        amount: Decimal,
+        account_id: Optional[int],
+        contra_account_id: Optional[int],
+        category_id: Optional[int],
+        year: int,
+        month: int,
+        day: Optional[date] = None,
+        count: int = 1,
+    ) -> None:
+        bucket = agg.by_month[(year, month)]
+        agg.tx_count += count
+        if day is not None:
+            agg.active_days.add(day)
+
+        if tx_type == TRANSACTION_TYPE_INCOME:
+            agg.income += amount
+            bucket.income += amount
+            agg.income_by_category[category_id] += amount
+            if day is not None:
+                agg.income_by_day[day] += amount
+            if self._is_savings(account_id):
+                agg.savings_income += amount
+                agg.savings_net += amount
+                bucket.savings += amount
+
+        elif tx_type == TRANSACTION_TYPE_EXPENSE:
+            agg.expense += amount
+            bucket.expense += amount
+            agg.expense_by_category[category_id] += amount
+            if day is not None:
+                agg.expense_by_day[day] += amount
+            if self._is_savings(account_id):
+                agg.savings_net -= amount
+                bucket.savings -= amount
+
+        elif tx_type == TRANSACTION_TYPE_TRANSFER:
+            if self._is_savings(contra_account_id):
+                agg.savings_transferred += amount
+                agg.savings_net += amount
+                bucket.savings += amount
+            elif self._is_savings(account_id):
+                agg.savings_net -= amount
+                bucket.savings -= amount
+
+    def aggregate_transactions(
+        self,
+        txs: Sequence[BudgetTransaction],
+        amounts: Optional[Sequence[Decimal]] = None,
+    ) -> BudgetAggregate:
+        """Агрегат по транзакциям; суммы расшифровываются пачкой, если не переданы."""
+        agg = BudgetAggregate()
+        for tx, amount in zip(txs, tx_amounts(txs) if amounts is None else amounts):
+            day = tx_day(tx)
+            self.add(
+                agg,
+                tx_type=tx.type,
+                amount=amount,
+                account_id=tx.account_id,
+                contra_account_id=tx.contra_account_id,
+                category_id=tx.category_id,
+                year=day.year,
+                month=day.month,
+                day=day,
+            )
+        return agg
+
+    def aggregate_rollups(self, entries: Iterable[RollupEntry]) -> BudgetAggregate:
+        """Агрегат по помесячным агрегатам: без разреза по дням."""
+        agg = BudgetAggregate()
+        for e in entries:
+            self.add(
+                agg,
+                tx_type=e.type,
+                amount=e.amount,
+                account_id=e.account_id,
+                contra_account_id=e.contra_account_id,
+                category_id=e.category_id,
+                year=e.year,
+                month=e.month,
+                count=e.tx_count,
+            )
+        return agg
+
+    def load(self, db: Session, user_id: int, d1: date, d2: date, *, per_day: bool = False) -> BudgetAggregate:
+        """
+        Агрегат за [d1, d2]. Целые месяцы без разреза по дням берутся из помесячных агрегатов,
+        иначе транзакции периода читаются одним запросом.
+        """
+        if not per_day:
+            entries = load_rollups(db, user_id, d1, d2)
+            if entries is not None:
+                return self.aggregate_rollups(entries)
+        return self.aggregate_transactions(load_period_transactions(db, [user_id], d1, d2))
+
+    def load_users(self, db: Session, user_ids: Sequence[int], d1: date, d2: date) -> dict[int, BudgetAggregate]:
+        """Агрегаты сразу по нескольким пользователям: один запрос транзакций и одна расшифровка."""
+        if not user_ids:
+            return {}
+        txs = load_period_transactions(db, user_ids, d1, d2)
+        by_user: dict[int, list[tuple[BudgetTransaction, Decimal]]] = defaultdict(list)
+        for tx, amount in zip(txs, tx_amounts(txs)):
+            by_user[tx.user_id].append((tx, amount))
+        out: dict[int, BudgetAggregate] = {}
+        for uid in user_ids:
+            rows = by_user.get(uid, [])
+            out[uid] = self.aggregate_transactions([tx for tx, _ in rows], [a for _, a in rows])
+        return out
+
+
+def load_period_transactions(db: Session, user_ids: Sequence[int], d1: date, d2: date) -> list[BudgetTransaction]:
+    """Транзакции за [d1, d2] включительно (весь день d2, как и в помесячных агрегатах)."""
+    return list(
+        db.scalars(
+            select(BudgetTransaction)
+            .where(
+                BudgetTransaction.user_id.in_(user_ids),
+                BudgetTransaction.occurred_at >= d1,
+                BudgetTransaction.occurred_at < d2 + timedelta(days=1),
+            )
+            .order_by(BudgetTransaction.occurred_at.asc(), BudgetTransaction.id.asc())
+        ).all()
+    )
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Iterable, Sequence
+
+from app.backend.core.security import AmountCipher, decrypt_amounts
+from app.backend.models.budget import BudgetTransaction
+
+
+def _cipher(tx: BudgetTransaction) -> AmountCipher:
+    # v2 (bytea) приоритетнее Fernet-токена: после миграции v1 обнуляется
+    return tx.amount_encrypted_v2 or tx.amount_encrypted
+
+
+def tx_amounts(txs: Sequence[BudgetTransaction]) -> list[Decimal]:
+    """
+    Суммы транзакций в том же порядке: зашифрованные расшифровываются одной пачкой,
+    старые записи без шифротекста берут значение из amount.
+    """
+    encrypted_idx = [i for i, tx in enumerate(txs) if _cipher(tx)]
+    out = [Decimal(str(tx.amount or 0)) for tx in txs]
+    decrypted = decrypt_amounts(_cipher(txs[i]) for i in encrypted_idx)
+    for i, amount in zip(encrypted_idx, decrypted):
+        out[i] = amount
+    return out
+
+
+def tx_amount_map(txs: Iterable[BudgetTransaction]) -> dict[int, Decimal]:
+    """id транзакции -> расшифрованная сумма."""
+    items = list({tx.id: tx for tx in txs}.values())
+    return {tx.id: amount for tx, amount in zip(items, tx_amounts(items))}
+
+
+def tx_amount(tx: BudgetTransaction) -> Decimal:
+    return tx_amounts([tx])[0]
@@ -0,0 +1,70 @@
+"""
+Версионированный кэш чтений бюджета поверх core.cache.cached_json.
+
+Ключ содержит счётчик версии данных пользователя (budget:ver:{user_id}). Любая запись в бюджет
+увеличивает счётчик — старые ключи больше не читаются и истекают по TTL, сканировать и удалять
+ничего не нужно. Если версию прочитать не удалось (Redis недоступен), кэш обходится.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import anyio.from_thread
+from fastapi import Depends
+
+from app.backend.core.auth import get_current_user
+from app.backend.core.cache import cached_json, get_redis
+from app.backend.core.constants import BUDGET_CACHE_TTL_SEC
+from app.backend.models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+def _version_key(user_id: int) -> str:
+    return f"budget:ver:{user_id}"
+
+
+async def budget_data_version(user_id: int) -> int | None:
+    """Текущая версия данных пользователя; None — Redis недоступен."""
+    try:
+        r = await get_redis()
+        raw = await r.get(_version_key(user_id))
+        return int(raw) if raw else 0
+    except Exception:
+        return None
+
+
+async def bump_budget_version(user_id: int) -> None:
+    try:
+        r = await get_redis()
+        await r.incr(_version_key(user_id))
+    except Exception:
+        logger.warning("Не удалось сбросить кэш бюджета user_id=%s", user_id, exc_info=True)
+
+
+def bump_budget_version_sync(user_id: int) -> None:
+    """Для синхронных обработчиков (выполняются в threadpool): сброс кэша после commit."""
+    try:
+        anyio.from_thread.run(bump_budget_version, user_id)
+    except RuntimeError:
+        # вызов вне рабочего потока anyio (скрипты, тесты) — кэша там нет
+        pass
+
+
+async def cached_budget_json(user_id: int, name: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """cached_json с ключом budget:{user_id}:v{версия}:{name}."""
+    version = await budget_data_version(user_id)
+    if version is None:
+        return await loader()
+    return await cached_json(f"budget:{user_id}:v{version}:{name}", ttl_sec=BUDGET_CACHE_TTL_SEC, loader=loader)
+
+
+async def invalidate_budget_cache(user: User = Depends(get_current_user)) -> AsyncIterator[None]:
+    """
+    Зависимость для записывающих маршрутов: после успешного обработчика (и его commit)
+    увеличивает версию данных текущего пользователя. При ошибке версия не меняется.
+    """
+    yield
+    await bump_budget_version(user.id)
@@ -17,9 +17,10 @@ from app.backend.core.constants import (
     TRANSACTION_TYPE_INCOME,
     TRANSACTION_TYPE_TRANSFER,
 )
-from app.backend.core.security import decrypt_amount
 from app.backend.models.budget import BudgetAccount, BudgetCategory, BudgetTransaction
 from app.backend.models.user import User
+from app.backend.services.budget_aggregator import BudgetAggregate, BudgetAggregator, tx_day
+from app.backend.services.budget_amounts import tx_amount_map
 
 MONTHS_RU = (
     "",
@@ -58,19 +59,6 @@ THIN_BORDER = Border(
 )
 
 
-def _tx_amount(tx: BudgetTransaction) -> Decimal:
-    if tx.amount_encrypted:
-        return decrypt_amount(tx.amount_encrypted)
-    return Decimal(str(tx.amount or 0))
-
-
-def _tx_date(tx: BudgetTransaction) -> date:
-    occurred = tx.occurred_at
-    if hasattr(occurred, "date"):
-        return occurred.date()
-    return occurred
-
-
 def _period_title(d1: date, d2: date) -> str:
     if d1.year == d2.year and d1.month == d2.month and d1.day == 1:
         last_day = (d2.replace(day=28) + timedelta(days=4)).replace(day=1)
@@ -144,6 +132,8 @@ def _sheet_main(
     category_map: dict[int, BudgetCategory],
     period_txs: list[BudgetTransaction],
     history_txs: list[BudgetTransaction],
+    amounts: dict[int, Decimal],
+    agg: BudgetAggregate,
 ) -> None:
     ws = wb.active
     ws.title = "Бюджет"
@@ -151,10 +141,10 @@ def _sheet_main(
     start_balances: dict[int, Decimal] = defaultdict(lambda: Decimal("0"))
     end_balances: dict[int, Decimal] = defaultdict(lambda: Decimal("0"))
     for tx in history_txs:
-        amount = _tx_amount(tx)
-        tx_day = _tx_date(tx)
+        amount = amounts[tx.id]
+        day = tx_day(tx)
         _apply_tx_to_balances(end_balances, tx, amount)
-        if tx_day < d1:
+        if day < d1:
             _apply_tx_to_balances(start_balances, tx, amount)
 
     start_regular, start_savings = _split_balance_totals(accounts, start_balances)
@@ -163,32 +153,14 @@ def _sheet_main(
     income_txs = [tx for tx in period_txs if tx.type == TRANSACTION_TYPE_INCOME]
     expense_txs = [tx for tx in period_txs if tx.type == TRANSACTION_TYPE_EXPENSE]
 
-    income_total = sum((_tx_amount(tx) for tx in income_txs), Decimal("0"))
-    expense_total = sum((_tx_amount(tx) for tx in expense_txs), Decimal("0"))
-    net_total = income_total - expense_total
-
-    savings_delta = Decimal("0")
-    for tx in period_txs:
-        amount = _tx_amount(tx)
-        if tx.type == TRANSACTION_TYPE_INCOME:
-            acc = account_by_id.get(tx.account_id or 0)
-            if acc and acc.is_savings:
-                savings_delta += amount
-        elif tx.type == TRANSACTION_TYPE_EXPENSE:
-            acc = account_by_id.get(tx.account_id or 0)
-            if acc and acc.is_savings:
-                savings_delta -= amount
-        elif tx.type == TRANSACTION_TYPE_TRANSFER:
-            acc_to = account_by_id.get(tx.contra_account_id or 0)
-            acc_from = account_by_id.get(tx.account_id or 0)
-            if acc_to and acc_to.is_savings:
-                savings_delta += amount
-            elif acc_from and acc_from.is_savings:
-                savings_delta -= amount
+    income_total = agg.income
+    expense_total = agg.expense
+    net_total = agg.net
+    savings_delta = agg.savings_net
 
     period_days = (d2 - d1).days + 1
-    active_days = len({_tx_date(tx) for tx in period_txs})
-    tx_count = len(period_txs)
+    active_days = len(agg.active_days)
+    tx_count = agg.tx_count
     avg_income = income_total / Decimal(period_days) if period_days else Decimal("0")
     avg_expense = expense_total / Decimal(period_days) if period_days else Decimal("0")
     savings_rate = (income_total - expense_total) / income_total * Decimal("100") if income_total > 0 else Decimal("0")
@@ -345,19 +317,19 @@ def _sheet_main(
     income_row = data_row
     for tx in income_txs:
         category_name = category_map[tx.category_id].name if tx.category_id and tx.category_id in category_map else "—"
-        ws.cell(row=income_row, column=COL_INCOME, value=_tx_date(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
+        ws.cell(row=income_row, column=COL_INCOME, value=tx_day(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
         ws.cell(row=income_row, column=COL_INCOME + 1, value=tx.description or "—").border = THIN_BORDER
         ws.cell(row=income_row, column=COL_INCOME + 2, value=category_name).border = THIN_BORDER
-        _write_money_cell(ws, income_row, INCOME_SUM_COL, _tx_amount(tx), fill=FILL_INCOME_AMOUNT)
+        _write_money_cell(ws, income_row, INCOME_SUM_COL, amounts[tx.id], fill=FILL_INCOME_AMOUNT)
         income_row += 1
 
     expense_row = data_row
     for tx in expense_txs:
         category_name = category_map[tx.category_id].name if tx.category_id and tx.category_id in category_map else "—"
-        ws.cell(row=expense_row, column=COL_EXPENSE, value=_tx_date(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
+        ws.cell(row=expense_row, column=COL_EXPENSE, value=tx_day(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
         ws.cell(row=expense_row, column=COL_EXPENSE + 1, value=tx.description or "—").border = THIN_BORDER
         ws.cell(row=expense_row, column=COL_EXPENSE + 2, value=category_name).border = THIN_BORDER
-        _write_money_cell(ws, expense_row, EXPENSE_SUM_COL, _tx_amount(tx), fill=FILL_EXPENSE_AMOUNT)
+        _write_money_cell(ws, expense_row, EXPENSE_SUM_COL, amounts[tx.id], fill=FILL_EXPENSE_AMOUNT)
         expense_row += 1
 
     if income_row > data_row:
@@ -404,6 +376,7 @@ def _sheet_operations(
     account_by_id: dict[int, BudgetAccount],
     category_map: dict[int, BudgetCategory],
     period_txs: list[BudgetTransaction],
+    amounts: dict[int, Decimal],
 ) -> None:
     ws = wb.create_sheet("Операции")
     headers = ("Дата", "Тип", "Сумма", "Счет", "Контр. счет", "Категория", "Описание")
@@ -417,10 +390,10 @@ def _sheet_operations(
 
     row = 2
     for tx in period_txs:
-        ws.cell(row=row, column=1, value=_tx_date(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
+        ws.cell(row=row, column=1, value=tx_day(tx).strftime("%d.%m.%Y")).border = THIN_BORDER
         ws.cell(row=row, column=2, value=type_labels.get(tx.type, tx.type)).border = THIN_BORDER
 
-        sum_cell = ws.cell(row=row, column=3, value=float(_tx_amount(tx)))
+        sum_cell = ws.cell(row=row, column=3, value=float(amounts[tx.id]))
         sum_cell.number_format = '#,##0" ₽"'
         sum_cell.alignment = Alignment(horizontal="right", vertical="center")
         sum_cell.border = THIN_BORDER
@@ -442,8 +415,8 @@ def _sheet_analytics(
     *,
     d1: date,
     d2: date,
-    category_map: dict[int, BudgetCategory],
-    period_txs: list[BudgetTransaction],
+    aggregator: BudgetAggregator,
+    agg: BudgetAggregate,
 ) -> None:
     ws = wb.create_sheet("Аналитика")
     ws.column_dimensions["A"].width = 30
@@ -465,20 +438,12 @@ def _sheet_analytics(
 
     income_by_cat: dict[str, Decimal] = defaultdict(lambda: Decimal("0"))
     expense_by_cat: dict[str, Decimal] = defaultdict(lambda: Decimal("0"))
-    by_day_income: dict[date, Decimal] = defaultdict(lambda: Decimal("0"))
-    by_day_expense: dict[date, Decimal] = defaultdict(lambda: Decimal("0"))
-
-    for tx in period_txs:
-        amount = _tx_amount(tx)
-        tx_day = _tx_date(tx)
-        cat_name = category_map.get(tx.category_id or 0).name if tx.category_id and tx.category_id in category_map else "Без категории"
-
-        if tx.type == TRANSACTION_TYPE_INCOME:
-            income_by_cat[cat_name] += amount
-            by_day_income[tx_day] += amount
-        elif tx.type == TRANSACTION_TYPE_EXPENSE:
-            expense_by_cat[cat_name] += amount
-            by_day_expense[tx_day] += amount
+    for category_id, amount in agg.income_by_category.items():
+        income_by_cat[aggregator.category_name(category_id, "Без категории")] += amount
+    for category_id, amount in agg.expense_by_category.items():
+        expense_by_cat[aggregator.category_name(category_id, "Без категории")] += amount
+    by_day_income = agg.income_by_day
+    by_day_expense = agg.expense_by_day
 
     _table_header(ws, 3, 1, ("Топ источники дохода", "Сумма"), FILL_INCOME_HEADER)
     _table_header(ws, 3, 4, ("Топ категории расхода", "Сумма"), FILL_EXPENSE_HEADER)
@@ -539,29 +504,23 @@ def build_budget_excel_bytes(
         c.id: c for c in db.scalars(select(BudgetCategory).where(BudgetCategory.user_id == user.id)).all()
     }
 
-    period_txs = list(
-        db.scalars(
-            select(BudgetTransaction)
-            .where(
-                BudgetTransaction.user_id == user.id,
-                BudgetTransaction.occurred_at >= d1,
-                BudgetTransaction.occurred_at <= d2,
-            )
-            .order_by(BudgetTransaction.occurred_at.asc(), BudgetTransaction.id.asc())
-        ).all()
-    )
-
     history_txs = list(
         db.scalars(
             select(BudgetTransaction)
             .where(
                 BudgetTransaction.user_id == user.id,
-                BudgetTransaction.occurred_at <= d2,
+                BudgetTransaction.occurred_at < d2 + timedelta(days=1),
             )
             .order_by(BudgetTransaction.occurred_at.asc(), BudgetTransaction.id.asc())
         ).all()
     )
 
+    # Период — хвост истории: одна выборка и одна пачка расшифровки на всё
+    amounts = tx_amount_map(history_txs)
+    period_txs = [tx for tx in history_txs if tx_day(tx) >= d1]
+    aggregator = BudgetAggregator(account_by_id, category_map)
+    agg = aggregator.aggregate_transactions(period_txs, [amounts[tx.id] for tx in period_txs])
+
     _sheet_main(
         wb,
         user=user,
@@ -572,9 +531,11 @@ def build_budget_excel_bytes(
         category_map=category_map,
         period_txs=period_txs,
         history_txs=history_txs,
+        amounts=amounts,
+        agg=agg,
     )
-    _sheet_analytics(wb, d1=d1, d2=d2, category_map=category_map, period_txs=period_txs)
-    _sheet_operations(wb, account_by_id=account_by_id, category_map=category_map, period_txs=period_txs)
+    _sheet_analytics(wb, d1=d1, d2=d2, aggregator=aggregator, agg=agg)
+    _sheet_operations(wb, account_by_id=account_by_id, category_map=category_map, period_txs=period_txs, amounts=amounts)
 
     stream = BytesIO()
     wb.save(stream)
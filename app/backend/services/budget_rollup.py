@@ -0,0 +1,249 @@
+"""
+Помесячные агрегаты бюджета (pf.budget_monthly_rollups).
+
+Ключ агрегата: (user_id, год, месяц, тип, счёт, контр-счёт, категория). Сумма хранится
+зашифрованной, поэтому обновление — это read-modify-write строки под FOR UPDATE в той же
+транзакции БД, что и изменение budget_transactions. Перестроение по пользователю берёт
+эксклюзивную advisory-блокировку, инкрементальные записи — разделяемую.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.backend.core.security import decrypt_amount, decrypt_amounts, encrypt_amount_v2
+from app.backend.models.budget import BudgetMonthlyRollup, BudgetRollupState, BudgetTransaction
+from app.backend.services.budget_amounts import tx_amounts
+
+_LOCK_NAMESPACE = 0x6275  # "bu"
+
+RollupKey = tuple[int, int, str, int, int, int]  # year, month, type, account, contra, category
+
+
+@dataclass(frozen=True)
+class RollupEntry:
+    year: int
+    month: int
+    type: str
+    account_id: int
+    contra_account_id: Optional[int]
+    category_id: Optional[int]
+    amount: Decimal
+    tx_count: int
+
+
+def _period(occurred: datetime | date | str) -> tuple[int, int]:
+    if isinstance(occurred, str):
+        occurred = date.fromisoformat(occurred[:10])
+    return occurred.year, occurred.month
+
+
+def _key(tx: BudgetTransaction) -> RollupKey:
+    year, month = _period(tx.occurred_at)
+    return (year, month, tx.type, tx.account_id, tx.contra_account_id or 0, tx.category_id or 0)
+
+
+def _key_filter(user_id: int, key: RollupKey):
+    year, month, tx_type, account_id, contra_id, category_id = key
+    return (
+        BudgetMonthlyRollup.user_id == user_id,
+        BudgetMonthlyRollup.year == year,
+        BudgetMonthlyRollup.month == month,
+        BudgetMonthlyRollup.type == tx_type,
+        BudgetMonthlyRollup.account_id == account_id,
+        BudgetMonthlyRollup.contra_account_id == contra_id,
+        BudgetMonthlyRollup.category_id == category_id,
+    )
+
+
+def _lock_user(db: Session, user_id: int, *, exclusive: bool) -> None:
+    fn = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    db.execute(text(f"SELECT {fn}(:ns, CAST(:uid AS integer))"), {"ns": _LOCK_NAMESPACE, "uid": user_id})
+
+
+def group_transactions(txs: Iterable[BudgetTransaction], amounts: Iterable[Decimal]) -> dict[RollupKey, tuple[Decimal, int]]:
+    """Группирует транзакции по ключу агрегата: ключ -> (сумма, количество)."""
+    groups: dict[RollupKey, tuple[Decimal, int]] = {}
+    for tx, amount in zip(txs, amounts):
+        key = _key(tx)
+        total, count = groups.get(key, (Decimal(0), 0))
+        groups[key] = (total + amount, count + 1)
+    return groups
+
+
+def apply_transaction(db: Session, tx: BudgetTransaction, amount: Decimal, *, sign: int = 1) -> None:
+    """
+    Добавляет (sign=1) или вычитает (sign=-1) транзакцию из агрегата.
+    Не коммитит — вызывается в транзакции, которая меняет budget_transactions.
+    """
+    # autoflush выключен: сбрасываем отложенные изменения агрегатов этой же транзакции
+    db.flush()
+    _lock_user(db, tx.user_id, exclusive=False)
+    key = _key(tx)
+    year, month, tx_type, account_id, contra_id, category_id = key
+    db.execute(
+        pg_insert(BudgetMonthlyRollup)
+        .values(
+            user_id=tx.user_id,
+            year=year,
+            month=month,
+            type=tx_type,
+            account_id=account_id,
+            contra_account_id=contra_id,
+            category_id=category_id,
+            amount_encrypted=encrypt_amount_v2(0),
+            tx_count=0,
+        )
+        .on_conflict_do_nothing(constraint="uq_budget_monthly_rollups_key")
+    )
+    row = db.execute(
+        select(BudgetMonthlyRollup).where(*_key_filter(tx.user_id, key)).with_for_update()
+    ).scalar_one()
+
+    new_count = (row.tx_count or 0) + sign
+    if new_count <= 0:
+        db.delete(row)
+        return
+    row.amount_encrypted = encrypt_amount_v2(decrypt_amount(row.amount_encrypted) + sign * Decimal(amount))
+    row.tx_count = new_count
+
+
+def detach_contra_account(db: Session, user_id: int, account_id: int) -> None:
+    """
+    Перед удалением счёта: его переводы в budget_transactions теряют контр-счёт (SET NULL),
+    поэтому агрегаты с этим контр-счётом переносятся в ключ с контр-счётом 0 — иначе
+    последующее удаление или правка такого перевода не найдёт свою строку агрегата.
+    Не коммитит.
+    """
+    db.flush()
+    _lock_user(db, user_id, exclusive=True)
+    rows = list(
+        db.scalars(
+            select(BudgetMonthlyRollup).where(
+                BudgetMonthlyRollup.user_id == user_id,
+                BudgetMonthlyRollup.contra_account_id == account_id,
+            )
+        ).all()
+    )
+    if not rows:
+        return
+    merged: dict[RollupKey, tuple[Decimal, int]] = {}
+    for row, amount in zip(rows, decrypt_amounts(r.amount_encrypted for r in rows)):
+        key = (row.year, row.month, row.type, row.account_id, 0, row.category_id)
+        total, count = merged.get(key, (Decimal(0), 0))
+        merged[key] = (total + amount, count + (row.tx_count or 0))
+        db.delete(row)
+    db.flush()
+
+    for key, (total, count) in merged.items():
+        target = db.execute(select(BudgetMonthlyRollup).where(*_key_filter(user_id, key))).scalar_one_or_none()
+        if target is None:
+            year, month, tx_type, acc_id, contra_id, category_id = key
+            db.add(BudgetMonthlyRollup(
+                user_id=user_id,
+                year=year,
+                month=month,
+                type=tx_type,
+                account_id=acc_id,
+                contra_account_id=contra_id,
+                category_id=category_id,
+                amount_encrypted=encrypt_amount_v2(total),
+                tx_count=count,
+            ))
+        else:
+            target.amount_encrypted = encrypt_amount_v2(decrypt_amount(target.amount_encrypted) + total)
+            target.tx_count = (target.tx_count or 0) + count
+    db.flush()
+
+
+def rebuild_user_rollups(db: Session, user_id: int) -> int:
+    """
+    Полностью пересчитывает агрегаты пользователя из budget_transactions.
+    Не коммитит. Возвращает число строк агрегата.
+    """
+    _lock_user(db, user_id, exclusive=True)
+    db.execute(delete(BudgetMonthlyRollup).where(BudgetMonthlyRollup.user_id == user_id))
+
+    txs = list(db.scalars(select(BudgetTransaction).where(BudgetTransaction.user_id == user_id)).all())
+    groups = group_transactions(txs, tx_amounts(txs))
+    if groups:
+        db.execute(
+            insert(BudgetMonthlyRollup),
+            [
+                {
+                    "user_id": user_id,
+                    "year": year,
+                    "month": month,
+                    "type": tx_type,
+                    "account_id": account_id,
+                    "contra_account_id": contra_id,
+                    "category_id": category_id,
+                    "amount_encrypted": encrypt_amount_v2(total),
+                    "tx_count": count,
+                }
+                for (year, month, tx_type, account_id, contra_id, category_id), (total, count) in groups.items()
+            ],
+        )
+
+    db.execute(
+        pg_insert(BudgetRollupState)
+        .values(user_id=user_id)
+        .on_conflict_do_update(index_elements=["user_id"], set_={"rebuilt_at": text("now()")})
+    )
+    return len(groups)
+
+
+def month_span(d1: date, d2: date) -> Optional[tuple[int, int]]:
+    """
+    Если [d1, d2] покрывает целые месяцы — (индекс первого, индекс последнего) как year*12+month,
+    иначе None (такой диапазон агрегатами не обслуживается).
+    """
+    if d1.day != 1 or d2 < d1 or (d2 + timedelta(days=1)).day != 1:
+        return None
+    return d1.year * 12 + d1.month, d2.year * 12 + d2.month
+
+
+def load_rollups(db: Session, user_id: int, d1: date, d2: date) -> Optional[list[RollupEntry]]:
+    """
+    Агрегаты за [d1, d2] или None, если диапазон не выровнен по месяцам.
+    При первом обращении агрегаты пользователя строятся (и коммитятся).
+    """
+    span = month_span(d1, d2)
+    if span is None:
+        return None
+
+    if db.get(BudgetRollupState, user_id) is None:
+        rebuild_user_rollups(db, user_id)
+        db.commit()
+
+    period_idx = BudgetMonthlyRollup.year * 12 + BudgetMonthlyRollup.month
+    rows = list(
+        db.scalars(
+            select(BudgetMonthlyRollup).where(
+                BudgetMonthlyRollup.user_id == user_id,
+                period_idx >= span[0],
+                period_idx <= span[1],
+            )
+        ).all()
+    )
+    amounts = decrypt_amounts(r.amount_encrypted for r in rows)
+    return [
+        RollupEntry(
+            year=r.year,
+            month=r.month,
+            type=r.type,
+            account_id=r.account_id,
+            contra_account_id=r.contra_account_id or None,
+            category_id=r.category_id or None,
+            amount=amount,
+            tx_count=r.tx_count,
+        )
+        for r, amount in zip(rows, amounts)
+    ]
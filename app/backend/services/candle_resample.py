@@ -0,0 +1,64 @@
+"""
+Пересборка свечей в более крупный интервал (1min -> 5min/15min/1h/1d) на NumPy.
+
+Корзины внутридневных интервалов выровнены от эпохи в UTC — как у свечей Tinkoff.
+Дневные собираются по календарной дате биржи (tz), метка — полночь UTC этой даты:
+торговый день MOEX целиком лежит внутри UTC-суток, поэтому вечерняя сессия не
+переезжает в следующий день.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def _utc_offsets(ts: np.ndarray, tz: str) -> np.ndarray | int:
+    """Смещение tz от UTC (сек) для меток ts; без перехода на летнее время — одно число."""
+    zone = ZoneInfo(tz)
+
+    def _offset(sec: int) -> int:
+        return int(datetime.fromtimestamp(sec, tz=zone).utcoffset().total_seconds())
+
+    first, last = _offset(int(ts[0])), _offset(int(ts[-1]))
+    if first == last:
+        return first
+    return np.fromiter((_offset(int(s)) for s in ts), dtype=np.int64, count=len(ts))
+
+
+def resample(candles: Sequence[dict], step: timedelta, *, tz: Optional[str] = None) -> list[dict]:
+    """
+    Собирает свечи (dict time/open/high/low/close/volume) в корзины длиной step.
+    tz задаётся для дневных интервалов: корзина — календарный день в этой зоне.
+    """
+    if not candles:
+        return []
+    ts = np.fromiter((int(c["time"].timestamp()) for c in candles), dtype=np.int64, count=len(candles))
+    cols = {f: np.array([c[f] for c in candles], dtype=np.int64 if f == "volume" else np.float64) for f in _FIELDS}
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    cols = {f: v[order] for f, v in cols.items()}
+
+    step_sec = int(step.total_seconds())
+    local = ts + _utc_offsets(ts, tz) if tz else ts
+    buckets = local // step_sec
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+
+    labels = buckets[starts] * step_sec
+    opens = cols["open"][starts]
+    closes = cols["close"][ends - 1]
+    highs = np.maximum.reduceat(cols["high"], starts)
+    lows = np.minimum.reduceat(cols["low"], starts)
+    volumes = np.add.reduceat(cols["volume"], starts)
+
+    return [
+        {"time": datetime.fromtimestamp(int(t), tz=timezone.utc), "open": float(o), "high": float(h),
+         "low": float(lo), "close": float(c), "volume": int(v)}
+        for t, o, h, lo, c, v in zip(labels, opens, highs, lows, closes, volumes)
+    ]
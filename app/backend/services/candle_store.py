@@ -0,0 +1,237 @@
+"""
+Локальное хранилище свечей (pf.candles, партиции по интервалу).
+
+Окно запроса выравнивается по границам интервала. Завершённые свечи (до «горизонта» —
+начала текущей свечи минус CANDLES_SETTLE_SEC) читаются из БД; pf.candle_ranges хранит,
+какие диапазоны уже загружены, и из Tinkoff догружаются только пробелы — кусками не
+длиннее лимита get_candles для интервала, каждый сохраняется сразу. Незавершённый хвост
+окна не сохраняется: он берётся из API и кэшируется в Redis под ключом, выровненным по
+интервалу.
+
+Если окно целевого интервала не загружено, но целиком загружен более мелкий
+(RESAMPLE_SOURCES), свечи собираются из него локально — без запросов к API.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.core.cache import cached_json
+from app.backend.core.constants import (
+    CANDLES_CACHE_TTL_SEC,
+    CANDLES_EXCHANGE_TZ,
+    CANDLES_INSERT_BATCH,
+    CANDLES_REQUEST_WINDOW_DAYS,
+    CANDLES_SETTLE_SEC,
+)
+from app.backend.db.async_session import AsyncSessionLocal
+from app.backend.models.candle import Candle, CandleRange
+from app.backend.services.candle_resample import resample
+
+_LOCK_NAMESPACE = 0x6361  # "ca"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+INTERVAL_STEPS: dict[str, timedelta] = {
+    "1min": timedelta(minutes=1),
+    "5min": timedelta(minutes=5),
+    "15min": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# из каких хранимых интервалов собирается целевой: от крупного к мелкому (меньше строк)
+RESAMPLE_SOURCES: dict[str, tuple[str, ...]] = {
+    "5min": ("1min",),
+    "15min": ("5min", "1min"),
+    "1h": ("15min", "5min", "1min"),
+    "1d": ("1h", "15min", "5min", "1min"),
+}
+
+Range = tuple[datetime, datetime]
+# загрузка свечей из API за [from, to): dict с полями time/open/high/low/close/volume
+Fetcher = Callable[[datetime, datetime], Awaitable[list[dict]]]
+
+_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+# ---------- диапазоны ----------
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def floor_time(ts: datetime, step: timedelta) -> datetime:
+    """Начало интервала, которому принадлежит ts (границы от эпохи, UTC)."""
+    return _EPOCH + ((ts - _EPOCH) // step) * step
+
+
+def ceil_time(ts: datetime, step: timedelta) -> datetime:
+    floored = floor_time(ts, step)
+    return floored if floored == ts else floored + step
+
+
+def align_window(start: datetime, end: datetime, interval: str) -> Range:
+    step = INTERVAL_STEPS[interval]
+    return floor_time(_as_utc(start), step), ceil_time(_as_utc(end), step)
+
+
+def merge_ranges(ranges: Iterable[Range]) -> list[Range]:
+    """Сливает пересекающиеся и соседние диапазоны."""
+    out: list[Range] = []
+    for start, end in sorted(ranges):
+        if out and start <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], end))
+        else:
+            out.append((start, end))
+    return out
+
+
+def missing_ranges(covered: Iterable[Range], start: datetime, end: datetime) -> list[Range]:
+    """Части [start, end), не покрытые загруженными диапазонами."""
+    gaps: list[Range] = []
+    cursor = start
+    for c_start, c_end in merge_ranges(covered):
+        if c_end <= cursor:
+            continue
+        if c_start >= end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def split_range(start: datetime, end: datetime, window: timedelta) -> list[Range]:
+    """Режет диапазон на куски не длиннее window (лимит одного get_candles)."""
+    out: list[Range] = []
+    while start < end:
+        out.append((start, min(start + window, end)))
+        start = out[-1][1]
+    return out
+
+
+def settled_horizon(interval: str, now: Optional[datetime] = None) -> datetime:
+    """Граница, до которой свечи завершены и больше не меняются."""
+    now = now or datetime.now(timezone.utc)
+    return floor_time(now - timedelta(seconds=CANDLES_SETTLE_SEC), INTERVAL_STEPS[interval])
+
+
+# ---------- БД ----------
+
+async def _covered(db: AsyncSession, figi: str, interval: str, start: datetime, end: datetime) -> list[Range]:
+    rows = await db.execute(
+        select(CandleRange.range_start, CandleRange.range_end).where(
+            CandleRange.figi == figi,
+            CandleRange.interval == interval,
+            CandleRange.range_end >= start,
+            CandleRange.range_start <= end,
+        )
+    )
+    return [(r.range_start, r.range_end) for r in rows]
+
+
+async def _store(db: AsyncSession, figi: str, interval: str, candles: list[dict], loaded: list[Range]) -> None:
+    """Пишет свечи и отмечает диапазоны загруженными (слияние — под advisory-блокировкой)."""
+    await db.execute(
+        text("SELECT pg_advisory_xact_lock(:ns, hashtext(:key))"),
+        {"ns": _LOCK_NAMESPACE, "key": f"{figi}:{interval}"},
+    )
+    for i in range(0, len(candles), CANDLES_INSERT_BATCH):
+        batch = [{"figi": figi, "interval": interval, "ts": c["time"], **{f: c[f] for f in _FIELDS}}
+                 for c in candles[i:i + CANDLES_INSERT_BATCH]]
+        stmt = pg_insert(Candle).values(batch)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[Candle.figi, Candle.interval, Candle.ts],
+            set_={f: getattr(stmt.excluded, f) for f in _FIELDS},
+        ))
+
+    lo, hi = min(s for s, _ in loaded), max(e for _, e in loaded)
+    touching = await _covered(db, figi, interval, lo, hi)
+    await db.execute(
+        delete(CandleRange).where(
+            CandleRange.figi == figi,
+            CandleRange.interval == interval,
+            CandleRange.range_start.in_([s for s, _ in touching]),
+        )
+    )
+    db.add_all(
+        CandleRange(figi=figi, interval=interval, range_start=s, range_end=e)
+        for s, e in merge_ranges([*touching, *loaded])
+    )
+
+
+async def _stored(db: AsyncSession, figi: str, interval: str, start: datetime, end: datetime) -> list[dict]:
+    rows = await db.execute(
+        select(Candle.ts, Candle.open, Candle.high, Candle.low, Candle.close, Candle.volume)
+        .where(Candle.figi == figi, Candle.interval == interval, Candle.ts >= start, Candle.ts < end)
+        .order_by(Candle.ts)
+    )
+    return [{"time": r.ts, **{f: getattr(r, f) for f in _FIELDS}} for r in rows]
+
+
+# ---------- чтение ----------
+
+async def _resampled(db: AsyncSession, figi: str, interval: str, start: datetime, end: datetime) -> Optional[list[dict]]:
+    """Свечи, собранные из более мелкого интервала, если он целиком загружен на окне."""
+    for source in RESAMPLE_SOURCES.get(interval, ()):
+        if not missing_ranges(await _covered(db, figi, source, start, end), start, end):
+            rows = await _stored(db, figi, source, start, end)
+            return resample(rows, INTERVAL_STEPS[interval], tz=CANDLES_EXCHANGE_TZ if interval == "1d" else None)
+    return None
+
+
+async def _settled(figi: str, interval: str, start: datetime, end: datetime, fetch: Fetcher) -> list[dict]:
+    async with AsyncSessionLocal() as db:
+        gaps = missing_ranges(await _covered(db, figi, interval, start, end), start, end)
+        if gaps:
+            derived = await _resampled(db, figi, interval, start, end)
+            if derived is not None:
+                return derived
+        await db.rollback()  # не держим транзакцию на время запросов к API
+        if gaps:
+            window = timedelta(days=CANDLES_REQUEST_WINDOW_DAYS[interval])
+            for gap in gaps:
+                for s, e in split_range(*gap, window):
+                    chunk = [c for c in await fetch(s, e) if s <= c["time"] < e]
+                    # каждый кусок сохраняется сразу: ошибка на следующем не теряет загруженное
+                    await _store(db, figi, interval, chunk, [(s, e)])
+                    await db.commit()
+        return await _stored(db, figi, interval, start, end)
+
+
+async def _tail(figi: str, interval: str, start: datetime, end: datetime, fetch: Fetcher) -> list[dict]:
+    async def _load():
+        return [{**c, "time": c["time"].isoformat()} for c in await fetch(start, end)]
+
+    key = f"candles:tail:{figi}:{interval}:{start.isoformat()}:{end.isoformat()}"
+    data = await cached_json(key, ttl_sec=CANDLES_CACHE_TTL_SEC, loader=_load)
+    return [{**c, "time": datetime.fromisoformat(c["time"])} for c in data]
+
+
+async def load_candles(
+    figi: str,
+    interval: str,
+    start: datetime,
+    end: datetime,
+    fetch: Fetcher,
+    *,
+    now: Optional[datetime] = None,
+) -> list[dict]:
+    """Свечи за окно [start, end), выровненное по интервалу; из API — только пробелы и хвост."""
+    start, end = align_window(start, end, interval)
+    horizon = settled_horizon(interval, now)
+    out: list[dict] = []
+    if start < min(end, horizon):
+        out.extend(await _settled(figi, interval, start, min(end, horizon), fetch))
+    if end > horizon:
+        out.extend(await _tail(figi, interval, max(start, horizon), end, fetch))
+    return out
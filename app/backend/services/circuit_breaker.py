@@ -0,0 +1,81 @@
+"""
+Предохранитель (circuit breaker) для вызовов внешнего API.
+
+- closed: вызовы идут; ошибка или вызов дольше slow_call_sec — сбой, успешный быстрый
+  вызов обнуляет счётчик. failure_threshold сбоев подряд — размыкание.
+- open: вызовы отклоняются сразу, без ожидания таймаутов; через open_sec — half-open.
+- half-open: пропускается один пробный вызов. Успех — closed, сбой — снова open.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, *, failure_threshold: int, open_sec: float, slow_call_sec: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.open_sec = open_sec
+        self.slow_call_sec = slow_call_sec
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Можно ли сделать вызов сейчас; в half-open разрешает ровно одну пробу."""
+        if self.state == OPEN:
+            if time.monotonic() - (self.opened_at or 0.0) < self.open_sec:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def record(self, latency_sec: float, *, error: bool) -> None:
+        if error or latency_sec > self.slow_call_sec:
+            self._failure()
+        else:
+            self._success()
+
+    def release(self) -> None:
+        """Вызов завершился без вердикта (например, ошибка токена): проба освобождается."""
+        self._probing = False
+
+    def _success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def _failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict[str, Any]:
+        retry_in = None
+        if self.state == OPEN and self.opened_at is not None:
+            retry_in = round(max(0.0, self.open_sec - (time.monotonic() - self.opened_at)), 3)
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_in_sec": retry_in,
+        }
@@ -0,0 +1,282 @@
+"""
+Справочник инструментов Tinkoff (акции, облигации, фонды), общий для всех воркеров.
+
+Каталог строит один воркер (блокировка в Redis) раз в INSTRUMENTS_REFRESH_SEC и кладёт
+в Redis версионированный снимок: колонки вместо словаря на инструмент, строки
+интернированы, полезная нагрузка сжата zlib. Остальные воркеры раз в INSTRUMENTS_SYNC_SEC
+сверяют версию и, если она сменилась, подменяют снимок целиком: читатель, взявший
+instrument_registry.snapshot, до конца запроса видит одну согласованную версию.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import sys
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+import numpy as np
+
+from app.backend.core.cache import get_redis
+from app.backend.core.constants import (
+    BOND_DEFAULT_NOMINAL,
+    INSTRUMENTS_BUILD_LOCK_TTL_SEC,
+    INSTRUMENTS_REFRESH_SEC,
+    INSTRUMENTS_SYNC_SEC,
+    NANO_TO_FLOAT_DIVISOR,
+)
+
+log = logging.getLogger("market.instruments")
+
+SNAPSHOT_KEY = "market:instruments:snapshot"
+VERSION_KEY = "market:instruments:version"
+LOCK_KEY = "market:instruments:lock"
+
+CLASSES = ("share", "bond", "etf")
+_COLUMNS = ("figi", "ticker", "class", "name", "currency", "isin", "nominal", "maturity")
+
+
+def _q2f(q: Any) -> float:
+    if q is None:
+        return 0.0
+    return float(getattr(q, "units", 0)) + float(getattr(q, "nano", 0)) / NANO_TO_FLOAT_DIVISOR
+
+
+def _ts(dt: Any) -> float:
+    # пустые даты в API приходят как 1970-01-01
+    return dt.timestamp() if dt is not None and dt.year > 1970 else 0.0
+
+
+def _intern(s: Optional[str]) -> Optional[str]:
+    return sys.intern(s) if s else None
+
+
+class InstrumentSnapshot:
+    """Неизменяемый снимок каталога: колонки плюс индексы по FIGI и тикеру."""
+
+    __slots__ = (
+        "version", "figi", "ticker", "cls", "name", "currency", "isin", "nominal", "maturity",
+        "_by_figi", "_by_ticker", "_by_ticker_class",
+    )
+
+    def __init__(self, version: int, columns: dict[str, Sequence[Any]]):
+        self.version = version
+        self.figi: tuple[str, ...] = tuple(sys.intern(f) for f in columns["figi"])
+        self.ticker: tuple[str, ...] = tuple(sys.intern(t) for t in columns["ticker"])
+        self.cls = np.asarray(columns["class"], dtype=np.int8)  # индекс в CLASSES
+        self.name: tuple[Optional[str], ...] = tuple(columns["name"])
+        self.currency: tuple[Optional[str], ...] = tuple(_intern(c) for c in columns["currency"])
+        self.isin: tuple[Optional[str], ...] = tuple(columns["isin"])
+        self.nominal = np.asarray(columns["nominal"], dtype=np.float64)  # 0 — не облигация
+        # дата погашения, unix; 0 — нет (снимки прежних версий колонки не содержат)
+        self.maturity = np.asarray(columns.get("maturity") or np.zeros(len(self.figi)), dtype=np.float64)
+        self._by_figi = {f: i for i, f in enumerate(self.figi)}
+        by_ticker: dict[str, list[int]] = {}
+        for i, t in enumerate(self.ticker):
+            by_ticker.setdefault(t, []).append(i)
+        self._by_ticker = {t: tuple(rows) for t, rows in by_ticker.items()}
+        # первая строка тикера по классу: разрешение с class_hint — один dict-lookup
+        self._by_ticker_class: dict[tuple[str, int], int] = {}
+        for i in range(len(self.ticker) - 1, -1, -1):
+            self._by_ticker_class[(self.ticker[i], int(self.cls[i]))] = i
+
+    @classmethod
+    def empty(cls) -> "InstrumentSnapshot":
+        return cls(0, {c: [] for c in _COLUMNS})
+
+    @classmethod
+    def from_api(cls, version: int, shares: Sequence[Any], bonds: Sequence[Any], etfs: Sequence[Any]) -> "InstrumentSnapshot":
+        columns: dict[str, list[Any]] = {c: [] for c in _COLUMNS}
+        for code, items in enumerate((shares, bonds, etfs)):
+            for it in items:
+                ticker = (getattr(it, "ticker", None) or "").strip().upper()
+                figi = getattr(it, "figi", None)
+                if not ticker or not figi:
+                    continue
+                columns["figi"].append(figi)
+                columns["ticker"].append(ticker)
+                columns["class"].append(code)
+                columns["name"].append(getattr(it, "name", None))
+                columns["currency"].append(getattr(it, "currency", None))
+                columns["isin"].append(getattr(it, "isin", None))
+                is_bond = CLASSES[code] == "bond"
+                columns["nominal"].append((_q2f(getattr(it, "nominal", None)) or BOND_DEFAULT_NOMINAL) if is_bond else 0.0)
+                columns["maturity"].append(_ts(getattr(it, "maturity_date", None)) if is_bond else 0.0)
+        return cls(version, columns)
+
+    def __len__(self) -> int:
+        return len(self.figi)
+
+    def row(self, figi: str) -> Optional[int]:
+        return self._by_figi.get(figi)
+
+    def record(self, i: int) -> dict[str, Any]:
+        nominal = float(self.nominal[i])
+        maturity = float(self.maturity[i])
+        return {
+            "figi": self.figi[i],
+            "class": CLASSES[self.cls[i]],
+            "name": self.name[i],
+            "currency": self.currency[i],
+            "isin": self.isin[i],
+            "nominal": nominal or None,
+            "maturity": maturity or None,
+            "ticker": self.ticker[i],
+        }
+
+    def by_figi(self, figi: str) -> Optional[dict[str, Any]]:
+        i = self._by_figi.get(figi)
+        return None if i is None else self.record(i)
+
+    def by_ticker(self, ticker: str) -> list[dict[str, Any]]:
+        return [self.record(i) for i in self._by_ticker.get(ticker.strip().upper(), ())]
+
+    def resolve_many(self, tickers: Sequence[str], class_hint: Optional[str] = None) -> np.ndarray:
+        """
+        Строка снимка для каждого тикера (первое совпадение, с class_hint — первое этого
+        класса) или -1. Тикеры ожидаются уже нормализованными (strip + upper).
+        """
+        out = np.full(len(tickers), -1, dtype=np.int64)
+        if class_hint is None:
+            for j, t in enumerate(tickers):
+                rows = self._by_ticker.get(t)
+                if rows:
+                    out[j] = rows[0]
+        elif class_hint in CLASSES:
+            code = CLASSES.index(class_hint)
+            for j, t in enumerate(tickers):
+                out[j] = self._by_ticker_class.get((t, code), -1)
+        return out
+
+    def dumps(self) -> str:
+        payload = {
+            "version": self.version,
+            "figi": self.figi,
+            "ticker": self.ticker,
+            "class": self.cls.tolist(),
+            "name": self.name,
+            "currency": self.currency,
+            "isin": self.isin,
+            "nominal": self.nominal.tolist(),
+            "maturity": self.maturity.tolist(),
+        }
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+    @classmethod
+    def loads(cls, data: str) -> "InstrumentSnapshot":
+        payload = json.loads(zlib.decompress(base64.b64decode(data)))
+        return cls(int(payload["version"]), payload)
+
+
+async def _fetch_catalog(token: str) -> tuple[Sequence[Any], Sequence[Any], Sequence[Any]]:
+    from app.backend.services.tinkoff_scheduler import tinkoff_scheduler
+
+    shares, bonds, etfs = await asyncio.gather(
+        tinkoff_scheduler.call(token, "instruments", lambda c: c.instruments.shares()),
+        tinkoff_scheduler.call(token, "instruments", lambda c: c.instruments.bonds()),
+        tinkoff_scheduler.call(token, "instruments", lambda c: c.instruments.etfs()),
+    )
+    return shares.instruments, bonds.instruments, etfs.instruments
+
+
+class InstrumentRegistry:
+    def __init__(self, *, fetch: Callable[[str], Awaitable[tuple]] = _fetch_catalog):
+        self._fetch = fetch
+        self.snapshot = InstrumentSnapshot.empty()
+        self._build_lock = asyncio.Lock()
+        self._listeners: list[Callable[[InstrumentSnapshot], Awaitable[Any]]] = []
+
+    def on_update(self, listener: Callable[[InstrumentSnapshot], Awaitable[Any]]) -> None:
+        """Вызывается после подмены снимка (например, чтобы заранее построить поисковый индекс)."""
+        self._listeners.append(listener)
+
+    async def _swap(self, snapshot: InstrumentSnapshot) -> None:
+        self.snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                await listener(snapshot)
+            except Exception:
+                log.exception("instrument registry listener failed")
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    async def sync(self) -> bool:
+        """Подхватывает снимок из Redis, если его версия новее текущей."""
+        r = await get_redis()
+        version = await r.get(VERSION_KEY)
+        if not version or int(version) <= self.snapshot.version:
+            return False
+        data = await r.get(SNAPSHOT_KEY)
+        if not data:
+            return False
+        started = time.perf_counter()
+        snapshot = InstrumentSnapshot.loads(data)
+        await self._swap(snapshot)
+        log.info("Справочник инструментов v%s: %s шт., загружен за %.0f мс",
+                 snapshot.version, len(snapshot), (time.perf_counter() - started) * 1000)
+        return True
+
+    async def _build(self, token: str) -> InstrumentSnapshot:
+        shares, bonds, etfs = await self._fetch(token)
+        snapshot = InstrumentSnapshot.from_api(int(time.time()), shares, bonds, etfs)
+        await self._swap(snapshot)
+        try:
+            r = await get_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.set(SNAPSHOT_KEY, snapshot.dumps())
+                pipe.set(VERSION_KEY, snapshot.version)
+                await pipe.execute()
+        except Exception:
+            log.warning("Не удалось опубликовать справочник инструментов", exc_info=True)
+        return snapshot
+
+    async def rebuild(self, token: str) -> InstrumentSnapshot:
+        """Скачивает каталог из Tinkoff, публикует снимок в Redis и подменяет локальный."""
+        async with self._build_lock:
+            return await self._build(token)
+
+    def is_stale(self) -> bool:
+        return not self.snapshot or time.time() - self.snapshot.version >= INSTRUMENTS_REFRESH_SEC
+
+    async def refresh_if_stale(self, token: str) -> None:
+        """Пересобирает каталог, если он устарел и блокировку сборки взял этот воркер."""
+        if not self.is_stale():
+            return
+        r = await get_redis()
+        # блокировка не снимается: до истечения TTL другие воркеры подхватят свежую версию
+        if await r.set(LOCK_KEY, "1", nx=True, ex=INSTRUMENTS_BUILD_LOCK_TTL_SEC):
+            await self.rebuild(token)
+
+    async def ensure(self, token: str) -> None:
+        """Для запросов при пустом справочнике: снимок из Redis, иначе сборка с токеном пользователя."""
+        if self.snapshot:
+            return
+        try:
+            if await self.sync():
+                return
+        except Exception:
+            log.warning("Справочник инструментов: Redis недоступен", exc_info=True)
+        async with self._build_lock:
+            if not self.snapshot:
+                await self._build(token)
+
+    async def run(self, token: Optional[str]) -> None:
+        while True:
+            try:
+                await self.sync()
+                if token:
+                    await self.refresh_if_stale(token)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Ошибка обновления справочника инструментов", exc_info=True)
+            await asyncio.sleep(INSTRUMENTS_SYNC_SEC)
+
+
+instrument_registry = InstrumentRegistry()
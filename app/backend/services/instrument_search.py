@@ -0,0 +1,158 @@
+"""
+Поиск инструментов для автодополнения: тикер, ISIN, название (кириллица и латиница).
+
+Индекс строится в потоке по каждому новому снимку справочника
+(services/instrument_registry.py), пока запросы отвечают по предыдущему:
+- префиксный индекс — отсортированный массив ключей (тикер, ISIN, слова названия и их
+  транслит); диапазон ключей с префиксом — два bisect, как спуск по trie, но без узла
+  на каждый символ;
+- триграммный индекс — триграмма -> массив строк снимка; нечёткие совпадения считаются
+  одним bincount по спискам.
+Запрос в кириллице дополнительно ищется в транслите и в латинской раскладке
+(«ыиук» -> «sber»).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.backend.core.constants import (
+    INSTRUMENT_SEARCH_MAX_PREFIX_HITS,
+    INSTRUMENT_SEARCH_MIN_SIMILARITY,
+)
+from app.backend.services.instrument_registry import CLASSES, InstrumentSnapshot, instrument_registry
+
+_TICKER, _ISIN, _NAME = 0, 1, 2
+# баллы: [вид ключа] — префикс, добавка за точное совпадение
+_PREFIX_SCORE = np.array([80.0, 60.0, 50.0])
+_EXACT_BONUS = np.array([20.0, 30.0, 5.0])
+_FUZZY_SCORE = 40.0
+
+_NON_WORD = re.compile(r"[^0-9a-zа-я]+")
+_CYRILLIC = re.compile(r"[а-я]")
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+_LAYOUT = str.maketrans("йцукенгшщзхъфывапролджэячсмитьбю", "qwertyuiop[]asdfghjkl;'zxcvbnm,.")
+
+
+def normalize(text: Optional[str]) -> str:
+    return _NON_WORD.sub(" ", (text or "").casefold().replace("ё", "е")).strip()
+
+
+def translit(text: str) -> str:
+    return "".join(_TRANSLIT.get(ch, ch) for ch in text)
+
+
+def _variants(query: str) -> list[str]:
+    out = [query]
+    if _CYRILLIC.search(query):
+        out.append(translit(query))
+        out.append(normalize(query.translate(_LAYOUT)))
+    return list(dict.fromkeys(v for v in out if v))
+
+
+def _trigrams(text: str) -> set[str]:
+    grams: set[str] = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class InstrumentSearchIndex:
+    def __init__(self, snapshot: InstrumentSnapshot):
+        self.snapshot = snapshot
+        entries: list[tuple[str, int, int]] = []
+        postings: dict[str, list[int]] = {}
+        for i in range(len(snapshot)):
+            ticker = normalize(snapshot.ticker[i]).replace(" ", "")
+            isin = normalize(snapshot.isin[i]).replace(" ", "")
+            name = normalize(snapshot.name[i])
+            name_latin = translit(name)
+            entries.append((ticker, _TICKER, i))
+            if isin:
+                entries.append((isin, _ISIN, i))
+            for word in set(name.split()) | set(name_latin.split()):
+                entries.append((word, _NAME, i))
+            for gram in _trigrams(f"{ticker} {name} {name_latin}"):
+                postings.setdefault(gram, []).append(i)
+
+        entries.sort()
+        self._keys = [k for k, _, _ in entries]
+        self._key_len = np.fromiter((len(k) for k, _, _ in entries), dtype=np.int32, count=len(entries))
+        self._kinds = np.fromiter((kind for _, kind, _ in entries), dtype=np.int8, count=len(entries))
+        self._rows = np.fromiter((row for _, _, row in entries), dtype=np.int32, count=len(entries))
+        self._grams = {g: np.asarray(rows, dtype=np.int32) for g, rows in postings.items()}
+        self._ticker_len = np.fromiter((len(t) for t in snapshot.ticker), dtype=np.int32, count=len(snapshot))
+
+    def _prefix(self, best: np.ndarray, prefix: str) -> None:
+        lo = bisect_left(self._keys, prefix)
+        hi = min(bisect_left(self._keys, prefix + "\uffff", lo), lo + INSTRUMENT_SEARCH_MAX_PREFIX_HITS)
+        if lo >= hi:
+            return
+        kinds = self._kinds[lo:hi]
+        extra = self._key_len[lo:hi] - len(prefix)
+        scores = _PREFIX_SCORE[kinds] + np.where(extra == 0, _EXACT_BONUS[kinds], 0.0) - np.minimum(extra, 9)
+        np.maximum.at(best, self._rows[lo:hi], scores)
+
+    def _fuzzy(self, best: np.ndarray, query: str) -> None:
+        grams = _trigrams(query)
+        lists = [self._grams[g] for g in grams if g in self._grams]
+        if len(grams) < 3 or not lists:
+            return
+        hits = np.bincount(np.concatenate(lists), minlength=len(best))
+        similarity = hits / len(grams)
+        fuzzy = np.where(similarity >= INSTRUMENT_SEARCH_MIN_SIMILARITY, _FUZZY_SCORE * similarity, 0.0)
+        np.maximum(best, fuzzy, out=best)
+
+    def search(self, query: str, *, classes: Optional[Iterable[str]] = None, limit: int = 20) -> list[tuple[int, float]]:
+        """Строки снимка с баллами, по убыванию релевантности."""
+        norm = normalize(query)
+        if not norm or not len(self.snapshot):
+            return []
+        best = np.zeros(len(self.snapshot))
+        for variant in _variants(norm):
+            compact = variant.replace(" ", "")
+            self._prefix(best, compact)
+            for word in variant.split():
+                if word != compact:
+                    self._prefix(best, word)
+            self._fuzzy(best, variant)
+
+        if classes:
+            codes = [CLASSES.index(c) for c in classes if c in CLASSES]
+            best[~np.isin(self.snapshot.cls, codes)] = 0.0
+        rows = np.flatnonzero(best > 0)
+        order = np.lexsort((self._ticker_len[rows], -best[rows]))[:limit]
+        return [(int(rows[i]), float(best[rows[i]])) for i in order]
+
+
+_index: Optional[InstrumentSearchIndex] = None
+_build_lock = asyncio.Lock()
+
+
+async def search_index(snapshot: InstrumentSnapshot) -> InstrumentSearchIndex:
+    """
+    Индекс для снимка. Сборка (сотни мс на полный каталог) идёт в потоке; пока новый
+    индекс строится, отвечает прежний — если он есть.
+    """
+    global _index
+    if _index is not None and (_index.snapshot is snapshot or _build_lock.locked()):
+        return _index
+    async with _build_lock:
+        if _index is None or _index.snapshot is not snapshot:
+            _index = await asyncio.to_thread(InstrumentSearchIndex, snapshot)
+    return _index
+
+
+instrument_registry.on_update(search_index)
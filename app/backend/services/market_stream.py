@@ -0,0 +1,346 @@
+"""
+Поток последних цен Tinkoff (MarketDataStream) в общий Redis-hash market:last_prices.
+
+Поток держит один воркер — лидер, выбранный через Redis: SET NX с TTL, продление только
+своим токеном. Если лидер упал, ключ истекает и лидерство забирает другой воркер.
+Подписка — все FIGI из pf.positions плюс FIGI, которые недавно запрашивали через
+котировки (watch-список в Redis), пересобирается раз в MARKET_STREAM_RESYNC_SEC.
+
+Читатели берут цены одним HMGET (last_prices). Лидер держит ключ market:stream:alive, пока
+поток подключён; без него (лидера нет или поток оборван) hash не используется.
+Каждый сброс цен публикуется в канал market:prices — из него push-подписки воркеров
+(services/price_fanout.py) получают изменения без опроса.
+
+Отдельно ведётся market:last_good_prices — последняя известная цена каждого FIGI из потока
+и из get_last_prices, без TTL и без очистки при пересборке подписки. Из него отдаются
+котировки (stale), когда Tinkoff недоступен.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+import time
+from typing import Any, Iterable, NamedTuple, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.backend.core.cache import get_redis
+from app.backend.core.config import get_settings
+from app.backend.core.constants import (
+    MARKET_STREAM_FLUSH_SEC,
+    MARKET_STREAM_LEADER_TTL_SEC,
+    MARKET_STREAM_MAX_FIGIS,
+    MARKET_STREAM_RENEW_SEC,
+    MARKET_STREAM_RESYNC_SEC,
+    MARKET_STREAM_WATCH_TTL_SEC,
+    NANO_TO_FLOAT_DIVISOR,
+    TINKOFF_RECONNECT_BACKOFF_MAX_SEC,
+    TINKOFF_RECONNECT_BACKOFF_SEC,
+)
+
+log = logging.getLogger("market.stream")
+
+LAST_PRICES_KEY = "market:last_prices"
+LEADER_KEY = "market:stream:leader"
+ALIVE_KEY = "market:stream:alive"
+WATCH_KEY = "market:stream:watch"
+PRICES_CHANNEL = "market:prices"
+LAST_GOOD_KEY = "market:last_good_prices"
+
+# продление/снятие лидерства только своим токеном
+_RENEW_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) else return 0 end"
+_RELEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+class LivePrice(NamedTuple):
+    price: float  # как отдаёт API: для облигаций — в процентах от номинала
+    as_of: float  # unix-время сделки
+
+
+def _q2f(q: Any) -> float:
+    return float(getattr(q, "units", 0)) + float(getattr(q, "nano", 0)) / NANO_TO_FLOAT_DIVISOR
+
+
+def trade_time(it: Any, default: float) -> float:
+    """Время последней сделки; у инструмента без сделок API отдаёт пустое (1970-01-01)."""
+    ts = getattr(it, "time", None)
+    return ts.timestamp() if ts is not None and ts.year > 1970 else default
+
+
+# ---------- чтение ----------
+
+async def last_prices(figis: Sequence[str]) -> dict[str, LivePrice]:
+    """Цены из потока по FIGI; пусто, если поток не подключён или Redis недоступен."""
+    if not figis:
+        return {}
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.exists(ALIVE_KEY)
+            pipe.hmget(LAST_PRICES_KEY, list(figis))
+            alive, raws = await pipe.execute()
+    except Exception:
+        return {}
+    if not alive:
+        return {}
+    out: dict[str, LivePrice] = {}
+    for figi, raw in zip(figis, raws):
+        if raw:
+            data = json.loads(raw)
+            out[figi] = LivePrice(float(data["p"]), float(data["t"]))
+    return out
+
+
+async def last_good_prices(figis: Sequence[str]) -> dict[str, LivePrice]:
+    """Последние известные цены FIGI — для ответа при недоступном Tinkoff."""
+    if not figis:
+        return {}
+    try:
+        r = await get_redis()
+        raws = await r.hmget(LAST_GOOD_KEY, list(figis))
+    except Exception:
+        return {}
+    out: dict[str, LivePrice] = {}
+    for figi, raw in zip(figis, raws):
+        if raw:
+            data = json.loads(raw)
+            out[figi] = LivePrice(float(data["p"]), float(data["t"]))
+    return out
+
+
+async def remember_prices(prices: dict[str, LivePrice]) -> None:
+    """Запоминает цены, полученные запросом к API, как последние известные."""
+    if not prices:
+        return
+    try:
+        r = await get_redis()
+        await r.hset(LAST_GOOD_KEY, mapping={f: json.dumps({"p": lp.price, "t": lp.as_of}) for f, lp in prices.items()})
+    except Exception:
+        log.warning("Не удалось сохранить последние известные цены", exc_info=True)
+
+
+async def watch(figis: Iterable[str]) -> None:
+    """Отмечает FIGI как запрошенные: лидер добавит их в подписку."""
+    mapping = {f: time.time() for f in figis}
+    if not mapping:
+        return
+    try:
+        r = await get_redis()
+        await r.zadd(WATCH_KEY, mapping)
+    except Exception:
+        pass
+
+
+# ---------- запись ----------
+
+def decode_prices(raw: str) -> dict[str, LivePrice]:
+    """Сообщение канала market:prices -> цены по FIGI."""
+    return {figi: LivePrice(float(v["p"]), float(v["t"])) for figi, v in json.loads(raw).items()}
+
+
+class PriceWriter:
+    """
+    Буфер цен из потока: раз в MARKET_STREAM_FLUSH_SEC сбрасывается в Redis (живые и
+    последние известные цены) и публикуется одним сообщением в PRICES_CHANNEL.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, dict[str, float]] = {}
+        self.connected = False  # поток подписан и получает данные
+
+    def put(self, figi: str, price: float, as_of: float) -> None:
+        self._pending[figi] = {"p": price, "t": as_of}
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        try:
+            r = await get_redis()
+            mapping = {f: json.dumps(v) for f, v in pending.items()}
+            await r.hset(LAST_PRICES_KEY, mapping=mapping)
+            await r.hset(LAST_GOOD_KEY, mapping=mapping)
+            await r.publish(PRICES_CHANNEL, json.dumps(pending))
+        except Exception:
+            # вернём в буфер то, что не перезаписано более свежими ценами
+            self._pending = {**pending, **self._pending}
+            raise
+        return len(pending)
+
+    async def drop(self, figis: Optional[Iterable[str]] = None) -> None:
+        """Убирает цены FIGI, выпавших из подписки (None — все): они больше не обновляются."""
+        r = await get_redis()
+        if figis is None:
+            self._pending.clear()
+            await r.delete(LAST_PRICES_KEY)
+            return
+        figis = list(figis)
+        for figi in figis:
+            self._pending.pop(figi, None)
+        if figis:
+            await r.hdel(LAST_PRICES_KEY, *figis)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(MARKET_STREAM_FLUSH_SEC)
+            try:
+                await self.flush()
+            except Exception:
+                log.warning("Не удалось записать цены потока в Redis", exc_info=True)
+
+
+async def stream_figis() -> list[str]:
+    """FIGI подписки: позиции пользователей, затем недавно запрошенные; не больше лимита стрима."""
+    from app.backend.db.async_session import AsyncSessionLocal
+    from app.backend.models.portfolio import Position
+
+    async with AsyncSessionLocal() as db:
+        held = list((await db.scalars(select(Position.figi).where(Position.figi.isnot(None)).distinct())).all())
+    r = await get_redis()
+    now = time.time()
+    await r.zremrangebyscore(WATCH_KEY, "-inf", now - MARKET_STREAM_WATCH_TTL_SEC)
+    watched = await r.zrevrange(WATCH_KEY, 0, MARKET_STREAM_MAX_FIGIS - 1)
+
+    figis = list(dict.fromkeys([*sorted(held), *watched]))
+    if len(figis) > MARKET_STREAM_MAX_FIGIS:
+        log.warning("FIGI для потока %s, подписано первых %s", len(figis), MARKET_STREAM_MAX_FIGIS)
+    return figis[:MARKET_STREAM_MAX_FIGIS]
+
+
+async def _stream_session(token: str, writer: PriceWriter) -> None:
+    """Одно подключение к MarketDataStream; возвращается/падает при обрыве."""
+    from tinkoff.invest import AsyncClient, LastPriceInstrument
+
+    async with AsyncClient(token) as client:
+        stream = client.create_market_data_stream()
+        subscribed: set[str] = set()
+        # цены прошлой сессии могли устареть: hash заполняется заново затравкой подписки
+        await writer.drop()
+        writer.connected = True
+
+        async def _resync() -> None:
+            nonlocal subscribed
+            while True:
+                figis = set(await stream_figis())
+                new, gone = figis - subscribed, subscribed - figis
+                if new:
+                    # у подписки нет начального снимка — затравка текущими ценами
+                    lp = await client.market_data.get_last_prices(figi=sorted(new))
+                    now = time.time()
+                    for it in lp.last_prices:
+                        writer.put(it.figi, _q2f(it.price), trade_time(it, now))
+                    stream.last_price.subscribe([LastPriceInstrument(figi=f) for f in sorted(new)])
+                if gone:
+                    stream.last_price.unsubscribe([LastPriceInstrument(figi=f) for f in sorted(gone)])
+                    await writer.drop(gone)
+                if new or gone:
+                    log.info("Подписка потока: %s FIGI (+%s/-%s)", len(figis), len(new), len(gone))
+                subscribed = figis
+                await asyncio.sleep(MARKET_STREAM_RESYNC_SEC)
+
+        resync = asyncio.create_task(_resync())
+        try:
+            async for md in stream:
+                if resync.done():
+                    resync.result()  # ошибка пересборки — переподключаемся
+                lp = md.last_price
+                if lp is not None and lp.figi:
+                    writer.put(lp.figi, _q2f(lp.price), trade_time(lp, time.time()))
+        finally:
+            writer.connected = False
+            resync.cancel()
+            stream.stop()
+
+
+# ---------- лидер ----------
+
+class MarketStreamLeader:
+    def __init__(self, token: str, *, worker_id: Optional[str] = None, session=_stream_session):
+        self.token = token
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._session = session
+        self.writer = PriceWriter()
+
+    async def acquire(self) -> bool:
+        r = await get_redis()
+        return bool(await r.set(LEADER_KEY, self.worker_id, nx=True, ex=MARKET_STREAM_LEADER_TTL_SEC))
+
+    async def renew(self) -> bool:
+        r = await get_redis()
+        return bool(await r.eval(_RENEW_LUA, 1, LEADER_KEY, self.worker_id, MARKET_STREAM_LEADER_TTL_SEC))
+
+    async def release(self) -> None:
+        try:
+            r = await get_redis()
+            await r.eval(_RELEASE_LUA, 1, ALIVE_KEY, self.worker_id)
+            await r.eval(_RELEASE_LUA, 1, LEADER_KEY, self.worker_id)
+        except Exception:
+            pass
+
+    async def heartbeat(self) -> None:
+        """Отмечает для читателей, подключён ли поток."""
+        r = await get_redis()
+        if self.writer.connected:
+            await r.set(ALIVE_KEY, self.worker_id, ex=MARKET_STREAM_LEADER_TTL_SEC)
+        else:
+            await r.delete(ALIVE_KEY)
+
+    async def _stream_forever(self) -> None:
+        failures = 0
+        while True:
+            started = time.monotonic()
+            try:
+                await self._session(self.token, self.writer)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Поток цен оборвался", exc_info=True)
+            if time.monotonic() - started > MARKET_STREAM_RESYNC_SEC:
+                failures = 0
+            failures += 1
+            await asyncio.sleep(min(TINKOFF_RECONNECT_BACKOFF_SEC * 2 ** (failures - 1), TINKOFF_RECONNECT_BACKOFF_MAX_SEC))
+
+    async def lead(self) -> None:
+        """Держит поток, пока удаётся продлевать лидерство."""
+        log.info("Воркер %s стал лидером потока цен", self.worker_id)
+        tasks = [asyncio.create_task(self._stream_forever()), asyncio.create_task(self.writer.run())]
+        try:
+            while True:
+                await asyncio.sleep(MARKET_STREAM_RENEW_SEC)
+                if not await self.renew():
+                    log.warning("Воркер %s потерял лидерство потока цен", self.worker_id)
+                    return
+                await self.heartbeat()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await self.writer.flush()
+            except Exception:
+                pass
+            await self.release()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if await self.acquire():
+                    await self.lead()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Ошибка выбора лидера потока цен", exc_info=True)
+            await asyncio.sleep(MARKET_STREAM_RENEW_SEC)
+
+
+def start_market_stream() -> Optional[asyncio.Task]:
+    """Запускает претендента на лидерство в этом воркере (если поток включён и есть токен)."""
+    settings = get_settings()
+    if not settings.MARKET_STREAM_ENABLED or not settings.TINKOFF_TOKEN:
+        return None
+    return asyncio.create_task(MarketStreamLeader(settings.TINKOFF_TOKEN).run())
@@ -0,0 +1,176 @@
+"""
+Оценка портфелей: рыночная стоимость, нереализованный P&L, доли позиций и разбивка по
+классам активов — массивами numpy по всем позициям сразу, для одного портфеля или для
+всех портфелей пользователя.
+
+Результат кэшируется по паре (версия данных пользователя, отпечаток котировок): правка
+позиций увеличивает версию (services/budget_cache.py), изменение любой цены или признака
+stale (котировка из запасной копии) меняет отпечаток.
+Конвертации валют нет, поэтому суммы разных валют не складываются: стоимость, P&L, доли
+и разбивка по классам считаются по каждой валюте отдельно (by_currency), доля позиции —
+от стоимости портфеля в её валюте.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+import numpy as np
+
+from app.backend.core.cache import cached_json
+from app.backend.core.constants import PERCENT_TO_DECIMAL, PORTFOLIO_VALUATION_TTL_SEC
+from app.backend.services.budget_cache import budget_data_version
+
+UNKNOWN_CLASS = "other"
+UNKNOWN_CURRENCY = "unknown"
+
+
+def value_price(quote: Optional[dict]) -> Optional[float]:
+    """Цена, по которой оценивается позиция: облигация — грязная (чистая плюс НКД)."""
+    if not quote:
+        return None
+    return quote.get("dirty_price") or quote.get("price")
+
+
+def price_fingerprint(quotes: dict[str, dict]) -> str:
+    """Отпечаток того, что входит в оценку из котировок: цена и признак stale."""
+    digest = hashlib.sha1()
+    for figi in sorted(quotes):
+        q = quotes[figi]
+        digest.update(f"{figi}={value_price(q)!r}:{bool((q or {}).get('stale')):d};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _percent(part: np.ndarray, whole: np.ndarray) -> np.ndarray:
+    return np.divide(part * PERCENT_TO_DECIMAL, whole, out=np.full(np.shape(part), np.nan), where=whole > 0)
+
+
+def _pct(part: float, whole: float) -> Optional[float]:
+    return part * PERCENT_TO_DECIMAL / whole if whole > 0 else None
+
+
+def _num(x: float) -> Optional[float]:
+    return None if np.isnan(x) else float(x)
+
+
+def _groups(names: np.ndarray, sums: np.ndarray, total: float) -> dict[str, dict[str, Any]]:
+    return {str(name): {"value": float(v), "weight": _pct(float(v), total)} for name, v in zip(names, sums) if v}
+
+
+def _currency_totals(value: float, cost: float, by_class: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "value": value,
+        "cost": cost,
+        "pnl": value - cost,
+        "pnl_percent": _pct(value - cost, cost),
+        "by_class": by_class,
+    }
+
+
+def value_positions(
+    portfolios: Sequence[dict],
+    positions: Sequence[dict],
+    quotes: dict[str, dict],
+) -> dict[str, Any]:
+    """
+    positions: id, portfolio_id, figi, quantity, avg_price; quotes: котировки по FIGI
+    (формат QuoteOut). Позиции без цены попадают в unpriced и в стоимость не входят.
+    Итоги, доли и разбивка по классам — по каждой валюте отдельно (by_currency).
+    """
+    n = len(positions)
+    figis = [p["figi"] for p in positions]
+    qty = np.fromiter((p["quantity"] for p in positions), dtype=np.float64, count=n)
+    avg = np.fromiter((p["avg_price"] for p in positions), dtype=np.float64, count=n)
+    price = np.array([value_price(quotes.get(f)) or np.nan for f in figis], dtype=np.float64)
+    priced = ~np.isnan(price)
+
+    value = np.where(priced, qty * np.nan_to_num(price), 0.0)
+    cost = np.where(priced, qty * avg, 0.0)
+    pnl = np.where(priced, value - cost, np.nan)
+    pnl_pct = _percent(pnl, cost)
+
+    pf_ids = np.array([p["id"] for p in portfolios], dtype=np.int64)
+    pf_index = {int(pid): i for i, pid in enumerate(pf_ids)}
+    pf_of = np.fromiter((pf_index[p["portfolio_id"]] for p in positions), dtype=np.int64, count=n)
+
+    classes = np.array([(quotes.get(f) or {}).get("class_") or UNKNOWN_CLASS for f in figis], dtype=object)
+    currencies = np.array([(quotes.get(f) or {}).get("currency") or UNKNOWN_CURRENCY for f in figis], dtype=object)
+    class_names, class_of = np.unique(classes, return_inverse=True)
+    currency_names, currency_of = np.unique(currencies, return_inverse=True)
+    n_pf, n_cur, n_cls = len(pf_ids), len(currency_names), len(class_names)
+
+    # суммы по (портфель, валюта) и (портфель, валюта, класс) — bincount по составному коду
+    group = pf_of * n_cur + currency_of
+    g_value = np.bincount(group, weights=value, minlength=n_pf * n_cur).reshape(n_pf, n_cur)
+    g_cost = np.bincount(group, weights=cost, minlength=n_pf * n_cur).reshape(n_pf, n_cur)
+    g_priced = np.bincount(group, weights=priced, minlength=n_pf * n_cur).reshape(n_pf, n_cur) > 0
+    g_class = np.bincount(group * n_cls + class_of, weights=value,
+                          minlength=n_pf * n_cur * n_cls).reshape(n_pf, n_cur, n_cls)
+    # доля позиции — от стоимости портфеля в той же валюте
+    weight = np.where(priced, _percent(value, g_value.reshape(-1)[group]), np.nan)
+    cur_value, cur_cost = g_value.sum(axis=0), g_cost.sum(axis=0)
+    cur_class = g_class.sum(axis=0)
+
+    rows_of: list[list[int]] = [[] for _ in pf_ids]
+    for i in np.argsort(-value, kind="stable"):
+        rows_of[pf_of[i]].append(int(i))
+
+    out_portfolios = []
+    for k, pf in enumerate(portfolios):
+        by_currency = {}
+        for c in np.flatnonzero(g_priced[k]):
+            pf_value = float(g_value[k, c])
+            by_currency[str(currency_names[c])] = {
+                **_currency_totals(pf_value, float(g_cost[k, c]), _groups(class_names, g_class[k, c], pf_value)),
+                "weight": _pct(pf_value, float(cur_value[c])),
+            }
+        out_portfolios.append({
+            "portfolio_id": pf["id"],
+            "title": pf.get("title"),
+            "by_currency": by_currency,
+            "positions": [
+                {
+                    "id": positions[i]["id"],
+                    "figi": figis[i],
+                    "ticker": (quotes.get(figis[i]) or {}).get("ticker"),
+                    "class": str(classes[i]),
+                    "currency": str(currencies[i]) if priced[i] else None,
+                    "quantity": float(qty[i]),
+                    "avg_price": float(avg[i]),
+                    "price": _num(price[i]),
+                    "value": float(value[i]) if priced[i] else None,
+                    "cost": float(qty[i] * avg[i]),
+                    "pnl": _num(pnl[i]),
+                    "pnl_percent": _num(pnl_pct[i]),
+                    "weight": _num(weight[i]),
+                }
+                for i in rows_of[k]
+            ],
+        })
+
+    return {
+        "portfolios": out_portfolios,
+        "by_currency": {
+            str(currency_names[c]): _currency_totals(
+                float(cur_value[c]), float(cur_cost[c]), _groups(class_names, cur_class[c], float(cur_value[c]))
+            )
+            for c in np.flatnonzero(g_priced.any(axis=0))
+        },
+        "unpriced": sorted({figis[i] for i in np.flatnonzero(~priced)}),
+        "stale": any((quotes.get(f) or {}).get("stale") for f in set(figis)),
+    }
+
+
+async def cached_valuation(
+    user_id: int,
+    scope: str,
+    quotes: dict[str, dict],
+    compute: Callable[[], Awaitable[dict[str, Any]]],
+) -> dict[str, Any]:
+    """Оценка из кэша по (версия данных пользователя, отпечаток котировок); без версии — без кэша."""
+    version = await budget_data_version(user_id)
+    if version is None:
+        return await compute()
+    key = f"portfolio:valuation:{user_id}:v{version}:{scope}:{price_fingerprint(quotes)}"
+    return await cached_json(key, ttl_sec=PORTFOLIO_VALUATION_TTL_SEC, loader=compute)
@@ -7,7 +7,8 @@ import uuid
 from typing import Any
 
 from fastapi import WebSocket
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.backend.core.cache import get_redis
 from app.backend.models.user import User
@@ -54,11 +55,11 @@ class PresenceService:
         raw = await r.smembers(PRESENCE_ONLINE_SET)
         return {int(x) for x in raw}
 
-    async def build_snapshot(self, db: Session) -> list[dict[str, Any]]:
+    async def build_snapshot(self, db: AsyncSession) -> list[dict[str, Any]]:
         ids = await self.get_online_user_ids()
         if not ids:
             return []
-        users = db.query(User).filter(User.id.in_(ids)).all()
+        users = (await db.scalars(select(User).where(User.id.in_(ids)))).all()
         return [
             {
                 "user_id": u.id,
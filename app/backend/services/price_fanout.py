@@ -0,0 +1,128 @@
+"""
+Раздача живых цен push-подпискам воркера (SSE /stream/portfolio/{id}).
+
+Воркер держит одну подписку на Redis-канал market:prices (его публикует лидер потока,
+services/market_stream.py) и реестр подписчиков по FIGI. Котировка по обновлённому FIGI
+нормализуется один раз и раздаётся всем его подписчикам: N клиентов с SBER — одно
+вычисление. Неизменившиеся цены не рассылаются.
+
+У каждого подписчика — последние изменения по FIGI, склеенные до чтения: медленный
+клиент получает актуальные цены, а не очередь всех промежуточных.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Callable, Iterable, Optional
+
+from app.backend.core.cache import get_redis
+from app.backend.core.constants import PRICE_FANOUT_RETRY_SEC
+from app.backend.services.market_stream import PRICES_CHANNEL, LivePrice, decode_prices
+
+log = logging.getLogger("market.fanout")
+
+Normalizer = Callable[[str, LivePrice], dict[str, Any]]
+
+
+class PriceSubscription:
+    def __init__(self, figis: Iterable[str]):
+        self.figis = frozenset(figis)
+        self._changes: dict[str, dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, figi: str, quote: dict[str, Any]) -> None:
+        self._changes[figi] = quote
+        self._ready.set()
+
+    async def changes(self, timeout: float) -> dict[str, dict[str, Any]]:
+        """Изменившиеся котировки с прошлого вызова; пусто, если за timeout ничего не пришло."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        out, self._changes = self._changes, {}
+        return out
+
+
+class PriceFanout:
+    def __init__(self, normalize: Normalizer):
+        self._normalize = normalize
+        self._subs: dict[str, set[PriceSubscription]] = {}
+        self._last: dict[str, float] = {}  # последняя разосланная цена FIGI
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, figis: Iterable[str]) -> PriceSubscription:
+        sub = PriceSubscription(figis)
+        for figi in sub.figis:
+            self._subs.setdefault(figi, set()).add(sub)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return sub
+
+    def unsubscribe(self, sub: PriceSubscription) -> None:
+        for figi in sub.figis:
+            subs = self._subs.get(figi)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self._subs[figi]
+                self._last.pop(figi, None)
+        if not self._subs and self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def subscribers(self, figi: str) -> int:
+        return len(self._subs.get(figi, ()))
+
+    def dispatch(self, prices: dict[str, LivePrice]) -> int:
+        """Раздаёт цены подписчикам; возвращает число FIGI, по которым считалась котировка."""
+        computed = 0
+        for figi, lp in prices.items():
+            subs = self._subs.get(figi)
+            if not subs or self._last.get(figi) == lp.price:
+                continue
+            self._last[figi] = lp.price
+            quote = self._normalize(figi, lp)
+            computed += 1
+            for sub in subs:
+                sub.push(figi, quote)
+        return computed
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                r = await get_redis()
+                pubsub = r.pubsub()
+                await pubsub.subscribe(PRICES_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self.dispatch(decode_prices(message["data"]))
+                    except Exception:
+                        log.exception("price fanout dispatch failed")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Подписка на %s оборвалась", PRICES_CHANNEL, exc_info=True)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(PRICES_CHANNEL)
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(PRICE_FANOUT_RETRY_SEC)
+
+    async def close(self) -> None:
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.cancel()
+            try:
+                await listener
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,236 @@
+"""
+Пул долгоживущих AsyncClient Tinkoff Invest API: один gRPC-канал на токен.
+
+Канал открывается при первом запросе и переиспользуется всеми запросами воркера с этим
+токеном (gRPC мультиплексирует вызовы). Фоновая задача закрывает простаивающие каналы
+и проверяет живость остальных. Ошибка соединения сбрасывает канал — следующий запрос
+переподключается; неудачные подключения повторяются с экспоненциальной задержкой,
+в это время запросы получают TinkoffUnavailable.
+
+    prices = await tinkoff_clients.call(token, lambda c: c.market_data.get_last_prices(figi=figis))
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from app.backend.core.constants import (
+    TINKOFF_CLIENT_IDLE_TTL_SEC,
+    TINKOFF_CLIENT_MAX_CHANNELS,
+    TINKOFF_HEALTHCHECK_INTERVAL_SEC,
+    TINKOFF_HEALTHCHECK_TIMEOUT_SEC,
+    TINKOFF_RECONNECT_BACKOFF_MAX_SEC,
+    TINKOFF_RECONNECT_BACKOFF_SEC,
+)
+
+log = logging.getLogger("tinkoff.clients")
+
+T = TypeVar("T")
+Closer = Callable[[], Awaitable[None]]
+Connector = Callable[[str], Awaitable[tuple[Any, Closer]]]
+
+# коды gRPC, после которых канал считается сломанным
+_CHANNEL_ERROR_CODES = {"UNAVAILABLE"}
+# ошибки конкретного токена: отозван, нет прав, исчерпан лимит
+_TOKEN_ERROR_CODES = {"UNAUTHENTICATED", "PERMISSION_DENIED", "RESOURCE_EXHAUSTED"}
+
+
+class TinkoffUnavailable(Exception):
+    """Нет соединения с Tinkoff API (ждём повторного подключения)."""
+
+
+async def _connect(token: str) -> tuple[Any, Closer]:
+    from tinkoff.invest import AsyncClient
+
+    client = AsyncClient(token)
+    services = await client.__aenter__()
+
+    async def _close() -> None:
+        await client.__aexit__(None, None, None)
+
+    return services, _close
+
+
+async def _health_check(services: Any) -> None:
+    await services.users.get_info()
+
+
+def _error_code(exc: BaseException) -> Optional[str]:
+    code = getattr(exc, "code", None)
+    if callable(code):  # grpc.aio.AioRpcError.code()
+        code = code()
+    return getattr(code, "name", None)
+
+
+def is_channel_error(exc: BaseException) -> bool:
+    return _error_code(exc) in _CHANNEL_ERROR_CODES
+
+
+def is_token_error(exc: BaseException) -> bool:
+    return _error_code(exc) in _TOKEN_ERROR_CODES
+
+
+@dataclass
+class _Channel:
+    token: str
+    services: Any = None
+    close: Optional[Closer] = None
+    last_used: float = 0.0
+    last_ok: float = 0.0
+    in_use: int = 0
+    failures: int = 0
+    retry_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class TinkoffClientPool:
+    def __init__(
+        self,
+        *,
+        connect: Connector = _connect,
+        health_check: Callable[[Any], Awaitable[None]] = _health_check,
+        idle_ttl_sec: float = TINKOFF_CLIENT_IDLE_TTL_SEC,
+        max_channels: int = TINKOFF_CLIENT_MAX_CHANNELS,
+        health_interval_sec: float = TINKOFF_HEALTHCHECK_INTERVAL_SEC,
+        health_timeout_sec: float = TINKOFF_HEALTHCHECK_TIMEOUT_SEC,
+        backoff_sec: float = TINKOFF_RECONNECT_BACKOFF_SEC,
+        backoff_max_sec: float = TINKOFF_RECONNECT_BACKOFF_MAX_SEC,
+    ):
+        self._connect = connect
+        self._health_check = health_check
+        self.idle_ttl_sec = idle_ttl_sec
+        self.max_channels = max_channels
+        self.health_interval_sec = health_interval_sec
+        self.health_timeout_sec = health_timeout_sec
+        self.backoff_sec = backoff_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._channels: dict[str, _Channel] = {}
+        self._maintenance: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    async def _open(self, ch: _Channel) -> Any:
+        if ch.services is not None:
+            return ch.services
+        async with ch.lock:
+            if ch.services is not None:
+                return ch.services
+            if time.monotonic() < ch.retry_at:
+                raise TinkoffUnavailable()
+            try:
+                ch.services, ch.close = await self._connect(ch.token)
+            except Exception as exc:
+                ch.failures += 1
+                delay = min(self.backoff_sec * 2 ** (ch.failures - 1), self.backoff_max_sec)
+                ch.retry_at = time.monotonic() + delay
+                log.warning("Tinkoff: подключение не удалось (попытка %s), повтор через %.1f с: %s", ch.failures, delay, exc)
+                raise TinkoffUnavailable() from exc
+            ch.failures = 0
+            ch.retry_at = 0.0
+            ch.last_ok = time.monotonic()
+            return ch.services
+
+    async def _reset(self, ch: _Channel) -> None:
+        """Закрывает канал; следующий запрос откроет новый."""
+        close, ch.services, ch.close = ch.close, None, None
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                log.debug("Tinkoff: ошибка при закрытии канала", exc_info=True)
+
+    async def _evict_for_new(self) -> None:
+        if len(self._channels) < self.max_channels:
+            return
+        idle = [(ch.last_used, key) for key, ch in self._channels.items() if ch.in_use == 0]
+        if idle:
+            _, key = min(idle)
+            await self._reset(self._channels.pop(key))
+
+    @asynccontextmanager
+    async def client(self, token: str) -> AsyncIterator[Any]:
+        """Сервисы AsyncClient для токена (канал общий, закрывать его не нужно)."""
+        self._ensure_maintenance()
+        key = self._key(token)
+        ch = self._channels.get(key)
+        if ch is None:
+            await self._evict_for_new()
+            ch = self._channels.setdefault(key, _Channel(token=token))
+        ch.in_use += 1
+        ch.last_used = time.monotonic()
+        try:
+            services = await self._open(ch)
+            try:
+                yield services
+            except Exception as exc:
+                if is_channel_error(exc):
+                    log.warning("Tinkoff: канал сброшен после ошибки соединения: %s", exc)
+                    await self._reset(ch)
+                raise
+            ch.last_ok = time.monotonic()
+        finally:
+            ch.in_use -= 1
+            ch.last_used = time.monotonic()
+
+    async def call(self, token: str, fn: Callable[[Any], Awaitable[T]]) -> T:
+        async with self.client(token) as services:
+            return await fn(services)
+
+    # --- обслуживание ---
+
+    def _ensure_maintenance(self) -> None:
+        if self._maintenance is None or self._maintenance.done():
+            self._maintenance = asyncio.create_task(self._maintenance_loop())
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_sec)
+            try:
+                await self.maintain()
+            except Exception:
+                log.exception("Tinkoff: ошибка обслуживания пула каналов")
+
+    async def maintain(self) -> None:
+        """Закрывает простаивающие каналы и проверяет живость тех, что давно не отвечали."""
+        now = time.monotonic()
+        for key, ch in list(self._channels.items()):
+            if ch.in_use:
+                continue
+            if now - ch.last_used >= self.idle_ttl_sec:
+                self._channels.pop(key, None)
+                await self._reset(ch)
+                continue
+            if ch.services is None or now - ch.last_ok < self.health_interval_sec:
+                continue
+            try:
+                await asyncio.wait_for(self._health_check(ch.services), timeout=self.health_timeout_sec)
+                ch.last_ok = time.monotonic()
+            except Exception as exc:
+                log.warning("Tinkoff: проверка канала не прошла, переподключение при следующем запросе: %s", exc)
+                await self._reset(ch)
+
+    async def close(self) -> None:
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            try:
+                await self._maintenance
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._maintenance = None
+        channels, self._channels = list(self._channels.values()), {}
+        for ch in channels:
+            await self._reset(ch)
+
+
+tinkoff_clients = TinkoffClientPool()
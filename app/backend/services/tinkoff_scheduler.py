@@ -0,0 +1,326 @@
+"""
+Планировщик запросов к Tinkoff Invest API поверх пула каналов (services/tinkoff_clients.py).
+
+- Квоты: на каждый токен и группу методов — token bucket с лимитом Tinkoff в минуту,
+  делённым на число воркеров (WEB_CONCURRENCY). Запрос сверх квоты ждёт своей очереди;
+  если ждать дольше TINKOFF_QUEUE_MAX_WAIT_SEC — TinkoffUnavailable (503), а не RequestError
+  от Tinkoff.
+- Склейка get_last_prices: FIGI, запрошенные разными пользователями в пределах
+  TINKOFF_COALESCE_WINDOW_SEC, уходят одним вызовом; FIGI, который уже запрашивается,
+  не запрашивается повторно. Вызов делается токеном участника пачки с наибольшим запасом
+  квоты; если токен отозван или исчерпан — следующим. Таймаут или разомкнутый
+  предохранитель — проблема API, а не токена: пачка завершается ошибкой сразу, без
+  перебора остальных токенов.
+- Предохранитель на группу методов (services/circuit_breaker.py): TINKOFF_BREAKER_FAILURES
+  ошибок или медленных вызовов подряд размыкают его, и вызовы группы сразу получают
+  TinkoffCircuitOpen, пока пробный вызов через TINKOFF_BREAKER_OPEN_SEC не пройдёт.
+  Ошибки токена и отказы по квоте — проблема пользователя, а не API, и не считаются.
+- Метрики: очередь, ожидание квоты, длительность вызовов, эффект склейки, состояние
+  предохранителей — GET /admin/system/tinkoff-scheduler.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence, TypeVar
+
+from app.backend.core.config import get_settings
+from app.backend.core.constants import (
+    NANO_TO_FLOAT_DIVISOR,
+    TINKOFF_BREAKER_FAILURES,
+    TINKOFF_BREAKER_OPEN_SEC,
+    TINKOFF_BREAKER_SLOW_CALL_SEC,
+    TINKOFF_BUCKET_SWEEP_SEC,
+    TINKOFF_CALL_TIMEOUT_SEC,
+    TINKOFF_COALESCE_WINDOW_SEC,
+    TINKOFF_LAST_PRICES_BATCH,
+    TINKOFF_METHOD_QUOTAS,
+    TINKOFF_QUEUE_MAX_WAIT_SEC,
+)
+from app.backend.services.circuit_breaker import CircuitBreaker
+from app.backend.services.market_stream import LivePrice, trade_time
+from app.backend.services.tinkoff_clients import TinkoffClientPool, TinkoffUnavailable, is_token_error, tinkoff_clients
+
+T = TypeVar("T")
+
+
+class TinkoffCircuitOpen(TinkoffUnavailable):
+    """Предохранитель группы методов разомкнут: вызов не делался."""
+
+
+class TinkoffQuotaExceeded(TinkoffUnavailable):
+    """Очередь квоты токена длиннее TINKOFF_QUEUE_MAX_WAIT_SEC: вызов не делался."""
+
+
+def _q2f(q: Any) -> float:
+    return float(getattr(q, "units", 0)) + float(getattr(q, "nano", 0)) / NANO_TO_FLOAT_DIVISOR
+
+
+class _Bucket:
+    """Квота группы методов для одного токена. Отрицательный остаток — очередь."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(per_minute, 1.0)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def idle(self) -> bool:
+        return self.available() >= self.capacity
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Занимает место в квоте: сколько ждать (сек); None — очередь длиннее max_wait."""
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+
+class SchedulerStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.groups: dict[str, dict[str, float]] = {}
+            self.figis_requested = 0
+            self.figis_fetched = 0
+            self.price_batches = 0
+
+    def _group(self, group: str) -> dict[str, float]:
+        return self.groups.setdefault(group, {
+            "calls": 0, "errors": 0, "rejected": 0, "queued": 0, "queued_peak": 0,
+            "wait_total_ms": 0.0, "wait_max_ms": 0.0, "latency_total_ms": 0.0, "latency_max_ms": 0.0,
+        })
+
+    def enqueue(self, group: str) -> None:
+        with self._lock:
+            g = self._group(group)
+            g["queued"] += 1
+            g["queued_peak"] = max(g["queued_peak"], g["queued"])
+
+    def dequeue(self, group: str, wait_ms: float) -> None:
+        with self._lock:
+            g = self._group(group)
+            g["queued"] -= 1
+            g["wait_total_ms"] += wait_ms
+            g["wait_max_ms"] = max(g["wait_max_ms"], wait_ms)
+
+    def rejected(self, group: str) -> None:
+        with self._lock:
+            self._group(group)["rejected"] += 1
+
+    def finished(self, group: str, latency_ms: float, *, error: bool) -> None:
+        with self._lock:
+            g = self._group(group)
+            g["calls"] += 1
+            g["errors"] += int(error)
+            g["latency_total_ms"] += latency_ms
+            g["latency_max_ms"] = max(g["latency_max_ms"], latency_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            groups = {}
+            for name, g in self.groups.items():
+                calls = g["calls"] or 1
+                groups[name] = {
+                    "calls": g["calls"],
+                    "errors": g["errors"],
+                    "rejected": g["rejected"],
+                    "queue_depth": g["queued"],
+                    "queue_peak": g["queued_peak"],
+                    "wait_avg_ms": round(g["wait_total_ms"] / calls, 3),
+                    "wait_max_ms": round(g["wait_max_ms"], 3),
+                    "latency_avg_ms": round(g["latency_total_ms"] / calls, 3),
+                    "latency_max_ms": round(g["latency_max_ms"], 3),
+                }
+            return {
+                "groups": groups,
+                "last_prices": {
+                    "figis_requested": self.figis_requested,
+                    "figis_fetched": self.figis_fetched,
+                    "batches": self.price_batches,
+                },
+            }
+
+
+class TinkoffScheduler:
+    def __init__(
+        self,
+        *,
+        pool: TinkoffClientPool = tinkoff_clients,
+        quotas: Optional[dict[str, float]] = None,
+        workers: Optional[int] = None,
+        coalesce_window_sec: float = TINKOFF_COALESCE_WINDOW_SEC,
+        max_wait_sec: float = TINKOFF_QUEUE_MAX_WAIT_SEC,
+        batch_size: int = TINKOFF_LAST_PRICES_BATCH,
+        call_timeout_sec: float = TINKOFF_CALL_TIMEOUT_SEC,
+        breaker_failures: int = TINKOFF_BREAKER_FAILURES,
+        breaker_open_sec: float = TINKOFF_BREAKER_OPEN_SEC,
+        breaker_slow_call_sec: float = TINKOFF_BREAKER_SLOW_CALL_SEC,
+    ):
+        self._pool = pool
+        workers = workers or max(get_settings().WEB_CONCURRENCY, 1)
+        self._quotas = {g: q / workers for g, q in (quotas or TINKOFF_METHOD_QUOTAS).items()}
+        self.coalesce_window_sec = coalesce_window_sec
+        self.max_wait_sec = max_wait_sec
+        self.batch_size = batch_size
+        self.call_timeout_sec = call_timeout_sec
+        self._breakers = {
+            g: CircuitBreaker(failure_threshold=breaker_failures, open_sec=breaker_open_sec, slow_call_sec=breaker_slow_call_sec)
+            for g in self._quotas
+        }
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self._swept = time.monotonic()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._pending_tokens: dict[str, str] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = SchedulerStats()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _bucket(self, token: str, group: str) -> _Bucket:
+        now = time.monotonic()
+        if now - self._swept >= TINKOFF_BUCKET_SWEEP_SEC:
+            self._swept = now
+            self._buckets = {k: b for k, b in self._buckets.items() if not b.idle()}
+        key = (self._key(token), group)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self._quotas[group])
+        return bucket
+
+    def breaker(self, group: str) -> CircuitBreaker:
+        return self._breakers[group]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {**self.stats.snapshot(), "breakers": {g: b.snapshot() for g, b in self._breakers.items()}}
+
+    async def call(self, token: str, group: str, fn: Callable[[Any], Awaitable[T]]) -> T:
+        """Вызов метода группы group (ключ TINKOFF_METHOD_QUOTAS) в пределах квоты токена."""
+        breaker = self._breakers[group]
+        if not breaker.allow():
+            raise TinkoffCircuitOpen()
+        wait = self._bucket(token, group).reserve(self.max_wait_sec)
+        if wait is None:
+            breaker.release()
+            self.stats.rejected(group)
+            raise TinkoffQuotaExceeded()
+        started = time.perf_counter()
+        error = True
+        verdict = False
+        try:
+            if wait:
+                self.stats.enqueue(group)
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    self.stats.dequeue(group, wait * 1000)
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self._pool.call(token, fn), timeout=self.call_timeout_sec)
+            except asyncio.TimeoutError as exc:
+                verdict = True
+                raise TinkoffUnavailable() from exc
+            except Exception as exc:
+                verdict = not is_token_error(exc)
+                raise
+            error = False
+            verdict = True
+            return result
+        finally:
+            latency = time.perf_counter() - started
+            if verdict:
+                breaker.record(latency, error=error)
+            else:
+                breaker.release()  # отмена, ошибка токена: о здоровье API ничего не известно
+            self.stats.finished(group, latency * 1000, error=error)
+
+    # --- склейка get_last_prices ---
+
+    async def last_prices(self, figis: Sequence[str], token: str) -> dict[str, LivePrice]:
+        """
+        Последние цены FIGI со временем сделки; одновременные запросы разных пользователей
+        идут одним вызовом.
+        """
+        figis = list(dict.fromkeys(figis))
+        if not figis:
+            return {}
+        loop = asyncio.get_running_loop()
+        futures: list[asyncio.Future] = []
+        for figi in figis:
+            fut = self._inflight.get(figi) or self._pending.get(figi)
+            if fut is None:
+                fut = self._pending[figi] = loop.create_future()
+            futures.append(fut)
+        self._pending_tokens.setdefault(self._key(token), token)
+        self.stats.figis_requested += len(figis)
+        if self._pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_later())
+        # shield: отмена одного ожидающего не отменяет общую загрузку для остальных
+        prices = await asyncio.gather(*(asyncio.shield(f) for f in futures))
+        return {figi: price for figi, price in zip(figis, prices) if price is not None}
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.coalesce_window_sec)
+        pending, self._pending = self._pending, {}
+        tokens, self._pending_tokens = list(self._pending_tokens.values()), {}
+        self._inflight.update(pending)
+        figis = list(pending)
+        for i in range(0, len(figis), self.batch_size):
+            chunk = {f: pending[f] for f in figis[i:i + self.batch_size]}
+            task = asyncio.create_task(self._fetch_prices(chunk, tokens))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_prices(self, chunk: dict[str, asyncio.Future], tokens: list[str]) -> None:
+        self.stats.price_batches += 1
+        self.stats.figis_fetched += len(chunk)
+        # больше всего запаса квоты — первым
+        candidates = sorted(tokens, key=lambda t: -self._bucket(t, "market_data").available())
+        error: Optional[BaseException] = None
+        prices: Optional[dict[str, LivePrice]] = None
+        try:
+            for token in candidates:
+                try:
+                    lp = await self.call(token, "market_data", lambda c: c.market_data.get_last_prices(figi=list(chunk)))
+                except Exception as exc:
+                    error = exc
+                    if isinstance(exc, TinkoffQuotaExceeded) or is_token_error(exc):
+                        continue  # квота или токен участника — пробуем следующий
+                    break  # таймаут, предохранитель, сбой API: другой токен не поможет
+                now = time.time()
+                prices = {it.figi: LivePrice(_q2f(it.price), trade_time(it, now)) for it in lp.last_prices}
+                break
+        finally:
+            for figi, fut in chunk.items():
+                if self._inflight.get(figi) is fut:
+                    del self._inflight[figi]
+                if fut.done():
+                    continue
+                if prices is not None:
+                    fut.set_result(prices.get(figi))
+                else:
+                    fut.set_exception(error or TinkoffUnavailable())
+
+
+tinkoff_scheduler = TinkoffScheduler()
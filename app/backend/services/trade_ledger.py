@@ -0,0 +1,118 @@
+"""
+Журнал сделок (pf.trades) — источник истины для позиций.
+
+Позиция (pf.positions) — агрегат по методу средней цены: покупка меняет количество и
+среднюю, продажа — только количество (до нуля; в ноль — средняя сбрасывается).
+- Новая сделка применяется к позиции за O(1) одним INSERT ... ON CONFLICT DO UPDATE:
+  арифметика в numeric на стороне БД, без SELECT ... FOR UPDATE — строка позиции
+  заблокирована только от этого оператора до commit той же короткой транзакции.
+- При правке истории (удаление, изменение, сделка задним числом) позиция пересчитывается
+  целиком проигрыванием сделок по порядку — тем же шагом, что и инкрементальное обновление.
+- Выбор между ними (сравнение с последней сделкой) делается под блокировкой строки позиции
+  (lock_position): иначе две параллельные сделки применятся в порядке блокировок, а не
+  trade_at, и позиция разойдётся с проигрыванием журнала.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.backend.models.portfolio import Position, Trade
+
+BUY, SELL = 1, -1
+_ZERO = Decimal(0)
+_SCALE = Decimal("0.000001")  # NUMERIC(20,6) в pf.positions
+
+
+def _dec(x: Any) -> Decimal:
+    return x if isinstance(x, Decimal) else Decimal(str(x or 0))
+
+
+def step(qty: Decimal, avg: Decimal, side: int, quantity: Any, price: Any, fee: Any = 0) -> tuple[Decimal, Decimal]:
+    """Позиция после одной сделки: (количество, средняя цена). Комиссия покупки входит в среднюю."""
+    q = _dec(quantity)
+    if side == BUY:
+        new_qty = qty + q
+        cost = avg * qty + q * _dec(price) + _dec(fee)
+        return new_qty, (cost / new_qty).quantize(_SCALE, ROUND_HALF_UP)
+    new_qty = qty - q
+    if new_qty <= 0:
+        return _ZERO, _ZERO
+    return new_qty, avg
+
+
+def replay(trades: Iterable[Any]) -> tuple[Decimal, Decimal]:
+    """Позиция по истории сделок (side, quantity, price, fee) в хронологическом порядке."""
+    qty, avg = _ZERO, _ZERO
+    for t in trades:
+        qty, avg = step(qty, avg, t.side, t.quantity, t.price, t.fee)
+    return qty, avg
+
+
+def apply_trade(db: Session, trade: Trade) -> Position:
+    """Инкрементально применяет сделку к позиции (шаг step, но в одном SQL-операторе)."""
+    q, price, fee = _dec(trade.quantity), _dec(trade.price), _dec(trade.fee)
+    now = datetime.now(timezone.utc)
+    first_qty, first_avg = step(_ZERO, _ZERO, trade.side, q, price, fee)
+    stmt = pg_insert(Position).values(
+        portfolio_id=trade.portfolio_id, figi=trade.figi, quantity=first_qty, avg_price=first_avg, updated_at=now,
+    )
+    if trade.side == BUY:
+        new_qty = Position.quantity + q
+        set_ = {
+            "quantity": new_qty,
+            "avg_price": func.round((Position.avg_price * Position.quantity + q * price + fee) / new_qty, 6),
+        }
+    else:
+        left = Position.quantity - q
+        set_ = {
+            "quantity": case((left > 0, left), else_=_ZERO),
+            "avg_price": case((left > 0, Position.avg_price), else_=_ZERO),
+        }
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Position.portfolio_id, Position.figi],
+        set_={**set_, "updated_at": now},
+    ).returning(Position)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+
+def lock_position(db: Session, portfolio_id: int, figi: str) -> Position:
+    """Строка позиции (создаётся пустой при отсутствии), заблокированная до конца транзакции."""
+    db.execute(
+        pg_insert(Position)
+        .values(portfolio_id=portfolio_id, figi=figi, quantity=_ZERO, avg_price=_ZERO, updated_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=[Position.portfolio_id, Position.figi])
+    )
+    return db.scalars(
+        select(Position)
+        .where(Position.portfolio_id == portfolio_id, Position.figi == figi)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).one()
+
+
+def latest_trade_at(db: Session, portfolio_id: int, figi: str) -> Optional[datetime]:
+    return db.scalar(select(func.max(Trade.trade_at)).where(Trade.portfolio_id == portfolio_id, Trade.figi == figi))
+
+
+def recompute_position(db: Session, portfolio_id: int, figi: str) -> Position:
+    """
+    Пересчёт позиции из всей истории. Строка позиции блокируется до чтения сделок:
+    инкрементальные обновления, пришедшие во время пересчёта, дождутся его commit и лягут
+    поверх уже пересчитанного значения.
+    """
+    pos = lock_position(db, portfolio_id, figi)
+    trades = db.execute(
+        select(Trade.side, Trade.quantity, Trade.price, Trade.fee)
+        .where(Trade.portfolio_id == portfolio_id, Trade.figi == figi)
+        .order_by(Trade.trade_at, Trade.id)
+    ).all()
+    pos.quantity, pos.avg_price = replay(trades)
+    pos.updated_at = datetime.now(timezone.utc)
+    return pos
@@ -1,47 +1,130 @@
 from types import SimpleNamespace
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 from fastapi import HTTPException
 
-from app.backend.core.auth import create_access_token, get_current_user, get_staff_user
+from app.backend.core import auth
+from app.backend.core.auth import create_access_token, get_current_user, get_staff_user, invalidate_principal
+from app.backend.core.cache import clear_local_cache
 
 
-def _db_with_user(user):
+@pytest.fixture(autouse=True)
+def _no_redis():
+    clear_local_cache()
+    with patch("app.backend.core.cache.get_redis", side_effect=ConnectionError("down")):
+        yield
+    clear_local_cache()
+
+
+def _session_with_user(user):
     db = MagicMock()
-    db.query.return_value.filter.return_value.first.return_value = user
-    return db
+    db.get.return_value = user
+    session_factory = MagicMock()
+    session_factory.return_value.__enter__.return_value = db
+    return patch("app.backend.core.auth.SessionLocal", session_factory), db
+
 
+def _user(**kw):
+    base = dict(id=7, email="u@example.com", full_name="U", tg_username=None, is_staff=False, tinkoff_token_enc=None)
+    base.update(kw)
+    return SimpleNamespace(**base)
 
-def test_get_current_user_from_valid_token():
-    user = SimpleNamespace(id=7, is_staff=False)
+
+@pytest.mark.asyncio
+async def test_get_current_user_from_valid_token():
     token = create_access_token(user_id=7, expires_minutes=5)
     creds = SimpleNamespace(credentials=token)
-    db = _db_with_user(user)
+    session, _ = _session_with_user(_user())
 
-    resolved = get_current_user(creds, db)
+    with session:
+        resolved = await get_current_user(creds)
     assert resolved.id == 7
+    assert resolved.has_tinkoff_token is False
 
 
-def test_get_current_user_invalid_token_raises_401():
+@pytest.mark.asyncio
+async def test_get_current_user_invalid_token_raises_401():
     creds = SimpleNamespace(credentials="broken.token")
-    db = _db_with_user(None)
+    session, _ = _session_with_user(None)
 
-    with pytest.raises(HTTPException) as exc:
-        get_current_user(creds, db)
+    with session, pytest.raises(HTTPException) as exc:
+        await get_current_user(creds)
     assert exc.value.status_code == 401
 
 
-def test_get_current_user_missing_user_raises_401():
+@pytest.mark.asyncio
+async def test_get_current_user_missing_user_raises_401():
     token = create_access_token(user_id=999, expires_minutes=5)
     creds = SimpleNamespace(credentials=token)
-    db = _db_with_user(None)
+    session, _ = _session_with_user(None)
 
-    with pytest.raises(HTTPException) as exc:
-        get_current_user(creds, db)
+    with session, pytest.raises(HTTPException) as exc:
+        await get_current_user(creds)
     assert exc.value.status_code == 401
 
 
+class _VersionRedis:
+    """Только счётчики версий; снимки — в L1 (PRINCIPAL_CACHE_REDIS выключен)."""
+
+    def __init__(self):
+        self.kv = {}
+
+    async def get(self, key):
+        return self.kv.get(key)
+
+    async def incr(self, key):
+        self.kv[key] = str(int(self.kv.get(key) or 0) + 1)
+        return int(self.kv[key])
+
+
+@pytest.fixture
+def version_redis():
+    r = _VersionRedis()
+    with patch("app.backend.core.auth.get_redis", return_value=r), \
+            patch.object(auth.settings, "PRINCIPAL_CACHE_REDIS", False):
+        yield r
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cache_hit_skips_db_until_invalidated(version_redis):
+    token = create_access_token(user_id=7, expires_minutes=5)
+    creds = SimpleNamespace(credentials=token)
+    session, db = _session_with_user(_user(is_staff=True))
+
+    with session:
+        first = await get_current_user(creds)
+        second = await get_current_user(creds)
+        assert db.get.call_count == 1
+        assert first is not second and second.is_staff
+
+        await invalidate_principal(7)
+        await get_current_user(creds)
+        assert db.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidation_from_another_worker_bypasses_local_snapshot(version_redis):
+    creds = SimpleNamespace(credentials=create_access_token(user_id=7, expires_minutes=5))
+    session, db = _session_with_user(_user(is_staff=True))
+    with session:
+        assert (await get_current_user(creds)).is_staff
+        # другой воркер снял права: у этого в L1 остался старый снимок, но версия уже новая
+        db.get.return_value = _user(is_staff=False)
+        version_redis.kv["principal:ver:7"] = "1"
+        assert not (await get_current_user(creds)).is_staff
+
+
+@pytest.mark.asyncio
+async def test_redis_down_skips_principal_cache():
+    creds = SimpleNamespace(credentials=create_access_token(user_id=7, expires_minutes=5))
+    session, db = _session_with_user(_user(is_staff=True))
+    with session:
+        await get_current_user(creds)
+        await get_current_user(creds)
+    assert db.get.call_count == 2
+
+
 def test_get_staff_user_forbidden_for_non_staff():
     user = SimpleNamespace(id=1, is_staff=False)
     with pytest.raises(HTTPException) as exc:
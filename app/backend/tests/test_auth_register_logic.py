@@ -1,21 +1,23 @@
 from types import SimpleNamespace
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from fastapi import HTTPException
 
-from app.backend.core.constants import ERROR_SERVICE_LOGIN_EXISTS, HTTP_409_CONFLICT
+from app.backend.core.constants import ERROR_SERVICE_LOGIN_EXISTS, HTTP_409_CONFLICT, HTTP_503_SERVICE_UNAVAILABLE
+from app.backend.core.security import PasswordHasherBusy
 from app.backend.core.validators import validate_email
 from app.backend.routes import auth as auth_routes
-from app.backend.routes.auth import RegisterIn
+from app.backend.routes.auth import LoginIn, RegisterIn
 
 
 @pytest.mark.asyncio
 async def test_register_rejects_taken_service_login(monkeypatch):
     db = MagicMock()
-    filtered = MagicMock()
-    filtered.first.side_effect = [None, SimpleNamespace(id=77)]
-    db.query.return_value.filter.return_value = filtered
+    db.scalars = AsyncMock(side_effect=[
+        MagicMock(first=MagicMock(return_value=None)),
+        MagicMock(first=MagicMock(return_value=77)),
+    ])
 
     payload = RegisterIn(
         email="user@example.com",
@@ -31,7 +33,52 @@ async def test_register_rejects_taken_service_login(monkeypatch):
 
     assert exc.value.status_code == HTTP_409_CONFLICT
     assert exc.value.detail == ERROR_SERVICE_LOGIN_EXISTS
+    db.add.assert_not_called()
 
 
 def test_validate_email_normalizes_case():
     assert validate_email("TeSt.User@Example.COM") == "test.user@example.com"
+
+
+def _login_db(user):
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(first=MagicMock(return_value=(user.id, user.password_hash))))
+    db.rollback = AsyncMock()
+    db.get = AsyncMock(return_value=user)
+    db.commit = AsyncMock()
+    return db
+
+
+@pytest.mark.asyncio
+async def test_login_returns_503_when_hasher_saturated(monkeypatch):
+    user = SimpleNamespace(id=1, password_hash="hash")
+    monkeypatch.setattr(auth_routes, "verify_and_update_password_async", AsyncMock(side_effect=PasswordHasherBusy()))
+
+    with pytest.raises(HTTPException) as exc:
+        await auth_routes.login(LoginIn(email="user@example.com", password="x"), db=_login_db(user))
+
+    assert exc.value.status_code == HTTP_503_SERVICE_UNAVAILABLE
+    assert "Retry-After" in exc.value.headers
+
+
+@pytest.mark.asyncio
+async def test_login_stores_rehashed_password(monkeypatch):
+    user = SimpleNamespace(
+        id=1, email="user@example.com", full_name="User", tg_username=None,
+        password_hash="old", has_tinkoff_token=False, is_staff=False, last_login_at=None,
+    )
+    db = _login_db(user)
+
+    async def _verify(raw, hashed):
+        # соединение отдано в пул до ожидания bcrypt
+        db.rollback.assert_awaited_once()
+        db.commit.assert_not_awaited()
+        return True, "new"
+
+    monkeypatch.setattr(auth_routes, "verify_and_update_password_async", _verify)
+
+    out = await auth_routes.login(LoginIn(email="user@example.com", password="x"), db=db)
+
+    assert out.user_id == 1
+    assert user.password_hash == "new"
+    db.commit.assert_awaited_once()
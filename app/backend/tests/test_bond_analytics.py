@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pytest
+
+from app.backend.services import bond_analytics
+from app.backend.services.bond_analytics import bond_metrics, schedule_from_api
+
+DAY = 86400.0
+YEAR = 365 * DAY
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def _annual(coupon, years, *, first_start=NOW, amounts=None):
+    """Купон раз в год, погашение вместе с последним."""
+    rows = []
+    for k in range(years):
+        start, end = first_start + k * YEAR, first_start + (k + 1) * YEAR
+        rows.append([start, end, end, coupon if amounts is None else amounts[k]])
+    return {"coupons": rows}
+
+
+def _maturity(schedule):
+    return schedule["coupons"][-1][2]
+
+
+def test_par_bond_yields_its_coupon_rate():
+    s = _annual(100.0, 3)
+    m = bond_metrics([100.0], [1000.0], [_maturity(s)], [s], now=NOW)
+    assert m["aci"][0] == 0.0
+    assert m["dirty_price"][0] == pytest.approx(1000.0)
+    assert m["ytm"][0] == pytest.approx(10.0, abs=1e-6)
+    # дюрация 3-летней облигации с купоном 10% по номиналу
+    cf = np.array([100.0, 100.0, 1100.0]) / 1.1 ** np.arange(1, 4)
+    assert m["modified_duration"][0] == pytest.approx((cf * np.arange(1, 4)).sum() / cf.sum() / 1.1)
+
+
+def test_batch_aci_floater_and_matured_in_one_pass():
+    half = NOW - YEAR / 2
+    schedules = [
+        _annual(100.0, 2, first_start=half),  # полгода купонного периода
+        _annual(0.0, 2, first_start=NOW - YEAR, amounts=[80.0, 0.0]),  # флоатер: второй купон не объявлен
+        _annual(50.0, 1, first_start=NOW - 2 * YEAR),  # уже погашена
+        {"coupons": []},  # дисконтная
+    ]
+    maturity = [_maturity(s) for s in schedules[:3]] + [NOW + YEAR]
+    m = bond_metrics([100.0, 100.0, 99.0, 90.0], [1000.0] * 4, maturity, schedules, now=NOW)
+
+    assert m["aci"][0] == pytest.approx(50.0)
+    assert m["dirty_price"][0] == pytest.approx(1050.0)
+    assert m["ytm"][1] == pytest.approx(8.0, abs=1e-6)  # 80 + 1000 через год при цене 1000
+    assert np.isnan(m["ytm"][2]) and np.isnan(m["modified_duration"][2])
+    assert m["ytm"][3] == pytest.approx(1000 / 900 * 100 - 100)
+    assert m["modified_duration"][3] == pytest.approx(1 / (1000 / 900))
+
+
+def test_schedule_from_api_skips_empty_dates_and_sorts():
+    def _dt(y, mo, d):
+        return datetime(y, mo, d, tzinfo=timezone.utc)
+
+    def _money(v):
+        return SimpleNamespace(units=int(v), nano=0)
+
+    coupons = [
+        SimpleNamespace(coupon_date=_dt(2027, 1, 1), coupon_start_date=_dt(2026, 7, 1),
+                        coupon_end_date=_dt(2027, 1, 1), pay_one_bond=_money(40)),
+        SimpleNamespace(coupon_date=_dt(2026, 7, 1), coupon_start_date=_dt(1970, 1, 1),
+                        coupon_end_date=_dt(2026, 7, 1), pay_one_bond=_money(35)),
+    ]
+    s = schedule_from_api(coupons)
+    assert [c[3] for c in s["coupons"]] == [35.0, 40.0]
+    assert s["coupons"][0][0] == _dt(2026, 7, 1).timestamp()  # нет даты начала — берётся дата выплаты
+
+
+def test_missing_maturity_gives_no_yield():
+    s = _annual(100.0, 3)
+    m = bond_metrics([100.0], [1000.0], [None], [s], now=NOW)
+    assert m["aci"][0] == 0.0 and np.isnan(m["ytm"][0])
+
+
+@pytest.mark.asyncio
+async def test_prefetch_loads_missing_schedules_once_in_background(monkeypatch):
+    for name in ("_known", "_loaded_at", "_loading"):
+        monkeypatch.setattr(bond_analytics, name, type(getattr(bond_analytics, name))())
+    gate = asyncio.Event()
+
+    async def _load(figis, token):
+        await gate.wait()
+        schedules = {f: _annual(100.0, 1) for f in figis}
+        bond_analytics._known.update(schedules)
+        bond_analytics._loaded_at.update((f, NOW) for f in schedules)
+        return schedules
+
+    with patch.object(bond_analytics, "load_schedules", AsyncMock(side_effect=_load)) as load, \
+            patch.object(bond_analytics.time, "time", return_value=NOW):
+        bond_analytics.prefetch_schedules(["B1", "B2"], "t")
+        bond_analytics.prefetch_schedules(["B2", "B1"], "t")  # уже загружаются
+        assert bond_analytics.known_schedules(["B1", "B2"]) == {}  # котировки не ждут загрузки
+
+        gate.set()
+        await asyncio.gather(*bond_analytics._background)
+        assert set(bond_analytics.known_schedules(["B1", "B2"])) == {"B1", "B2"}
+        bond_analytics.prefetch_schedules(["B1", "B2"], "t")  # свежие — без загрузки
+    load.assert_awaited_once_with(["B1", "B2"], "t")
+    assert not bond_analytics._loading
@@ -0,0 +1,69 @@
+"""Single-pass budget classification."""
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.backend.services.budget_aggregator import BudgetAggregator
+from app.backend.services.budget_rollup import RollupEntry
+
+
+def _aggregator():
+    accounts = {
+        1: SimpleNamespace(id=1, is_savings=False),
+        2: SimpleNamespace(id=2, is_savings=True),
+    }
+    categories = {10: SimpleNamespace(id=10, name="Еда"), 11: SimpleNamespace(id=11, name="Зарплата")}
+    return BudgetAggregator(accounts, categories)
+
+
+def _tx(tx_type, day, account_id=1, contra_account_id=None, category_id=None):
+    return SimpleNamespace(
+        type=tx_type,
+        occurred_at=datetime(2026, 3, day, 12, tzinfo=timezone.utc),
+        account_id=account_id,
+        contra_account_id=contra_account_id,
+        category_id=category_id,
+    )
+
+
+def test_aggregate_transactions_single_pass():
+    txs = [
+        _tx("income", 1, category_id=11),
+        _tx("expense", 1, category_id=10),
+        _tx("expense", 2),
+        _tx("transfer", 3, account_id=1, contra_account_id=2),
+        _tx("transfer", 4, account_id=2, contra_account_id=1),
+        _tx("income", 5, account_id=2),
+    ]
+    amounts = [Decimal("1000"), Decimal("100"), Decimal("50"), Decimal("300"), Decimal("70"), Decimal("5")]
+    agg = _aggregator().aggregate_transactions(txs, amounts)
+
+    assert agg.income == Decimal("1005")
+    assert agg.expense == Decimal("150")
+    assert agg.net == Decimal("855")
+    assert agg.savings_transferred == Decimal("300")
+    assert agg.savings_income == Decimal("5")
+    assert agg.savings_net == Decimal("235")
+    assert agg.tx_count == 6
+    assert agg.expense_by_category == {10: Decimal("100"), None: Decimal("50")}
+    assert agg.expense_by_day[date(2026, 3, 1)] == Decimal("100")
+    assert len(agg.active_days) == 5
+    assert agg.by_month[(2026, 3)].savings == Decimal("235")
+
+
+def test_aggregate_rollups_matches_transactions():
+    entries = [
+        RollupEntry(2026, 3, "income", 1, None, 11, Decimal("1000"), 2),
+        RollupEntry(2026, 3, "transfer", 1, 2, None, Decimal("300"), 1),
+        RollupEntry(2026, 4, "expense", 2, None, 10, Decimal("40"), 3),
+    ]
+    aggregator = _aggregator()
+    agg = aggregator.aggregate_rollups(entries)
+
+    assert agg.tx_count == 6
+    assert agg.savings_net == Decimal("260")
+    assert agg.by_month[(2026, 4)].expense == Decimal("40")
+    assert agg.income_by_day == {}
+    assert aggregator.category_name(10) == "Еда"
+    assert aggregator.category_name(None, "Без категории") == "Без категории"
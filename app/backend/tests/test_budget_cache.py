@@ -0,0 +1,54 @@
+"""Versioned budget read cache."""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.backend.services.budget_cache import (
+    bump_budget_version_sync,
+    cached_budget_json,
+    invalidate_budget_cache,
+)
+
+
+@pytest.mark.asyncio
+async def test_cache_key_contains_data_version():
+    mock_redis = AsyncMock()
+    mock_redis.get = AsyncMock(return_value="7")
+    cached = AsyncMock(return_value={"ok": True})
+    with patch("app.backend.services.budget_cache.get_redis", return_value=mock_redis), \
+         patch("app.backend.services.budget_cache.cached_json", cached):
+        data = await cached_budget_json(42, "accounts", AsyncMock())
+    assert data == {"ok": True}
+    assert cached.await_args.args[0] == "budget:42:v7:accounts"
+
+
+@pytest.mark.asyncio
+async def test_cache_bypassed_when_redis_unavailable():
+    loader = AsyncMock(return_value=[1, 2])
+    with patch("app.backend.services.budget_cache.get_redis", side_effect=ConnectionError("down")):
+        assert await cached_budget_json(42, "accounts", loader) == [1, 2]
+    loader.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_dependency_bumps_only_on_success():
+    mock_redis = AsyncMock()
+    user = SimpleNamespace(id=5)
+    with patch("app.backend.services.budget_cache.get_redis", return_value=mock_redis):
+        dep = invalidate_budget_cache(user)
+        await dep.__anext__()
+        with pytest.raises(StopAsyncIteration):
+            await dep.__anext__()
+        mock_redis.incr.assert_awaited_once_with("budget:ver:5")
+
+        mock_redis.incr.reset_mock()
+        dep = invalidate_budget_cache(user)
+        await dep.__anext__()
+        with pytest.raises(ValueError):
+            await dep.athrow(ValueError("handler failed"))
+        mock_redis.incr.assert_not_awaited()
+
+
+def test_bump_sync_outside_worker_thread_is_noop():
+    bump_budget_version_sync(1)
@@ -0,0 +1,84 @@
+"""Monthly budget rollup keys and period alignment."""
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+
+import app.backend.models.instrument  # noqa: F401 — связи User
+import app.backend.models.portfolio  # noqa: F401
+import app.backend.models.user  # noqa: F401
+from app.backend.models.budget import BudgetMonthlyRollup, BudgetTransaction
+from app.backend.services import budget_rollup
+from app.backend.services.budget_rollup import group_transactions, month_span
+
+
+@compiles(sa.BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    return "INTEGER"  # BIGINT PRIMARY KEY в SQLite не автоинкрементный
+
+
+def _tx(**kw):
+    base = dict(type="expense", account_id=1, contra_account_id=None, category_id=5,
+                occurred_at=datetime(2026, 3, 10, tzinfo=timezone.utc))
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_month_span_full_months():
+    assert month_span(date(2026, 1, 1), date(2026, 12, 31)) == (2026 * 12 + 1, 2026 * 12 + 12)
+    assert month_span(date(2026, 2, 1), date(2026, 2, 28)) == (2026 * 12 + 2, 2026 * 12 + 2)
+
+
+def test_month_span_partial_range_not_served():
+    assert month_span(date(2026, 2, 2), date(2026, 2, 28)) is None
+    assert month_span(date(2026, 2, 1), date(2026, 2, 27)) is None
+
+
+def test_group_transactions_merges_same_key():
+    txs = [
+        _tx(),
+        _tx(occurred_at=datetime(2026, 3, 31, tzinfo=timezone.utc)),
+        _tx(occurred_at="2026-04-01"),
+        _tx(type="transfer", category_id=None, contra_account_id=2),
+    ]
+    groups = group_transactions(txs, [Decimal("10"), Decimal("5.5"), Decimal("1"), Decimal("100")])
+    assert groups[(2026, 3, "expense", 1, 0, 5)] == (Decimal("15.5"), 2)
+    assert groups[(2026, 4, "expense", 1, 0, 5)] == (Decimal("1"), 1)
+    assert groups[(2026, 3, "transfer", 1, 2, 0)] == (Decimal("100"), 1)
+
+
+@pytest.fixture
+def rollup_db():
+    engine = sa.create_engine("sqlite://", execution_options={"schema_translate_map": {"pf": None}})
+    BudgetMonthlyRollup.__table__.create(engine)
+    with Session(engine) as db, patch.object(budget_rollup, "_lock_user"):
+        yield db
+
+
+def _rollups(db):
+    return [(r.contra_account_id, r.tx_count) for r in db.scalars(sa.select(BudgetMonthlyRollup)).all()]
+
+
+def test_deleted_contra_account_transfer_leaves_no_rollup(rollup_db):
+    db = rollup_db
+    when = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    transfer = BudgetTransaction(user_id=1, type="transfer", account_id=1, contra_account_id=2, occurred_at=when)
+    orphan = BudgetTransaction(user_id=1, type="transfer", account_id=1, contra_account_id=None, occurred_at=when)
+    budget_rollup.apply_transaction(db, transfer, Decimal("100"))
+    budget_rollup.apply_transaction(db, orphan, Decimal("7"))
+
+    # удаление счёта 2: переводы на него в транзакциях теряют контр-счёт
+    budget_rollup.detach_contra_account(db, 1, 2)
+    assert _rollups(db) == [(0, 2)]
+
+    transfer.contra_account_id = None
+    budget_rollup.apply_transaction(db, transfer, Decimal("100"), sign=-1)
+    budget_rollup.apply_transaction(db, orphan, Decimal("7"), sign=-1)
+    db.flush()
+    assert _rollups(db) == []
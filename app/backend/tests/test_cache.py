@@ -0,0 +1,176 @@
+"""Two-tier cache: L1, single-flight, distributed lock, stale-while-revalidate."""
+
+import asyncio
+import json
+import time
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.backend.core import cache
+from app.backend.core.cache import cached_json, clear_local_cache
+
+
+@pytest.fixture(autouse=True)
+def _clean_l1():
+    clear_local_cache()
+    yield
+    clear_local_cache()
+
+
+def _redis(store=None):
+    store = {} if store is None else store
+    r = AsyncMock()
+    r.get = AsyncMock(side_effect=lambda k: store.get(k))
+
+    async def _setex(k, ttl, v):
+        store[k] = v
+    r.setex = AsyncMock(side_effect=_setex)
+    r.set = AsyncMock(return_value=True)
+    r.mget = AsyncMock(side_effect=lambda keys: [store.get(k) for k in keys])
+
+    class _Pipe:
+        def __init__(self):
+            self.ops = []
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def setex(self, k, ttl, v):
+            self.ops.append((k, v))
+
+        async def execute(self):
+            for k, v in self.ops:
+                store[k] = v
+
+    r.pipeline = lambda transaction=True: _Pipe()
+    return r, store
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_loader():
+    r, _ = _redis()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"price": 1}
+
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        results = await asyncio.gather(*(cached_json("quote:X", 60, loader) for _ in range(10)))
+    assert calls == 1
+    assert all(res == {"price": 1} for res in results)
+
+
+@pytest.mark.asyncio
+async def test_l1_hit_skips_redis():
+    r, _ = _redis()
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        await cached_json("k", 60, AsyncMock(return_value=[1]))
+        r.get.reset_mock()
+        assert await cached_json("k", 60, AsyncMock(return_value=[2])) == [1]
+    r.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_stale_value_returned_while_refreshing():
+    r, store = _redis()
+    store["k"] = json.dumps({"__v": "old", "__fresh": time.time() - 1})
+    loader = AsyncMock(return_value="new")
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        assert await cached_json("k", 60, loader, stale_ttl_sec=30) == "old"
+        await asyncio.sleep(0)
+        await asyncio.gather(*cache._background)
+        assert await cached_json("k", 60, loader, stale_ttl_sec=30) == "new"
+    loader.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_lock_held_elsewhere_waits_for_redis_value():
+    r, store = _redis()
+    r.set = AsyncMock(return_value=None)  # блокировку держит другой воркер
+    loader = AsyncMock(return_value="mine")
+
+    async def other_worker():
+        await asyncio.sleep(0.02)
+        store["k"] = json.dumps({"__v": "theirs", "__fresh": time.time() + 60})
+
+    with patch("app.backend.core.cache.get_redis", return_value=r), \
+         patch("app.backend.core.cache.CACHE_LOCK_POLL_SEC", 0.01):
+        value, _ = await asyncio.gather(cached_json("k", 60, loader, lock=True), other_worker())
+    assert value == "theirs"
+    loader.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_legacy_plain_value_is_served():
+    r, store = _redis({"k": "[1, 2]"})
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        assert await cached_json("k", 60, AsyncMock()) == [1, 2]
+
+
+def _quote_key(figi):
+    return f"quote:{figi}"
+
+
+@pytest.mark.asyncio
+async def test_many_fetches_only_missing_items_once():
+    r, store = _redis()
+    store["quote:A"] = json.dumps({"__v": {"p": 1}, "__fresh": time.time() + 60})
+    loader = AsyncMock(return_value={"B": {"p": 2}})
+
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        out = await cache.cached_json_many(["A", "B", "C", "A"], _quote_key, 60, loader)
+
+    assert out == {"A": {"p": 1}, "B": {"p": 2}}
+    loader.assert_awaited_once_with(["B", "C"])
+    r.mget.assert_awaited_once_with(["quote:A", "quote:B", "quote:C"])
+    assert json.loads(store["quote:B"])["__v"] == {"p": 2}
+    assert "quote:C" not in store
+
+
+@pytest.mark.asyncio
+async def test_many_shares_entries_with_single_key_reads():
+    r, _ = _redis()
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        await cache.cached_json_many(["A"], _quote_key, 60, AsyncMock(return_value={"A": {"p": 1}}))
+        single = AsyncMock()
+        assert await cached_json("quote:A", 60, single) == {"p": 1}
+        r.mget.reset_mock()
+        again = AsyncMock()
+        assert await cache.cached_json_many(["A"], _quote_key, 60, again) == {"A": {"p": 1}}
+    single.assert_not_awaited()
+    again.assert_not_awaited()
+    r.mget.assert_not_awaited()  # всё из L1
+
+
+@pytest.mark.asyncio
+async def test_many_joins_inflight_single_load():
+    r, _ = _redis()
+
+    async def slow_single():
+        await asyncio.sleep(0.02)
+        return {"p": 1}
+
+    batch_loader = AsyncMock(return_value={"B": {"p": 2}})
+    with patch("app.backend.core.cache.get_redis", return_value=r):
+        single, many = await asyncio.gather(
+            cached_json("quote:A", 60, slow_single),
+            cache.cached_json_many(["A", "B"], _quote_key, 60, batch_loader),
+        )
+    assert single == {"p": 1}
+    assert many == {"A": {"p": 1}, "B": {"p": 2}}
+    batch_loader.assert_awaited_once_with(["B"])
+
+
+@pytest.mark.asyncio
+async def test_many_without_redis_loads_everything():
+    loader = AsyncMock(return_value={"A": 1, "B": 2})
+    with patch("app.backend.core.cache.get_redis", side_effect=ConnectionError("down")):
+        assert await cache.cached_json_many(["A", "B"], _quote_key, 60, loader) == {"A": 1, "B": 2}
+    loader.assert_awaited_once_with(["A", "B"])
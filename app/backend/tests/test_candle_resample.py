@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+from app.backend.services.candle_resample import resample
+
+
+def _c(ts: datetime, o: float, h: float, lo: float, c: float, v: int) -> dict:
+    return {"time": ts, "open": o, "high": h, "low": lo, "close": c, "volume": v}
+
+
+def _t(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+def test_minutes_to_five_minutes():
+    candles = [
+        _c(_t(10, 7, 6), 12, 13, 11, 12.5, 5),  # вне порядка
+        _c(_t(10, 7, 0), 10, 11, 9, 10.5, 1),
+        _c(_t(10, 7, 1), 10.5, 14, 10, 11, 2),
+        _c(_t(10, 7, 4), 11, 12, 8, 11.5, 3),
+    ]
+    assert resample(candles, timedelta(minutes=5)) == [
+        _c(_t(10, 7, 0), 10, 14, 8, 11.5, 6),
+        _c(_t(10, 7, 5), 12, 13, 11, 12.5, 5),
+    ]
+
+
+def test_daily_buckets_follow_exchange_date():
+    candles = [
+        _c(_t(10, 20), 100, 101, 99, 100.5, 10),  # 23:00 МСК 10 марта
+        _c(_t(10, 21), 101, 102, 100, 101.5, 20),  # 00:00 МСК 11 марта
+        _c(_t(11, 7), 102, 105, 101, 104, 30),
+    ]
+    out = resample(candles, timedelta(days=1), tz="Europe/Moscow")
+    assert out == [
+        _c(_t(10, 0), 100, 101, 99, 100.5, 10),
+        _c(_t(11, 0), 101, 105, 100, 104, 50),
+    ]
+
+
+def test_empty():
+    assert resample([], timedelta(hours=1)) == []
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.backend.services import candle_store as cs
+
+
+def _t(hour: int, minute: int = 0, day: int = 10) -> datetime:
+    return datetime(2025, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+def test_align_window_to_interval_boundaries():
+    start, end = cs.align_window(_t(10, 7), _t(12, 31), "15min")
+    assert (start, end) == (_t(10), _t(12, 45))
+    assert cs.align_window(_t(10), _t(11), "1h") == (_t(10), _t(11))
+    naive = datetime(2025, 3, 10, 10, 7)
+    assert cs.align_window(naive, naive, "1d") == (_t(0), _t(0, day=11))
+
+
+def test_missing_ranges_only_gaps():
+    covered = [(_t(9), _t(10)), (_t(11), _t(12)), (_t(12), _t(13))]
+    assert cs.missing_ranges(covered, _t(8), _t(14)) == [(_t(8), _t(9)), (_t(10), _t(11)), (_t(13), _t(14))]
+    assert cs.missing_ranges(covered, _t(11), _t(13)) == []
+    assert cs.missing_ranges([], _t(8), _t(9)) == [(_t(8), _t(9))]
+
+
+def test_merge_and_split_ranges():
+    assert cs.merge_ranges([(_t(11), _t(12)), (_t(9), _t(10)), (_t(10), _t(11))]) == [(_t(9), _t(12))]
+    assert cs.split_range(_t(0), _t(0, day=13), timedelta(days=1)) == [
+        (_t(0), _t(0, day=11)), (_t(0, day=11), _t(0, day=12)), (_t(0, day=12), _t(0, day=13)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_load_splits_settled_history_and_live_tail():
+    settled = AsyncMock(return_value=[{"time": _t(10)}])
+    tail = AsyncMock(return_value=[{"time": _t(12)}])
+    fetch = AsyncMock()
+    with patch.object(cs, "_settled", settled), patch.object(cs, "_tail", tail):
+        out = await cs.load_candles("F", "1h", _t(9, 30), _t(12, 30), fetch, now=_t(12, 20))
+        assert out == [{"time": _t(10)}, {"time": _t(12)}]
+        settled.assert_awaited_once_with("F", "1h", _t(9), _t(12), fetch)
+        tail.assert_awaited_once_with("F", "1h", _t(12), _t(13), fetch)
+
+        settled.reset_mock(); tail.reset_mock()
+        await cs.load_candles("F", "1h", _t(9), _t(11), fetch, now=_t(12, 20))
+        tail.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_settled_stores_each_chunk_before_fetching_next():
+    db = AsyncMock()
+    session = AsyncMock()
+    session.__aenter__.return_value = db
+    store = AsyncMock()
+
+    async def _fetch(s, e):
+        if s >= _t(0, day=11):
+            raise RuntimeError("quota")
+        return [{"time": s}]
+
+    with patch.object(cs, "AsyncSessionLocal", lambda: session), \
+            patch.object(cs, "_covered", AsyncMock(return_value=[])), \
+            patch.object(cs, "_resampled", AsyncMock(return_value=None)), \
+            patch.object(cs, "_store", store):
+        with pytest.raises(RuntimeError):
+            await cs._settled("F", "1min", _t(0), _t(0, day=12), _fetch)
+
+    # первый день сохранён и закоммичен — повтор догрузит только второй
+    store.assert_awaited_once_with(db, "F", "1min", [{"time": _t(0)}], [(_t(0), _t(0, day=11))])
+    db.commit.assert_awaited_once()
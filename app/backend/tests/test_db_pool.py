@@ -0,0 +1,72 @@
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import exc as sa_exc
+
+from app.backend.db.pool_stats import InstrumentedQueuePool, PoolStats, pool_status
+from app.backend.db.session import LazySession, get_db, with_session
+
+
+def _pool(stats: PoolStats) -> InstrumentedQueuePool:
+    return InstrumentedQueuePool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        pool_size=1,
+        max_overflow=1,
+        timeout=0.05,
+        stats=stats,
+    )
+
+
+def test_pool_records_checkouts_overflow_and_timeouts():
+    stats = PoolStats(buckets_ms=(10, 100))
+    pool = _pool(stats)
+
+    first = pool.connect()
+    second = pool.connect()  # сверх pool_size — overflow
+    with pytest.raises(sa_exc.TimeoutError):
+        pool.connect()
+
+    status = pool_status(pool)
+    assert status["in_use"] == 2
+    assert status["overflow"] == 1
+    assert status["checkouts"] == 2
+    assert status["overflow_checkouts"] == 1
+    assert status["timeouts"] == 1
+    assert status["peak_in_use"] == 2
+    assert status["wait_histogram"]["inf"] >= 1
+
+    first.close()
+    second.close()
+    assert pool_status(pool)["in_use"] == 0
+
+
+def test_lazy_session_not_created_until_used():
+    factory = MagicMock()
+    db = LazySession(factory)
+    assert not db.started
+    db.close()
+    factory.assert_not_called()
+
+    db.scalars("q")
+    factory.assert_called_once()
+    factory.return_value.scalars.assert_called_once_with("q")
+    db.close()
+    factory.return_value.close.assert_called_once()
+    assert not db.started
+
+
+def test_get_db_closes_only_started_session():
+    gen = get_db()
+    db = next(gen)
+    assert isinstance(db, LazySession) and not db.started
+    with pytest.raises(StopIteration):
+        next(gen)
+
+
+def test_with_session_closes_its_own_session():
+    factory = MagicMock()
+    db = factory.return_value.__enter__.return_value
+    with patch("app.backend.db.session.SessionLocal", factory):
+        assert with_session(lambda s, uid: (s, uid), 7) == (db, 7)
+    factory.return_value.__exit__.assert_called_once()
@@ -0,0 +1,123 @@
+import base64
+import json
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.backend.services import instrument_registry as ir
+from app.backend.services.instrument_registry import InstrumentRegistry, InstrumentSnapshot
+
+
+MATURITY = datetime(2031, 5, 15, tzinfo=timezone.utc)
+
+
+def _instr(figi, ticker, nominal=None, maturity_date=None):
+    return SimpleNamespace(figi=figi, ticker=ticker, name=ticker, currency="rub", isin=None, nominal=nominal,
+                           maturity_date=maturity_date)
+
+
+SHARES = [_instr("F_SBER", "sber"), _instr("F_DUP_S", "DUP"), _instr("F_EMPTY", "")]
+BONDS = [_instr("F_OFZ", "SU26238", nominal=SimpleNamespace(units=1000, nano=0), maturity_date=MATURITY),
+         _instr("F_DUP_B", "DUP", maturity_date=datetime(1970, 1, 1, tzinfo=timezone.utc))]
+ETFS = [_instr("F_TMOS", "TMOS")]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.kv = {}
+
+    async def get(self, key):
+        return self.kv.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = str(value)
+        return True
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class _Pipe:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def set(self, key, value):
+                redis.kv[key] = str(value)
+
+            async def execute(self):
+                return []
+
+        return _Pipe()
+
+
+@pytest.fixture
+def redis():
+    r = _FakeRedis()
+    with patch("app.backend.services.instrument_registry.get_redis", AsyncMock(return_value=r)):
+        yield r
+
+
+def test_snapshot_lookups_and_roundtrip():
+    snap = InstrumentSnapshot.from_api(100, SHARES, BONDS, ETFS)
+    assert len(snap) == 5
+    assert snap.by_figi("F_OFZ") == {
+        "figi": "F_OFZ", "class": "bond", "name": "SU26238", "currency": "rub",
+        "isin": None, "nominal": 1000.0, "maturity": MATURITY.timestamp(), "ticker": "SU26238",
+    }
+    assert snap.by_figi("F_DUP_B")["maturity"] is None  # пустая дата API
+    assert snap.by_figi("F_SBER")["nominal"] is None
+    assert [r["class"] for r in snap.by_ticker(" dup ")] == ["share", "bond"]
+    assert snap.by_figi("missing") is None
+
+    loaded = InstrumentSnapshot.loads(snap.dumps())
+    assert loaded.version == 100
+    assert [loaded.record(i) for i in range(len(loaded))] == [snap.record(i) for i in range(len(snap))]
+
+
+def test_loads_snapshot_without_maturity_column():
+    payload = json.loads(zlib.decompress(base64.b64decode(InstrumentSnapshot.from_api(7, SHARES, BONDS, ETFS).dumps())))
+    del payload["maturity"]
+    old = base64.b64encode(zlib.compress(json.dumps(payload).encode("utf-8"))).decode("ascii")
+    assert InstrumentSnapshot.loads(old).by_figi("F_OFZ")["maturity"] is None
+
+
+@pytest.mark.asyncio
+async def test_rebuild_publishes_and_other_worker_hot_swaps(redis):
+    builder = InstrumentRegistry(fetch=AsyncMock(return_value=(SHARES, BONDS, ETFS)))
+    reader = InstrumentRegistry(fetch=AsyncMock())
+
+    await builder.refresh_if_stale("token")
+    assert len(builder) == 5
+    assert await reader.sync()
+    assert reader.snapshot.by_figi("F_TMOS")["class"] == "etf"
+    assert not await reader.sync()  # версия не сменилась
+
+    await reader.refresh_if_stale("token")  # свежий снимок — без сборки
+    reader._fetch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_only_lock_holder_rebuilds(redis, monkeypatch):
+    a = InstrumentRegistry(fetch=AsyncMock(return_value=(SHARES, [], [])))
+    b = InstrumentRegistry(fetch=AsyncMock(return_value=(SHARES, [], [])))
+    monkeypatch.setattr(ir.time, "time", lambda: 10**9)
+    await a.refresh_if_stale("t")
+    await b.refresh_if_stale("t")
+    a._fetch.assert_awaited_once()
+    b._fetch.assert_not_awaited()
+
+
+def test_resolve_many_with_class_hint():
+    snap = InstrumentSnapshot.from_api(1, SHARES, BONDS, ETFS)
+    rows = snap.resolve_many(["DUP", "SBER", "NOPE", ""])
+    assert [snap.figi[r] if r >= 0 else None for r in rows] == ["F_DUP_S", "F_SBER", None, None]
+    rows = snap.resolve_many(["DUP", "SBER"], "bond")
+    assert [snap.figi[r] if r >= 0 else None for r in rows] == ["F_DUP_B", None]
+    assert list(snap.resolve_many(["DUP"], "future")) == [-1]
@@ -0,0 +1,66 @@
+import pytest
+
+from app.backend.services.instrument_registry import CLASSES, InstrumentSnapshot
+from app.backend.services.instrument_search import InstrumentSearchIndex, normalize, translit
+
+ROWS = [
+    ("F_SBER", "SBER", "share", "Сбербанк России", "RU0009029540"),
+    ("F_SBERP", "SBERP", "share", "Сбербанк России - привилегированные акции", "RU0009029557"),
+    ("F_SBMX", "SBMX", "etf", "Первая - Фонд Топ Российских акций", "RU000A0ZZ5R2"),
+    ("F_OFZ", "SU26238RMFS4", "bond", "ОФЗ 26238", "RU000A1038V6"),
+    ("F_YDEX", "YDEX", "share", "Яндекс", "RU000A107T19"),
+    ("F_GAZP", "GAZP", "share", "Газпром", "RU0007661625"),
+]
+
+
+def _index() -> InstrumentSearchIndex:
+    cols = {
+        "figi": [r[0] for r in ROWS], "ticker": [r[1] for r in ROWS],
+        "class": [CLASSES.index(r[2]) for r in ROWS], "name": [r[3] for r in ROWS],
+        "currency": ["rub"] * len(ROWS), "isin": [r[4] for r in ROWS],
+        "nominal": [1000.0 if r[2] == "bond" else 0.0 for r in ROWS],
+    }
+    return InstrumentSearchIndex(InstrumentSnapshot(1, cols))
+
+
+def _tickers(index, q, **kw):
+    return [index.snapshot.ticker[row] for row, _ in index.search(q, **kw)]
+
+
+def test_normalize_and_translit():
+    assert normalize("  Ёлка-Палка! ") == "елка палка"
+    assert translit("сбербанк") == "sberbank"
+
+
+def test_ticker_prefix_ranks_exact_first():
+    index = _index()
+    assert _tickers(index, "sber")[:2] == ["SBER", "SBERP"]
+    assert _tickers(index, "SBERP")[0] == "SBERP"
+
+
+def test_name_isin_and_cyrillic_queries():
+    index = _index()
+    assert _tickers(index, "яндекс") == ["YDEX"]
+    assert _tickers(index, "RU0007661625") == ["GAZP"]
+    assert _tickers(index, "сбер")[:2] == ["SBER", "SBERP"]  # транслит в тикер
+    assert _tickers(index, "ыиук")[0] == "SBER"  # набрано в русской раскладке
+    assert "GAZP" in _tickers(index, "gazprom")
+
+
+def test_fuzzy_and_class_filter():
+    index = _index()
+    assert _tickers(index, "сбербанк росии")[0] in ("SBER", "SBERP")  # опечатка
+    assert _tickers(index, "офз", classes=["bond"]) == ["SU26238RMFS4"]
+    assert _tickers(index, "sber", classes=["etf"]) == []
+    assert index.search("  ") == []
+
+
+@pytest.mark.asyncio
+async def test_index_follows_registry_snapshot():
+    from app.backend.services.instrument_search import search_index
+
+    first = _index().snapshot
+    second = InstrumentSnapshot.empty()
+    assert (await search_index(first)).snapshot is first
+    assert await search_index(first) is await search_index(first)
+    assert (await search_index(second)).snapshot is second
@@ -0,0 +1,159 @@
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.backend.services import market_stream as ms
+from app.backend.services.market_stream import LivePrice, MarketStreamLeader, PriceWriter, trade_time
+
+
+class _FakeRedis:
+    """SET NX / EVAL продления и снятия / hash — ровно то, что нужно лидеру и читателям."""
+
+    def __init__(self):
+        self.kv = {}
+        self.hashes = {}
+        self.published = []
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    async def delete(self, *keys):
+        for k in keys:
+            self.kv.pop(k, None)
+            self.hashes.pop(k, None)
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.kv.get(key) != token:
+            return 0
+        if script == ms._RELEASE_LUA:
+            del self.kv[key]
+        return 1
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(f) for f in fields]
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class _Pipe:
+            def __init__(self):
+                self.ops = []
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def exists(self, key):
+                self.ops.append(lambda: int(key in redis.kv))
+
+            def hmget(self, key, fields):
+                self.ops.append(lambda: [redis.hashes.get(key, {}).get(f) for f in fields])
+
+            async def execute(self):
+                return [op() for op in self.ops]
+
+        return _Pipe()
+
+
+@pytest.fixture
+def redis():
+    r = _FakeRedis()
+    with patch("app.backend.services.market_stream.get_redis", AsyncMock(return_value=r)):
+        yield r
+
+
+@pytest.mark.asyncio
+async def test_leader_election_and_failover(redis):
+    a = MarketStreamLeader("token", worker_id="a")
+    b = MarketStreamLeader("token", worker_id="b")
+
+    assert await a.acquire()
+    assert not await b.acquire()
+    assert await a.renew()
+    assert not await b.renew()
+
+    del redis.kv[ms.LEADER_KEY]  # лидер упал, TTL истёк
+    assert await b.acquire()
+    assert not await a.renew()
+
+    await a.release()  # чужое лидерство не снимается
+    assert redis.kv[ms.LEADER_KEY] == "b"
+    await b.release()
+    assert ms.LEADER_KEY not in redis.kv
+
+
+@pytest.mark.asyncio
+async def test_prices_read_only_while_stream_alive(redis):
+    writer = PriceWriter()
+    writer.put("F1", 101.5, 1700000000.0)
+    assert await writer.flush() == 1
+    assert json.loads(redis.hashes[ms.LAST_PRICES_KEY]["F1"]) == {"p": 101.5, "t": 1700000000.0}
+    (channel, message), = redis.published
+    assert channel == ms.PRICES_CHANNEL
+    assert ms.decode_prices(message) == {"F1": LivePrice(101.5, 1700000000.0)}
+
+    assert await ms.last_prices(["F1", "F2"]) == {}
+
+    leader = MarketStreamLeader("token", worker_id="a", session=AsyncMock())
+    leader.writer.connected = True
+    await leader.heartbeat()
+    assert await ms.last_prices(["F1", "F2"]) == {"F1": LivePrice(101.5, 1700000000.0)}
+
+    leader.writer.connected = False
+    await leader.heartbeat()
+    assert await ms.last_prices(["F1"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_writer_keeps_prices_when_redis_fails():
+    writer = PriceWriter()
+    writer.put("F1", 1.0, 1.0)
+    with patch("app.backend.services.market_stream.get_redis", AsyncMock(side_effect=ConnectionError("down"))):
+        with pytest.raises(ConnectionError):
+            await writer.flush()
+    writer.put("F2", 2.0, 2.0)
+    r = _FakeRedis()
+    with patch("app.backend.services.market_stream.get_redis", AsyncMock(return_value=r)):
+        assert await writer.flush() == 2
+
+
+@pytest.mark.asyncio
+async def test_last_prices_without_redis_is_empty():
+    with patch("app.backend.services.market_stream.get_redis", AsyncMock(side_effect=ConnectionError("down"))):
+        assert await ms.last_prices(["F1"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_last_good_prices_survive_stream_drop(redis):
+    w = PriceWriter()
+    w.put("SBER", 250.5, 1000.0)
+    await w.flush()
+    await ms.remember_prices({"GAZP": LivePrice(160.0, 2000.0)})
+    await w.drop()
+
+    assert await ms.last_prices(["SBER"]) == {}
+    assert await ms.last_good_prices(["SBER", "GAZP", "YNDX"]) == {
+        "SBER": LivePrice(250.5, 1000.0),
+        "GAZP": LivePrice(160.0, 2000.0),
+    }
+
+
+def test_trade_time_ignores_empty_api_date():
+    traded = datetime(2026, 3, 2, 10, tzinfo=timezone.utc)
+    assert trade_time(SimpleNamespace(time=traded), 5.0) == traded.timestamp()
+    assert trade_time(SimpleNamespace(time=datetime(1970, 1, 1, tzinfo=timezone.utc)), 5.0) == 5.0
+    assert trade_time(SimpleNamespace(time=None), 5.0) == 5.0
@@ -1,8 +1,9 @@
 import pytest
 from fastapi import HTTPException
-from unittest.mock import MagicMock
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
 
-from app.backend.routes.portfolio import _ensure_portfolio_of_user
+from app.backend.routes.portfolio import _ensure_portfolio_of_user, _record_trade
 
 
 def test_ensure_portfolio_denies_other_user():
@@ -19,3 +20,14 @@ def test_ensure_portfolio_allows_owner():
     db.query.return_value.filter.return_value.first.return_value = pf
     result = _ensure_portfolio_of_user(db, portfolio_id=99, user_id=1)
     assert result is pf
+
+
+def test_record_trade_reads_latest_trade_under_position_lock():
+    calls = []
+    trade = MagicMock(portfolio_id=1, figi="F", trade_at=datetime(2026, 1, 2, tzinfo=timezone.utc))
+    with patch("app.backend.routes.portfolio.trade_ledger") as ledger:
+        ledger.lock_position.side_effect = lambda *a: calls.append("lock")
+        ledger.latest_trade_at.side_effect = lambda *a: calls.append("latest")
+        _record_trade(MagicMock(), trade)
+    assert calls == ["lock", "latest"]
+    ledger.apply_trade.assert_called_once()
@@ -0,0 +1,71 @@
+import pytest
+
+from app.backend.services.portfolio_valuation import price_fingerprint, value_positions
+
+PORTFOLIOS = [{"id": 1, "title": "Брокер"}, {"id": 2, "title": "ИИС"}]
+QUOTES = {
+    "SBER": {"price": 300.0, "class_": "share", "currency": "rub", "ticker": "SBER"},
+    "OFZ": {"price": 950.0, "dirty_price": 970.0, "class_": "bond", "currency": "rub", "stale": True},
+    "AAPL": {"price": 200.0, "class_": "share", "currency": "usd"},
+}
+
+
+def _pos(pid, portfolio_id, figi, qty, avg):
+    return {"id": pid, "portfolio_id": portfolio_id, "figi": figi, "quantity": qty, "avg_price": avg}
+
+
+def test_values_all_portfolios_in_one_pass():
+    positions = [
+        _pos(1, 1, "SBER", 10, 250.0),
+        _pos(2, 1, "OFZ", 2, 1000.0),
+        _pos(3, 2, "AAPL", 5, 100.0),
+        _pos(4, 2, "NOPE", 1, 10.0),
+    ]
+    v = value_positions(PORTFOLIOS, positions, QUOTES)
+
+    broker, iis = v["portfolios"]
+    rub = broker["by_currency"]["rub"]
+    assert list(broker["by_currency"]) == ["rub"]
+    assert rub["value"] == pytest.approx(3000 + 1940)  # облигация — по грязной цене
+    assert rub["pnl"] == pytest.approx(4940 - 4500)
+    assert [p["figi"] for p in broker["positions"]] == ["SBER", "OFZ"]
+    assert broker["positions"][0]["weight"] == pytest.approx(3000 / 4940 * 100)
+    assert rub["by_class"]["bond"]["weight"] == pytest.approx(1940 / 4940 * 100)
+
+    # позиция без цены не входит ни в стоимость, ни в затраты
+    usd = iis["by_currency"]["usd"]
+    assert usd["value"] == 1000.0 and usd["cost"] == 500.0
+    assert iis["positions"][0]["weight"] == pytest.approx(100.0)
+    assert iis["positions"][1] == {
+        **iis["positions"][1], "figi": "NOPE", "currency": None, "value": None, "pnl": None, "weight": None,
+    }
+    assert v["unpriced"] == ["NOPE"]
+
+    # рубли и доллары не складываются: итоги и доли — внутри своей валюты
+    assert v["by_currency"]["rub"]["value"] == pytest.approx(4940.0)
+    assert v["by_currency"]["usd"]["value"] == 1000.0
+    assert v["by_currency"]["usd"]["pnl_percent"] == pytest.approx(100.0)
+    assert rub["weight"] == pytest.approx(100.0) and usd["weight"] == pytest.approx(100.0)
+    assert v["by_currency"]["rub"]["by_class"]["share"]["value"] == pytest.approx(3000.0)
+    assert v["by_currency"]["usd"]["by_class"] == {"share": {"value": 1000.0, "weight": 100.0}}
+    assert v["stale"] is True
+
+
+def test_same_currency_shares_across_portfolios():
+    positions = [_pos(1, 1, "SBER", 10, 250.0), _pos(2, 2, "SBER", 30, 250.0), _pos(3, 2, "AAPL", 1, 100.0)]
+    v = value_positions(PORTFOLIOS, positions, QUOTES)
+    broker, iis = v["portfolios"]
+    assert broker["by_currency"]["rub"]["weight"] == pytest.approx(25.0)
+    assert iis["by_currency"]["rub"]["weight"] == pytest.approx(75.0)
+    assert iis["positions"][0]["weight"] == pytest.approx(100.0)  # SBER — вся рублёвая часть ИИС
+
+
+def test_empty_portfolio_and_fingerprint():
+    v = value_positions(PORTFOLIOS[:1], [], {})
+    assert v["portfolios"][0] == {"portfolio_id": 1, "title": "Брокер", "by_currency": {}, "positions": []}
+    assert v["by_currency"] == {}
+    a, b = {"price": 1.0}, {"price": 2.0}
+    assert price_fingerprint({"A": a, "B": b}) == price_fingerprint({"B": b, "A": a})
+    assert price_fingerprint({"A": a}) != price_fingerprint({"A": {"price": 1.01}})
+    # та же цена из запасной копии (предохранитель разомкнут) — другой ключ кэша
+    assert price_fingerprint({"A": a}) != price_fingerprint({"A": {**a, "stale": True}})
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.backend.services.market_stream import LivePrice
+from app.backend.services.price_fanout import PriceFanout
+
+
+@pytest.fixture
+def fanout(monkeypatch):
+    calls = []
+
+    def _normalize(figi, lp):
+        calls.append(figi)
+        return {"figi": figi, "price": lp.price * 10, "as_of": lp.as_of}
+
+    f = PriceFanout(_normalize)
+    f.calls = calls
+    monkeypatch.setattr(f, "_listen", lambda: asyncio.sleep(3600))
+    yield f
+
+
+@pytest.mark.asyncio
+async def test_one_computation_per_figi_for_all_subscribers(fanout):
+    subs = [fanout.subscribe(["SBER", "GAZP"]) for _ in range(3)]
+    other = fanout.subscribe(["GAZP"])
+
+    assert fanout.dispatch({"SBER": LivePrice(1.5, 100.0), "YNDX": LivePrice(2.0, 100.0)}) == 1
+    assert fanout.calls == ["SBER"]
+    for sub in subs:
+        assert await sub.changes(0.1) == {"SBER": {"figi": "SBER", "price": 15.0, "as_of": 100.0}}
+    assert await other.changes(0.01) == {}
+
+    for sub in [*subs, other]:
+        fanout.unsubscribe(sub)
+    assert fanout.subscribers("SBER") == 0
+    assert fanout._listener is None
+
+
+@pytest.mark.asyncio
+async def test_unchanged_price_not_pushed_and_changes_coalesce(fanout):
+    sub = fanout.subscribe(["SBER"])
+    fanout.dispatch({"SBER": LivePrice(1.0, 1.0)})
+    fanout.dispatch({"SBER": LivePrice(2.0, 2.0)})
+    assert await sub.changes(0.1) == {"SBER": {"figi": "SBER", "price": 20.0, "as_of": 2.0}}
+
+    assert fanout.dispatch({"SBER": LivePrice(2.0, 3.0)}) == 0
+    assert await sub.changes(0.01) == {}
+    fanout.unsubscribe(sub)
@@ -24,9 +24,32 @@ async def test_rate_limit_fail_open_when_redis_unavailable():
 @pytest.mark.asyncio
 async def test_rate_limit_exceeded():
     mock_redis = AsyncMock()
-    mock_redis.incr = AsyncMock(return_value=6)
-    mock_redis.expire = AsyncMock()
+    mock_redis.eval = AsyncMock(return_value=[0, 1500])
     with patch("app.backend.core.cache.get_redis", return_value=mock_redis):
         with pytest.raises(HTTPException) as exc:
             await rate_limit("login:1.2.3.4", limit=5, window_sec=60)
         assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "2"
+    # один round trip: скрипт, ключ, лимит, окно в мс
+    assert mock_redis.eval.await_args.args[1:] == (1, "rl:login:1.2.3.4", 5, 60000)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_allowed_single_round_trip():
+    mock_redis = AsyncMock()
+    mock_redis.eval = AsyncMock(return_value=[1, 30000])
+    with patch("app.backend.core.cache.get_redis", return_value=mock_redis):
+        await rate_limit("quote", limit=5, window_sec=60)
+    mock_redis.eval.assert_awaited_once()
+    mock_redis.incr.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_local_bucket_when_redis_unavailable():
+    with patch("app.backend.core.cache.get_redis", side_effect=ConnectionError("down")):
+        await rate_limit("local-key", limit=2, window_sec=60)
+        await rate_limit("local-key", limit=2, window_sec=60)
+        with pytest.raises(HTTPException) as exc:
+            await rate_limit("local-key", limit=2, window_sec=60)
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "30"
@@ -2,7 +2,24 @@
 
 from decimal import Decimal
 
-from app.backend.core.security import decrypt_amount, decrypt_token, encrypt_amount, encrypt_token
+import pytest
+
+from app.backend.core import security
+from app.backend.core.config import get_settings
+from app.backend.core.security import (
+    PasswordHasherBusy,
+    decrypt_amount,
+    decrypt_amounts,
+    decrypt_token,
+    encrypt_amount,
+    encrypt_amount_v2,
+    encrypt_token,
+    hash_password_async,
+    pwd_context,
+    reencrypt_amount_v2,
+    verify_and_update_password,
+    verify_and_update_password_async,
+)
 
 
 def test_encrypt_decrypt_token_roundtrip():
@@ -22,3 +39,87 @@ def test_empty_values():
     assert encrypt_token("") == ""
     assert decrypt_token("") == ""
     assert decrypt_amount("") == Decimal(0)
+
+
+def test_decrypt_amounts_preserves_order_and_empty():
+    values = [encrypt_amount(Decimal("1.50")), "", None, encrypt_amount(Decimal("42")), "garbage"]
+    assert decrypt_amounts(values) == [Decimal("1.50"), Decimal(0), Decimal(0), Decimal("42"), Decimal(0)]
+
+
+def test_decrypt_amounts_process_pool(monkeypatch):
+    from app.backend.core import security
+    from app.backend.core.config import get_settings
+
+    monkeypatch.setattr(security, "DECRYPT_POOL_MIN_BATCH", 3)
+    monkeypatch.setattr(security, "DECRYPT_POOL_CHUNK_SIZE", 2)
+    monkeypatch.setattr(get_settings(), "DECRYPT_POOL_WORKERS", 1)
+    try:
+        amounts = [Decimal(i) for i in range(5)]
+        assert decrypt_amounts(encrypt_amount(a) for a in amounts) == amounts
+    finally:
+        security.shutdown_decrypt_pool()
+
+
+def test_tx_amounts_falls_back_to_plain_amount():
+    from types import SimpleNamespace
+
+    from app.backend.services.budget_amounts import tx_amount_map
+
+    txs = [
+        SimpleNamespace(id=1, amount_encrypted=encrypt_amount(Decimal("10.10")), amount_encrypted_v2=None, amount=None),
+        SimpleNamespace(id=2, amount_encrypted=None, amount_encrypted_v2=None, amount=Decimal("7")),
+    ]
+    assert tx_amount_map(txs) == {1: Decimal("10.10"), 2: Decimal("7")}
+
+
+def test_amount_v2_roundtrip_and_size():
+    blob = encrypt_amount_v2(Decimal("12345.67"))
+    assert isinstance(blob, bytes)
+    assert len(blob) == 37
+    assert decrypt_amount(blob) == Decimal("12345.67")
+    assert decrypt_amount(memoryview(blob)) == Decimal("12345.67")
+
+
+def test_amount_v2_tampered_returns_zero():
+    blob = bytearray(encrypt_amount_v2(Decimal("10")))
+    blob[-1] ^= 0x01
+    assert decrypt_amount(bytes(blob)) == Decimal("0")
+
+
+def test_reencrypt_v1_token_to_v2():
+    blob = reencrypt_amount_v2(encrypt_amount(Decimal("99.90")))
+    assert decrypt_amount(blob) == Decimal("99.90")
+    assert reencrypt_amount_v2("not-a-token") is None
+
+
+def test_decrypt_amounts_mixed_formats():
+    values = [encrypt_amount(Decimal("1")), encrypt_amount_v2(Decimal("2.50"))]
+    assert decrypt_amounts(values) == [Decimal("1"), Decimal("2.50")]
+
+
+def test_verify_and_update_rehashes_on_cost_change():
+    old_hash = pwd_context.handler("bcrypt").using(rounds=4).hash("Secret-1!")
+
+    ok, new_hash = verify_and_update_password("Secret-1!", old_hash)
+    assert ok and new_hash
+    assert verify_and_update_password("Secret-1!", new_hash) == (True, None)
+    assert verify_and_update_password("wrong", old_hash) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_password_hash_queue_limit(monkeypatch):
+    monkeypatch.setattr(security, "_hash_pending", get_settings().PASSWORD_HASH_MAX_PENDING)
+    with pytest.raises(PasswordHasherBusy):
+        await hash_password_async("Secret-1!")
+
+
+@pytest.mark.asyncio
+async def test_password_hash_async_in_thread_pool(monkeypatch):
+    monkeypatch.setattr(get_settings(), "PASSWORD_HASH_PROCESSES", False)
+    security.shutdown_hash_pool()
+    try:
+        hashed = await hash_password_async("Secret-1!")
+        assert await verify_and_update_password_async("Secret-1!", hashed) == (True, None)
+        assert security._hash_pending == 0
+    finally:
+        security.shutdown_hash_pool()
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.backend.services import tinkoff_clients as tc
+from app.backend.services.tinkoff_clients import TinkoffClientPool, TinkoffUnavailable
+
+
+class _FakeApi:
+    def __init__(self, fail_connects: int = 0):
+        self.fail_connects = fail_connects
+        self.connects = 0
+        self.closed = 0
+
+    async def connect(self, token: str):
+        self.connects += 1
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise OSError("connection refused")
+
+        async def _close():
+            self.closed += 1
+
+        return SimpleNamespace(token=token, n=self.connects), _close
+
+
+class _ChannelError(Exception):
+    code = SimpleNamespace(name="UNAVAILABLE")
+
+
+async def _ok(_services):
+    return None
+
+
+async def _echo(services):
+    return services
+
+
+@pytest.mark.asyncio
+async def test_channel_reused_per_token():
+    api = _FakeApi()
+    pool = TinkoffClientPool(connect=api.connect)
+    try:
+        first = await pool.call("t1", _echo)
+        second = await pool.call("t1", _echo)
+        other = await pool.call("t2", _echo)
+        assert first is second
+        assert other is not first
+        assert api.connects == 2
+    finally:
+        await pool.close()
+    assert api.closed == 2
+
+
+@pytest.mark.asyncio
+async def test_channel_error_resets_and_reconnects():
+    api = _FakeApi()
+    pool = TinkoffClientPool(connect=api.connect)
+
+    async def _broken(_services):
+        raise _ChannelError()
+
+    try:
+        with pytest.raises(_ChannelError):
+            await pool.call("t", _broken)
+        assert api.closed == 1
+        await pool.call("t", _ok)
+        assert api.connects == 2
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_connect_backs_off(monkeypatch):
+    api = _FakeApi(fail_connects=1)
+    pool = TinkoffClientPool(connect=api.connect, backoff_sec=10)
+    now = [1000.0]
+    monkeypatch.setattr(tc.time, "monotonic", lambda: now[0])
+    try:
+        with pytest.raises(TinkoffUnavailable):
+            await pool.call("t", _ok)
+        with pytest.raises(TinkoffUnavailable):
+            await pool.call("t", _ok)  # ещё в backoff — без новой попытки
+        assert api.connects == 1
+
+        now[0] += 11
+        await pool.call("t", _ok)
+        assert api.connects == 2
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_maintain_evicts_idle_and_drops_unhealthy(monkeypatch):
+    api = _FakeApi()
+
+    async def _health(services):
+        if services.token == "sick":
+            raise OSError("down")
+
+    pool = TinkoffClientPool(connect=api.connect, health_check=_health, idle_ttl_sec=100, health_interval_sec=10)
+    now = [0.0]
+    monkeypatch.setattr(tc.time, "monotonic", lambda: now[0])
+    try:
+        await pool.call("idle", _ok)
+        now[0] = 50
+        await pool.call("sick", _ok)
+        await pool.call("healthy", _ok)
+
+        now[0] = 100
+        await pool.maintain()
+        assert len(pool) == 2  # idle закрыт
+        assert api.closed == 2  # idle + sick (сброшен, запись остаётся)
+
+        await pool.call("sick", _ok)
+        assert api.connects == 4
+    finally:
+        await pool.close()
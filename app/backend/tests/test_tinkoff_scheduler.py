@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.backend.services.market_stream import LivePrice
+from app.backend.services.tinkoff_clients import TinkoffUnavailable
+from app.backend.services.tinkoff_scheduler import TinkoffCircuitOpen, TinkoffScheduler
+
+
+class _FakePool:
+    def __init__(self, bad_tokens=()):
+        self.calls = []
+        self.bad_tokens = set(bad_tokens)
+
+    async def call(self, token, fn):
+        if token in self.bad_tokens:
+            raise _AuthError()
+        market_data = SimpleNamespace(get_last_prices=self._last_prices(token))
+        return await fn(SimpleNamespace(market_data=market_data))
+
+    def _last_prices(self, token):
+        async def _get(figi):
+            self.calls.append((token, sorted(figi)))
+            await asyncio.sleep(0)
+            return SimpleNamespace(last_prices=[
+                SimpleNamespace(figi=f, price=SimpleNamespace(units=int(f[1:]), nano=0), time=_traded(int(f[1:])))
+                for f in figi if f != "F0"
+            ])
+        return _get
+
+
+def _traded(n):
+    return datetime.fromtimestamp(1_700_000_000 + n, timezone.utc)
+
+
+def _lp(n):
+    """Цена n, сделка — в момент _traded(n)."""
+    return LivePrice(float(n), _traded(n).timestamp())
+
+
+class _AuthError(Exception):
+    code = SimpleNamespace(name="UNAUTHENTICATED")
+
+
+def _scheduler(pool, **kw):
+    return TinkoffScheduler(pool=pool, quotas={"market_data": 600}, workers=1, coalesce_window_sec=0.01, **kw)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_coalesce_into_one_call():
+    pool = _FakePool()
+    s = _scheduler(pool)
+    a, b, c = await asyncio.gather(
+        s.last_prices(["F1", "F2"], "t1"),
+        s.last_prices(["F2", "F3"], "t2"),
+        s.last_prices(["F0"], "t1"),
+    )
+    assert a == {"F1": _lp(1), "F2": _lp(2)}  # время — сделки, а не запроса
+    assert b == {"F2": _lp(2), "F3": _lp(3)}
+    assert c == {}  # нет цены — нет ключа
+    assert len(pool.calls) == 1
+    assert pool.calls[0][1] == ["F0", "F1", "F2", "F3"]
+    assert s.stats.snapshot()["last_prices"] == {"figis_requested": 5, "figis_fetched": 4, "batches": 1}
+
+
+@pytest.mark.asyncio
+async def test_batch_falls_back_to_next_token():
+    pool = _FakePool(bad_tokens={"revoked"})
+    s = _scheduler(pool)
+    a, b = await asyncio.gather(s.last_prices(["F1"], "revoked"), s.last_prices(["F2"], "ok"))
+    assert (a, b) == ({"F1": _lp(1)}, {"F2": _lp(2)})
+
+    with pytest.raises(_AuthError):
+        await s.last_prices(["F3"], "revoked")
+
+
+@pytest.mark.asyncio
+async def test_quota_queues_then_rejects():
+    pool = _FakePool()
+    s = TinkoffScheduler(pool=pool, quotas={"market_data": 60}, workers=1, max_wait_sec=1.5)
+
+    async def _noop(_c):
+        return None
+
+    bucket = s._bucket("t", "market_data")
+    bucket.tokens = 0.99  # почти исчерпана: следующий вызов ждёт ~10 мс
+    await s.call("t", "market_data", _noop)
+    bucket.tokens = -2  # очередь на 3 секунды дольше max_wait
+    with pytest.raises(TinkoffUnavailable):
+        await s.call("t", "market_data", _noop)
+    g = s.stats.snapshot()["groups"]["market_data"]
+    assert (g["calls"], g["rejected"], g["queue_depth"]) == (1, 1, 0)
+    assert g["wait_max_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_on_failures_and_recovers_after_probe():
+    s = _scheduler(_FakePool(bad_tokens={"revoked"}), breaker_failures=2, breaker_open_sec=0.05)
+    healthy = True
+
+    async def _call(_c):
+        if not healthy:
+            raise ConnectionError("unavailable")
+        return "ok"
+
+    # ошибки токена — проблема пользователя: предохранитель не размыкают
+    for _ in range(3):
+        with pytest.raises(_AuthError):
+            await s.call("revoked", "market_data", _call)
+    assert s.breaker("market_data").state == "closed"
+
+    healthy = False
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await s.call("t", "market_data", _call)
+    with pytest.raises(TinkoffCircuitOpen):
+        await s.call("t", "market_data", _call)  # отклонён без вызова
+
+    await asyncio.sleep(0.06)
+    with pytest.raises(ConnectionError):
+        await s.call("t", "market_data", _call)  # проба не прошла — снова open
+    with pytest.raises(TinkoffCircuitOpen):
+        await s.call("t", "market_data", _call)
+
+    healthy = True
+    await asyncio.sleep(0.06)
+    assert await s.call("t", "market_data", _call) == "ok"
+    snap = s.snapshot()["breakers"]["market_data"]
+    assert (snap["state"], snap["trips"], snap["rejected"]) == ("closed", 2, 2)
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_trip_breaker_and_timeout_is_unavailable():
+    s = _scheduler(_FakePool(), breaker_failures=2, breaker_slow_call_sec=0.01, call_timeout_sec=0.05)
+
+    async def _slow(_c):
+        await asyncio.sleep(0.02)
+
+    async def _hang(_c):
+        await asyncio.sleep(1)
+
+    await s.call("t", "market_data", _slow)
+    assert s.breaker("market_data").state == "closed"
+    with pytest.raises(TinkoffUnavailable):
+        await s.call("t", "market_data", _hang)
+    assert s.breaker("market_data").state == "open"
+
+
+
+class _HangingPool(_FakePool):
+    """get_last_prices зависает: API не отвечает, токен ни при чём."""
+
+    def _last_prices(self, token):
+        async def _get(figi):
+            self.calls.append((token, sorted(figi)))
+            await asyncio.sleep(1)
+        return _get
+
+
+@pytest.mark.asyncio
+async def test_batch_timeout_does_not_retry_other_tokens():
+    pool = _HangingPool()
+    s = _scheduler(pool, call_timeout_sec=0.02)
+    results = await asyncio.gather(s.last_prices(["F1"], "t1"), s.last_prices(["F2"], "t2"), return_exceptions=True)
+    assert all(isinstance(r, TinkoffUnavailable) for r in results)
+    assert len(pool.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_skips_token_with_exhausted_quota():
+    pool = _FakePool()
+    s = _scheduler(pool)
+    s._bucket("t1", "market_data").tokens = 50
+    s._bucket("t3", "market_data").tokens = 100  # больше запаса — первый кандидат
+    s._bucket("t3", "market_data").reserve = lambda max_wait: None  # но очередь квоты слишком длинная
+    a, b = await asyncio.gather(s.last_prices(["F1"], "t1"), s.last_prices(["F2"], "t3"))
+    assert (a, b) == ({"F1": _lp(1)}, {"F2": _lp(2)})
+    assert [token for token, _ in pool.calls] == ["t1"]
+
+
+def test_idle_buckets_are_evicted(monkeypatch):
+    s = _scheduler(_FakePool())
+    s._bucket("busy", "market_data").tokens = 0
+    s._bucket("idle", "market_data")
+    monkeypatch.setattr(s, "_swept", s._swept - 3600)
+    s._bucket("new", "market_data")
+    assert {s._key(t) for t in ("busy", "new")} == {k for k, _ in s._buckets}
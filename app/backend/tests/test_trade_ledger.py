@@ -0,0 +1,32 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.backend.services.trade_ledger import BUY, SELL, replay, step
+
+
+def _t(side, quantity, price, fee=0):
+    return SimpleNamespace(side=side, quantity=quantity, price=price, fee=fee)
+
+
+def test_replay_average_cost():
+    qty, avg = replay([
+        _t(BUY, 10, 100),
+        _t(BUY, 10, 130, fee=2),  # комиссия покупки входит в среднюю
+        _t(SELL, 5, 200),  # продажа среднюю не меняет
+    ])
+    assert qty == Decimal("15")
+    assert avg == Decimal("115.100000")
+
+
+def test_sell_to_zero_resets_average_and_rebuy_starts_fresh():
+    qty, avg = replay([_t(BUY, 3, 50), _t(SELL, 5, 60), _t(BUY, 2, 70)])
+    assert (qty, avg) == (Decimal("2"), Decimal("70.000000"))
+
+
+def test_incremental_steps_match_replay():
+    trades = [_t(BUY, "1.5", "10.123457"), _t(BUY, 3, "9.87"), _t(SELL, 1, 11), _t(BUY, "0.25", "12.5", "0.1")]
+    qty, avg = Decimal(0), Decimal(0)
+    for t in trades:
+        qty, avg = step(qty, avg, t.side, t.quantity, t.price, t.fee)
+    assert (qty, avg) == replay(trades)
+    assert avg == avg.quantize(Decimal("0.000001"))  # как NUMERIC(20,6) в pf.positions
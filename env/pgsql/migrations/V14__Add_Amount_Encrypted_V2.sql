@@ -0,0 +1,13 @@
+-- Миграция: компактный формат зашифрованных сумм (v2)
+-- AES-GCM над целым числом копеек, 37 байт bytea вместо ~120 байт base64 Fernet
+
+ALTER TABLE pf.budget_transactions
+  ADD COLUMN IF NOT EXISTS amount_encrypted_v2 BYTEA;
+
+COMMENT ON COLUMN pf.budget_transactions.amount_encrypted_v2 IS
+  'Зашифрованная сумма (формат v2): версия | nonce | AES-GCM(копейки int64) | tag.';
+
+-- Частичный индекс для фоновой миграции v1 -> v2 (пустеет по мере переноса)
+CREATE INDEX IF NOT EXISTS idx_budget_transactions_amount_v1_pending
+  ON pf.budget_transactions (id)
+  WHERE amount_encrypted IS NOT NULL AND amount_encrypted_v2 IS NULL;
@@ -0,0 +1,25 @@
+-- Помесячные агрегаты бюджета: суммы зашифрованы (формат v2), поэтому агрегировать в SQL нельзя,
+-- но сводки читают несколько десятков строк вместо всех транзакций периода.
+
+CREATE TABLE IF NOT EXISTS pf.budget_monthly_rollups (
+    id                  BIGSERIAL PRIMARY KEY,
+    user_id             BIGINT NOT NULL REFERENCES pf.users(id) ON DELETE CASCADE,
+    year                SMALLINT NOT NULL,
+    month               SMALLINT NOT NULL CHECK (month BETWEEN 1 AND 12),
+    type                VARCHAR(10) NOT NULL,
+    account_id          BIGINT NOT NULL REFERENCES pf.budget_accounts(id) ON DELETE CASCADE,
+    contra_account_id   BIGINT NOT NULL DEFAULT 0,
+    category_id         BIGINT NOT NULL DEFAULT 0,
+    amount_encrypted    BYTEA NOT NULL,
+    tx_count            INTEGER NOT NULL DEFAULT 0,
+    updated_at          TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT uq_budget_monthly_rollups_key
+        UNIQUE (user_id, year, month, type, account_id, contra_account_id, category_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_budget_monthly_rollups_account ON pf.budget_monthly_rollups(account_id);
+
+CREATE TABLE IF NOT EXISTS pf.budget_rollup_state (
+    user_id     BIGINT PRIMARY KEY REFERENCES pf.users(id) ON DELETE CASCADE,
+    rebuilt_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
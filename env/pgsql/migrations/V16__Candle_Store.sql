@@ -0,0 +1,30 @@
+-- Локальное хранилище свечей: исторические диапазоны отдаются из БД, из Tinkoff
+-- догружаются только пробелы. Таблица разбита по интервалам (LIST-партиции).
+
+CREATE TABLE IF NOT EXISTS pf.candles (
+    figi      TEXT             NOT NULL,
+    interval  TEXT             NOT NULL,
+    ts        TIMESTAMPTZ      NOT NULL,
+    open      DOUBLE PRECISION NOT NULL,
+    high      DOUBLE PRECISION NOT NULL,
+    low       DOUBLE PRECISION NOT NULL,
+    close     DOUBLE PRECISION NOT NULL,
+    volume    BIGINT           NOT NULL DEFAULT 0,
+    PRIMARY KEY (figi, interval, ts)
+) PARTITION BY LIST (interval);
+
+CREATE TABLE IF NOT EXISTS pf.candles_1min  PARTITION OF pf.candles FOR VALUES IN ('1min');
+CREATE TABLE IF NOT EXISTS pf.candles_5min  PARTITION OF pf.candles FOR VALUES IN ('5min');
+CREATE TABLE IF NOT EXISTS pf.candles_15min PARTITION OF pf.candles FOR VALUES IN ('15min');
+CREATE TABLE IF NOT EXISTS pf.candles_1h    PARTITION OF pf.candles FOR VALUES IN ('1h');
+CREATE TABLE IF NOT EXISTS pf.candles_1d    PARTITION OF pf.candles FOR VALUES IN ('1d');
+
+-- Загруженные диапазоны [range_start, range_end): внутри них отсутствие свечи значит
+-- «сделок не было», а не «не загружено». Соседние диапазоны сливаются при записи.
+CREATE TABLE IF NOT EXISTS pf.candle_ranges (
+    figi         TEXT        NOT NULL,
+    interval     TEXT        NOT NULL,
+    range_start  TIMESTAMPTZ NOT NULL,
+    range_end    TIMESTAMPTZ NOT NULL CHECK (range_end > range_start),
+    PRIMARY KEY (figi, interval, range_start)
+);
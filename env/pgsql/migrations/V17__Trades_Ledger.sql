@@ -0,0 +1,12 @@
+-- Сделки — источник истины для позиций: pf.positions — агрегат, пересчитываемый из
+-- pf.trades (инкрементально на каждую сделку, целиком — при правке истории).
+
+-- Позиции, заведённые до журнала, получают открывающую сделку, иначе пересчёт их обнулит.
+INSERT INTO pf.trades (portfolio_id, figi, side, quantity, price, fee, trade_at, source)
+SELECT p.portfolio_id, p.figi, 1, p.quantity, p.avg_price, 0, p.updated_at, 'opening'
+FROM pf.positions p
+WHERE p.quantity > 0
+  AND NOT EXISTS (SELECT 1 FROM pf.trades t WHERE t.portfolio_id = p.portfolio_id AND t.figi = p.figi);
+
+-- Воспроизведение истории позиции в порядке сделок.
+CREATE INDEX IF NOT EXISTS trades_position_idx ON pf.trades(portfolio_id, figi, trade_at, id);